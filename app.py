@@ -5,46 +5,360 @@
 import json
 import dateutil.parser
 import babel
-from flask import Flask, render_template, request, Response, flash, redirect, url_for, abort
+from flask import Flask, Blueprint, current_app, render_template, request, Response, flash, redirect, url_for, abort, \
+    stream_with_context, session, g, has_request_context
 from flask_moment import Moment
-from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy import SQLAlchemy, SignallingSession, get_state
 import logging
 from logging import Formatter, FileHandler
 from flask_wtf import Form
 
 from forms import *
-from datetime import datetime
+from search import SearchIndex
+from cache import LRUCache, ReadThroughCache
+from querystats import QueryStats
+from seed import SyntheticData
+import ical
+from matchmaking import MatchIndex
+from similarity import SimilarityModel
+from datetime import datetime, timedelta
 from flask_migrate import Migrate
-from sqlalchemy.orm import backref
+from sqlalchemy.orm import backref, joinedload, make_transient_to_detached, sessionmaker
+from sqlalchemy.sql.expression import Insert, Update, Delete
+from sqlalchemy import and_, or_, func, event
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.exc import IntegrityError
+from itertools import groupby, islice
+from collections import namedtuple
 import os
+import threading
+import time
+import csv
+import io
+import click
+import hmac
+import zlib
+import random
+import bisect
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
 
 # ----------------------------------------------------------------------------#
 # App Config.
 # ----------------------------------------------------------------------------#
-app = Flask(__name__)
+class RoutingSession(SignallingSession):
+    """Session that reads from the replica picked for the current request and sends everything else to the primary.
+
+    Flushes and insert , update or delete statements always use the primary , so do command line runs and any request
+    for which ``route_reads`` picked no replica.
+    """
+
+    def get_bind(self, mapper=None, clause=None):
+        if has_request_context():
+            if self._flushing or isinstance(clause, (Insert, Update, Delete)):
+                # the client reads from the primary for a while after the response , see pin_primary_after_write
+                g.wrote_to_primary = True
+            else:
+                replica = g.get('replica_bind')
+                if replica:
+                    return get_state(self.app).db.get_engine(self.app, bind=replica)
+        return super().get_bind(mapper, clause)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    def create_session(self, options):
+        return sessionmaker(class_=RoutingSession, db=self, **options)
+
+
+db = RoutingSQLAlchemy()
+migrate = Migrate()
+moment = Moment()
+
+# every controller , filter , error handler and command is registered on this blueprint , create_app mounts it on the app
+main = Blueprint('main', __name__, cli_group=None)
+
+
+# engine and pool options for the configured database , sqlite file databases are not pooled so only get a busy timeout
+def engine_options(config):
+    if config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite'):
+        return {'connect_args': {'timeout': config['SQLITE_BUSY_TIMEOUT_MS'] / 1000}}
+    options = {'pool_size': config['DB_POOL_SIZE'],
+               'max_overflow': config['DB_MAX_OVERFLOW'],
+               'pool_recycle': config['DB_POOL_RECYCLE'],
+               'pool_pre_ping': config['DB_POOL_PRE_PING'],
+               'pool_timeout': config['DB_POOL_TIMEOUT']}
+    if config['SQLALCHEMY_DATABASE_URI'].startswith('postgres') and config['DB_STATEMENT_TIMEOUT_MS']:
+        options['connect_args'] = {'options': '-c statement_timeout={}'.format(config['DB_STATEMENT_TIMEOUT_MS'])}
+    return options
+
+
+# applies the per connection settings of an engine. sqlite only enforces foreign keys , and so the ON DELETE CASCADE
+# rules , when asked to on every connection , and gets the journal and sync mode suited to a single node deployment
+def tune_engine(engine, config):
+    if engine.dialect.name != 'sqlite':
+        return
+
+    @event.listens_for(engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA foreign_keys=ON')
+        if engine.url.database not in (None, '', ':memory:'):
+            cursor.execute('PRAGMA journal_mode={}'.format(config['SQLITE_JOURNAL_MODE']))
+        cursor.execute('PRAGMA synchronous={}'.format(config['SQLITE_SYNCHRONOUS']))
+        cursor.execute('PRAGMA busy_timeout={:d}'.format(config['SQLITE_BUSY_TIMEOUT_MS']))
+        cursor.execute('PRAGMA cache_size={:d}'.format(-config['SQLITE_CACHE_SIZE_KB']))
+        cursor.close()
+
+
+# replica health , a replica further behind the primary than the lag tolerance is skipped until it catches up
+REPLICA_HEALTH_INTERVAL = 5
+replica_health = {}
+
+
+def replica_lag(engine):
+    if engine.dialect.name != 'postgresql':
+        return 0
+    with engine.connect() as connection:
+        return connection.execute("SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+                                  "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+                                  ).scalar()
+
+
+def healthy_replicas():
+    replicas = []
+    for bind in current_app.config['REPLICA_BINDS']:
+        checked_at, healthy = replica_health.get(bind, (0, True))
+        if time.monotonic() - checked_at > REPLICA_HEALTH_INTERVAL:
+            try:
+                healthy = replica_lag(db.get_engine(current_app, bind=bind)) <= current_app.config['DB_REPLICA_LAG_TOLERANCE']
+            except Exception as error:
+                current_app.logger.error('replica %s unavailable: %s', bind, error)
+                healthy = False
+            replica_health[bind] = (time.monotonic(), healthy)
+        if healthy:
+            replicas.append(bind)
+    return replicas
+
+
+# GET and HEAD requests read from a healthy replica , unless this client wrote within the lag tolerance and has to
+# read its own writes from the primary
+@main.before_app_request
+def route_reads():
+    g.replica_bind = None
+    g.pinned_to_primary = False
+    if not current_app.config['REPLICA_BINDS'] or request.method not in ('GET', 'HEAD'):
+        return
+    if session.get('_primary_until', 0) > time.time():
+        g.pinned_to_primary = True
+        return
+    replicas = healthy_replicas()
+    if replicas:
+        g.replica_bind = random.choice(replicas)
+
+
+# only requests that wrote pin the client , a POST that only reads , like a search , keeps reading from replicas
+@main.after_app_request
+def pin_primary_after_write(response):
+    if current_app.config['REPLICA_BINDS'] and g.get('wrote_to_primary') and response.status_code < 400:
+        session['_primary_until'] = time.time() + current_app.config['DB_REPLICA_LAG_TOLERANCE']
+    return response
+
 
-db = SQLAlchemy(app)
-migrate = Migrate(app, db)
-moment = Moment(app)
-app.config.from_object('config')
+# the process-wide caches and indexes only hold what the primary returned , a replica may lag behind. So a request
+# reading from a replica fills them from the primary , and a client pinned to the primary skips them , another worker
+# may still hold what it cached before the client's write
+def shared_caches_bypassed():
+    return has_request_context() and g.get('pinned_to_primary', False)
+
+
+@contextmanager
+def primary_reads():
+    """Send the reads of the block to the primary , for filling a shared cache."""
+    if not has_request_context():
+        yield
+        return
+    replica = g.get('replica_bind')
+    g.replica_bind = None
+    try:
+        yield
+    finally:
+        g.replica_bind = replica
+
+
+# times every statement an engine runs inside a request into the request's QueryStats
+def instrument_engine(engine):
+    @event.listens_for(engine, 'before_cursor_execute')
+    def start_query_timer(connection, cursor, statement, parameters, context, executemany):
+        connection.info.setdefault('query_started', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def record_query(connection, cursor, statement, parameters, context, executemany):
+        duration = time.perf_counter() - connection.info['query_started'].pop()
+        # queries a request runs on the query pool carry its stats on their connection
+        stats = connection.info.get('query_stats')
+        if stats is None and has_request_context():
+            stats = g.get('query_stats')
+        if stats is not None:
+            stats.record(statement, duration)
+
+    @event.listens_for(engine, 'handle_error')
+    def drop_query_timer(exception_context):
+        connection = exception_context.connection
+        if connection is not None and connection.info.get('query_started'):
+            connection.info['query_started'].pop()
+
+
+@main.before_app_request
+def start_query_stats():
+    if current_app.config['SQL_INSTRUMENTATION']:
+        g.query_stats = QueryStats(keep_slowest=current_app.config['SLOW_REQUEST_QUERIES'])
+        g.request_started = time.perf_counter()
+
+
+# reports the queries of the request in a Server-Timing header , and logs slow requests and statements repeated often
+# enough to be an N+1 loop with the controller that ran them. A streamed body runs its queries after the headers went
+# out , so a streamed response carries no header and its queries are logged once the body was sent
+@main.after_app_request
+def report_query_stats(response):
+    stats = g.get('query_stats')
+    if stats is None:
+        return response
+    context = {'method': request.method,
+               'path': request.full_path if request.query_string else request.path,
+               'endpoint': request.endpoint,
+               'status': response.status_code}
+    app = current_app._get_current_object()
+    started = g.request_started
+    if response.is_streamed:
+        response.call_on_close(lambda: log_query_stats(app, stats, started, context))
+    else:
+        response.headers.add('Server-Timing', stats.server_timing(time.perf_counter() - started))
+        log_query_stats(app, stats, started, context)
+    return response
+
+
+def log_query_stats(app, stats, started, context):
+    request_time = time.perf_counter() - started
+    repeated = stats.repeated_shapes(app.config['N_PLUS_ONE_THRESHOLD'])
+    slow = request_time * 1000 >= app.config['SLOW_REQUEST_MS']
+    if slow or repeated:
+        app.logger.warning('%s %s', 'slow request' if slow else 'suspected N+1', dump_json(dict(context, **{
+            'ms': round(request_time * 1000, 2),
+            'queries': stats.count,
+            'db_ms': round(stats.total_time * 1000, 2),
+            'slowest': stats.slowest_statements(),
+            'suspected_n_plus_one': repeated,
+        })))
+
+
+# hit , miss and eviction counters of the per process caches , logged after every request when the app logs debug
+# messages , e.g. with FYYUR_DEBUG=1
+@main.after_app_request
+def log_cache_stats(response):
+    if current_app.logger.isEnabledFor(logging.DEBUG):
+        current_app.logger.debug('cache stats %s', dump_json({
+            'detail_pages': detail_page_cache.stats(),
+            'calendars': calendar_validators.stats(),
+            'venue_records': venue_records.stats(),
+            'artist_records': artist_records.stats(),
+        }))
+    return response
+
+
+# independent read queries of one request run at the same time , each on its own pooled connection of the engine the
+# request reads from. create_app starts the pool for every database but an in-memory sqlite one , on sqlite the reads
+# overlap through WAL and the GIL released while a statement runs
+query_pool = None
+
+
+def fetch_rows(engine, statement, stats):
+    with engine.connect() as connection:
+        connection.info['query_stats'] = stats
+        try:
+            return connection.execute(statement).fetchall()
+        finally:
+            connection.info.pop('query_stats', None)
+
+
+def fetch_concurrently(*queries):
+    """Start the given column queries and return a future of the rows of each.
+
+    Without a query pool the queries run one after the other in the request's session before this returns.
+    """
+    futures = []
+    if query_pool is None:
+        for query in queries:
+            future = Future()
+            future.set_result(query.all())
+            futures.append(future)
+        return futures
+    engine = db.session.get_bind()
+    stats = g.get('query_stats') if has_request_context() else None
+    return [query_pool.submit(fetch_rows, engine, query.statement, stats) for query in queries]
+
+
+# effective pool settings of an engine and , when the database can be reached , how many workers it can serve
+def pool_report(engine, config):
+    report = {'dialect': engine.dialect.name, 'pool': type(engine.pool).__name__, 'status': engine.pool.status()}
+    options = engine_options(config)
+    report.update((key, value) for key, value in options.items() if key != 'connect_args')
+    if engine.dialect.name == 'postgresql':
+        report['statement_timeout_ms'] = config['DB_STATEMENT_TIMEOUT_MS']
+    with engine.connect() as connection:
+        connection.execute('SELECT 1')
+        if engine.dialect.name == 'postgresql':
+            max_connections = int(connection.execute('SHOW max_connections').scalar())
+            per_worker = options['pool_size'] + options['max_overflow']
+            report['max_connections'] = max_connections
+            report['max_workers'] = max_connections // per_worker
+    return report
 
-# TODO: connect to a local postgresql database
 
 # ----------------------------------------------------------------------------#
 # Models.
 # ----------------------------------------------------------------------------#
 
 # Many to many relationship between venues and genres
-venue_genres = db.Table('venue_genres', db.Column('venue_id', db.ForeignKey('Venue.id'), primary_key=True)
-                        , db.Column('genre_id', db.ForeignKey('Genre.id'), primary_key=True))
+venue_genres = db.Table('venue_genres', db.Column('venue_id', db.ForeignKey('Venue.id', ondelete='CASCADE'), primary_key=True)
+                        , db.Column('genre_id', db.ForeignKey('Genre.id', ondelete='CASCADE'), primary_key=True)
+                        , db.Index('ix_venue_genres_genre_id', 'genre_id'))
 
 # Many to many relationship between asrtists and genres
-artist_genres = db.Table('artist_genres', db.Column('artist_id', db.ForeignKey('Artist.id'), primary_key=True)
-                         , db.Column('genre_id', db.ForeignKey('Genre.id'), primary_key=True))
+artist_genres = db.Table('artist_genres', db.Column('artist_id', db.ForeignKey('Artist.id', ondelete='CASCADE'), primary_key=True)
+                         , db.Column('genre_id', db.ForeignKey('Genre.id', ondelete='CASCADE'), primary_key=True)
+                         , db.Index('ix_artist_genres_genre_id', 'genre_id'))
+
+# Precomputed similar venues and similar artists , rewritten by flask refresh-similar and read in rank order
+similar_venues = db.Table('similar_venues', db.Column('venue_id', db.ForeignKey('Venue.id', ondelete='CASCADE'), primary_key=True)
+                          , db.Column('rank', db.Integer, primary_key=True)
+                          , db.Column('similar_id', db.ForeignKey('Venue.id', ondelete='CASCADE'), nullable=False)
+                          , db.Column('score', db.Float, nullable=False)
+                          , db.Column('computed_at', db.DateTime, nullable=False)
+                          , db.Index('ix_similar_venues_similar_id', 'similar_id'))
+
+similar_artists = db.Table('similar_artists', db.Column('artist_id', db.ForeignKey('Artist.id', ondelete='CASCADE'), primary_key=True)
+                           , db.Column('rank', db.Integer, primary_key=True)
+                           , db.Column('similar_id', db.ForeignKey('Artist.id', ondelete='CASCADE'), nullable=False)
+                           , db.Column('score', db.Float, nullable=False)
+                           , db.Column('computed_at', db.DateTime, nullable=False)
+                           , db.Index('ix_similar_artists_similar_id', 'similar_id'))
+
+# venues and artists whose similar lists a delete made stale without touching their rows , the ones listing a deleted
+# row and the ones that lost their shows with it , picked up and cleared by the next flask refresh-similar
+similar_stale = db.Table('similar_stale', db.Column('id', db.Integer, primary_key=True)
+                         , db.Column('kind', db.String(10), nullable=False)
+                         , db.Column('entity_id', db.Integer, nullable=False)
+                         , db.Column('marked_at', db.DateTime, nullable=False)
+                         , db.Index('ix_similar_stale_kind', 'kind'))
 
 
 class Venue(db.Model):
     __tablename__ = 'Venue'
+    __table_args__ = (
+        db.Index('ix_Venue_state_city', 'state', 'city'),
+        db.Index('ix_Venue_updated_at', 'updated_at'),
+        db.Index('ix_Venue_next_show_at', 'next_show_at'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String, nullable=False)
@@ -57,8 +371,16 @@ class Venue(db.Model):
     website = db.Column(db.String(120), nullable=True)
     seeking_talent = db.Column(db.Boolean(), default=False, nullable=True)
     seeking_description = db.Column(db.String(500), nullable=True)
-    # many to many relationship
-    genres = db.relationship('Genre', secondary=venue_genres, backref=db.backref('venues', lazy=True))
+    # last time the row changed , incremental exports pick up rows changed since a point in time
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow,
+                           server_default=db.text('CURRENT_TIMESTAMP'))
+    # denormalized show counters , kept current by the show writes and rolled over by flask roll-shows once next_show_at passed
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    next_show_at = db.Column(db.DateTime, nullable=True)
+    # many to many relationship , ordered so every way of loading it lists the genres alike
+    genres = db.relationship('Genre', secondary=venue_genres, passive_deletes=True, order_by='Genre.id',
+                             backref=db.backref('venues', lazy=True, passive_deletes=True))
 
     def __repr__(self):
         return self.name
@@ -68,6 +390,11 @@ class Venue(db.Model):
 
 class Artist(db.Model):
     __tablename__ = 'Artist'
+    __table_args__ = (
+        db.Index('ix_Artist_name', 'name'),
+        db.Index('ix_Artist_updated_at', 'updated_at'),
+        db.Index('ix_Artist_next_show_at', 'next_show_at'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String, nullable=False)
@@ -79,13 +406,31 @@ class Artist(db.Model):
     website = db.Column(db.String(120), nullable=True)
     seeking_venue = db.Column(db.Boolean(), default=False, nullable=False)
     seeking_description = db.Column(db.String(500), nullable=True)
-    # many to many relationship
-    genres = db.relationship('Genre', secondary=artist_genres, backref=db.backref('artists', lazy=True))
+    # last time the row changed , incremental exports pick up rows changed since a point in time
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow,
+                           server_default=db.text('CURRENT_TIMESTAMP'))
+    # denormalized show counters , kept current by the show writes and rolled over by flask roll-shows once next_show_at passed
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    next_show_at = db.Column(db.DateTime, nullable=True)
+    # many to many relationship , ordered so every way of loading it lists the genres alike
+    genres = db.relationship('Genre', secondary=artist_genres, passive_deletes=True, order_by='Genre.id',
+                             backref=db.backref('artists', lazy=True, passive_deletes=True))
 
     def __repr__(self):
         return self.name
 
 
+# trigram indexes serve name ilike '%term%' on postgres only , other databases would get a plain btree on name
+@event.listens_for(Venue.__table__, 'after_create')
+@event.listens_for(Artist.__table__, 'after_create')
+def create_name_trigram_index(table, connection, **kw):
+    if connection.dialect.name != 'postgresql':
+        return
+    connection.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    connection.execute('CREATE INDEX "ix_{0}_name_trgm" ON "{0}" USING gin (name gin_trgm_ops)'.format(table.name))
+
+
 class Genre(db.Model):
     __tablename__ = 'Genre'
     id = db.Column(db.Integer, primary_key=True)
@@ -97,12 +442,417 @@ class Genre(db.Model):
 
 class Show(db.Model):
     __tablename__ = 'Show'
+    __table_args__ = (
+        db.Index('ix_Show_venue_id_start_time', 'venue_id', 'start_time'),
+        db.Index('ix_Show_artist_id_start_time', 'artist_id', 'start_time'),
+        db.Index('ix_Show_start_time', 'start_time'),
+        db.Index('ix_Show_updated_at', 'updated_at'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     artist_id = db.Column(db.Integer, db.ForeignKey('Artist.id', ondelete='CASCADE'), nullable=False)
     venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id', ondelete='CASCADE'), nullable=False)
     start_time = db.Column(db.DateTime, nullable=False)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow,
+                           server_default=db.text('CURRENT_TIMESTAMP'))
+    # shows are removed by the database through the ON DELETE CASCADE foreign keys , never loaded to be deleted
+    artist = db.relationship('Artist', backref=db.backref('shows', lazy=True, passive_deletes='all'))
+    venue = db.relationship('Venue', backref=db.backref('shows', lazy=True, passive_deletes='all'))
+
+
+
+
+# ----------------------------------------------------------------------------#
+# Genre catalog.
+# ----------------------------------------------------------------------------#
+
+DEFAULT_GENRES = ['Alternative', 'Blues', 'Classical', 'Country', 'Electronic', 'Folk', 'Funk', 'Hip-Hop',
+                  'Heavy Metal', 'Instrumental', 'Jazz', 'Musical Theatre', 'Pop', 'Punk', 'R&B', 'Reggae',
+                  'Rock n Roll', 'Soul', 'Other']
+
+
+class GenreCatalog:
+    """Process-wide copy of the Genre table.
+
+    Genres are loaded once , seeding the default list into an empty table , and kept as an id to name map plus the
+    (id, name) choices the genre select fields use. Call ``invalidate`` after changing the Genre table.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.names = None
+        self.choices = None
+
+    def _load(self):
+        with self.lock:
+            if self.names is not None:
+                return
+            # the catalog is shared by every request of the process , so it is read from the primary
+            with primary_reads():
+                genres = db.session.query(Genre.id, Genre.name).order_by(Genre.id).all()
+                if not genres:
+                    db.session.add_all([Genre(name=genre) for genre in DEFAULT_GENRES])
+                    db.session.commit()
+                    genres = db.session.query(Genre.id, Genre.name).order_by(Genre.id).all()
+            self.choices = [(genre_id, name) for genre_id, name in genres]
+            self.names = dict(self.choices)
+
+    def invalidate(self):
+        with self.lock:
+            self.names = None
+            self.choices = None
+
+    def get_choices(self):
+        self._load()
+        return self.choices
+
+    def resolve(self, genre_ids):
+        """Return session-attached Genre instances for the submitted ids without querying the Genre table."""
+        self._load()
+        genre_ids = [int(genre_id) for genre_id in genre_ids]
+        if any(genre_id not in self.names for genre_id in genre_ids):
+            # a genre added by another process , reload once before dropping unknown ids
+            self.invalidate()
+            self._load()
+        genres = []
+        for genre_id in genre_ids:
+            if genre_id not in self.names:
+                continue
+            genre = Genre(id=genre_id, name=self.names[genre_id])
+            make_transient_to_detached(genre)
+            genres.append(db.session.merge(genre, load=False))
+        return genres
 
 
+genre_catalog = GenreCatalog()
+
+
+# ----------------------------------------------------------------------------#
+# Entity records.
+# ----------------------------------------------------------------------------#
+
+# lightweight copy of the venue and artist columns that listings render , served from a shared read-through cache
+EntityRecord = namedtuple('EntityRecord', ['id', 'name', 'image_link', 'city', 'state'])
+
+
+def load_records(model, model_ids):
+    with primary_reads():
+        rows = db.session.query(model.id, model.name, model.image_link, model.city, model.state
+                                ).filter(model.id.in_(model_ids)).all()
+    return {row.id: EntityRecord(*row) for row in rows}
+
+
+def entity_record(entity):
+    return EntityRecord(entity.id, entity.name, entity.image_link, entity.city, entity.state)
+
+
+venue_records = ReadThroughCache(lambda venue_ids: load_records(Venue, venue_ids))
+artist_records = ReadThroughCache(lambda artist_ids: load_records(Artist, artist_ids))
+
+
+# ----------------------------------------------------------------------------#
+# Show counters.
+# ----------------------------------------------------------------------------#
+
+# rows recomputed per statement by the bulk counter refreshes
+SHOW_COUNTER_BATCH_SIZE = 10000
+
+
+def show_key(model):
+    return Show.venue_id if model is Venue else Show.artist_id
+
+
+# counts a new show into its venue and artist with two single row updates in the caller's transaction. The counters are
+# derived data , so their updates keep updated_at and do not make the row look changed to incremental exports
+def count_new_show(venue_id, artist_id, start_time):
+    for model, model_id in ((Venue, venue_id), (Artist, artist_id)):
+        if start_time >= datetime.utcnow():
+            values = {model.upcoming_shows_count: model.upcoming_shows_count + 1,
+                      model.next_show_at: db.case([(or_(model.next_show_at.is_(None), model.next_show_at > start_time),
+                                                    start_time)], else_=model.next_show_at)}
+        else:
+            values = {model.past_shows_count: model.past_shows_count + 1}
+        values[model.updated_at] = model.updated_at
+        model.query.filter(model.id == model_id).update(values, synchronize_session=False)
+
+
+def refresh_show_counters(model, model_ids=None):
+    """Recompute the show counters of the given venues or artists , or of all of them , from the Show table.
+
+    Counting runs as correlated subqueries of one UPDATE per batch of ids , each served by the (entity id, start_time)
+    index of Show. The caller commits.
+    """
+    current_time = datetime.utcnow()
+    key = show_key(model)
+    shows = lambda *criteria: db.session.query(*criteria).filter(key == model.id).correlate(model)
+    values = {model.upcoming_shows_count: shows(func.count(Show.id)).filter(Show.start_time >= current_time).as_scalar(),
+              model.past_shows_count: shows(func.count(Show.id)).filter(Show.start_time < current_time).as_scalar(),
+              model.next_show_at: shows(func.min(Show.start_time)).filter(Show.start_time >= current_time).as_scalar(),
+              model.updated_at: model.updated_at}
+    refreshed = 0
+    if model_ids is not None:
+        model_ids = sorted(set(model_ids))
+        for start in range(0, len(model_ids), SHOW_COUNTER_BATCH_SIZE):
+            batch = model_ids[start:start + SHOW_COUNTER_BATCH_SIZE]
+            refreshed += model.query.filter(model.id.in_(batch)).update(values, synchronize_session=False)
+        return refreshed
+    first_id, last_id = db.session.query(func.min(model.id), func.max(model.id)).one()
+    if first_id is None:
+        return 0
+    for start in range(first_id, last_id + 1, SHOW_COUNTER_BATCH_SIZE):
+        refreshed += model.query.filter(model.id >= start, model.id < start + SHOW_COUNTER_BATCH_SIZE
+                                        ).update(values, synchronize_session=False)
+    return refreshed
+
+
+# moves shows that started since the last run from the upcoming to the past counters , only the venues and artists
+# whose next show has passed are recomputed
+def roll_over_shows():
+    current_time = datetime.utcnow()
+    rolled = {}
+    for model in (Venue, Artist):
+        model_ids = [model_id for model_id, in db.session.query(model.id).filter(model.next_show_at <= current_time)]
+        rolled[model.__tablename__] = refresh_show_counters(model, model_ids)
+    return rolled
+
+
+# ----------------------------------------------------------------------------#
+# Bookings.
+# ----------------------------------------------------------------------------#
+
+# every show holds its venue and artist for SHOW_DURATION_MINUTES from its start. With one duration for all shows , a
+# show overlaps [start, end) only when it starts after start - duration and before end , so every overlap and
+# availability lookup is a range scan of the (venue_id, start_time) or (artist_id, start_time) index of Show.
+# On postgres the exclusion constraints of the Show table also reject overlapping bookings written concurrently
+SHOW_SLOT_CONSTRAINTS = {'ex_Show_venue_slot': 'venue_id', 'ex_Show_artist_slot': 'artist_id'}
+EXCLUSION_VIOLATION = '23P01'
+
+
+def show_duration():
+    return timedelta(minutes=current_app.config['SHOW_DURATION_MINUTES'])
+
+
+def overlapping_shows(key, entity_id, start, end):
+    return Show.query.filter(key == entity_id, Show.start_time > start - show_duration(), Show.start_time < end)
+
+
+def booked_starts(key, entity_ids, start, end):
+    """Sorted start times of the shows of every id in ``entity_ids`` overlapping [start, end) , by id."""
+    starts = {entity_id: [] for entity_id in entity_ids}
+    if starts:
+        query = db.session.query(key, Show.start_time).filter(
+            key.in_(starts), Show.start_time > start - show_duration(), Show.start_time < end)
+        for entity_id, start_time in query.order_by(key, Show.start_time):
+            starts[entity_id].append(start_time)
+    return starts
+
+
+def slot_taken(starts, start_time):
+    # starts is sorted , only the neighbours around start_time can be closer than one show duration
+    position = bisect.bisect_left(starts, start_time)
+    duration = show_duration()
+    return (position < len(starts) and starts[position] - start_time < duration) or \
+        (position > 0 and start_time - starts[position - 1] < duration)
+
+
+def booking_conflict(venue_id, artist_id, start_time):
+    """Return ``'venue'`` or ``'artist'`` when either is already booked during a show starting at ``start_time``."""
+    end = start_time + show_duration()
+    for name, key, entity_id in (('venue', Show.venue_id, venue_id), ('artist', Show.artist_id, artist_id)):
+        if db.session.query(overlapping_shows(key, entity_id, start_time, end).exists()).scalar():
+            return name
+    return None
+
+
+@event.listens_for(Show.__table__, 'after_create')
+def create_show_slot_constraints(table, connection, **kw):
+    if connection.dialect.name != 'postgresql':
+        return
+    connection.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+    for name, key in SHOW_SLOT_CONSTRAINTS.items():
+        connection.execute('ALTER TABLE "Show" ADD CONSTRAINT "{}" EXCLUDE USING gist ({} WITH =, '
+                           "tsrange(start_time, start_time + interval '{:d} minutes') WITH &&)".format(
+                               name, key, current_app.config['SHOW_DURATION_MINUTES']))
+
+
+# ----------------------------------------------------------------------------#
+# Matchmaking.
+# ----------------------------------------------------------------------------#
+
+# reloads of an index run on a thread of their own , inside the app context of the request that found the index stale
+def spawn_in_app_context(target):
+    app = current_app._get_current_object()
+
+    def run():
+        with app.app_context():
+            target()
+
+    threading.Thread(target=run, name='index-reload', daemon=True).start()
+
+
+# (id, city, state, genre ids) of every venue seeking talent or artist seeking a venue , the rows the match index holds
+def load_match_profiles(model, genres_table, key, seeking):
+    with primary_reads():
+        genre_ids = {}
+        for entity_id, genre_id in db.session.query(key, genres_table.c.genre_id).join(model, model.id == key).filter(seeking):
+            genre_ids.setdefault(entity_id, []).append(genre_id)
+        for entity_id, city, state in db.session.query(model.id, model.city, model.state).filter(seeking).yield_per(1000):
+            yield entity_id, city, state, genre_ids.get(entity_id, [])
+
+
+match_index = MatchIndex(
+    lambda: load_match_profiles(Artist, artist_genres, artist_genres.c.artist_id, Artist.seeking_venue.is_(True)),
+    lambda: load_match_profiles(Venue, venue_genres, venue_genres.c.venue_id, Venue.seeking_talent.is_(True)),
+    spawn=spawn_in_app_context)
+
+
+# ----------------------------------------------------------------------------#
+# Similar venues and artists.
+# ----------------------------------------------------------------------------#
+
+# model , table of precomputed neighbours , genre links and the show columns of the entity and of its counterpart
+SIMILAR_TABLES = {'venue': (Venue, similar_venues, venue_genres, Show.venue_id, Show.artist_id),
+                  'artist': (Artist, similar_artists, artist_genres, Show.artist_id, Show.venue_id)}
+
+
+def similarity_model(kind):
+    model, _, genres_table, entity_key, counterpart_key = SIMILAR_TABLES[kind]
+    genres = {entity_id: [] for entity_id, in db.session.query(model.id).yield_per(10000)}
+    for entity_id, genre_id in db.session.query(genres_table.c[kind + '_id'], genres_table.c.genre_id).yield_per(10000):
+        genres.setdefault(entity_id, []).append(genre_id)
+    bookings = db.session.query(entity_key, counterpart_key).distinct().yield_per(10000)
+    return SimilarityModel(genres, bookings)
+
+
+# entities edited or booked since the last run
+def changed_entities(kind, since):
+    model, _, _, entity_key, _ = SIMILAR_TABLES[kind]
+    changed = {entity_id for entity_id, in db.session.query(model.id).filter(model.updated_at >= since)}
+    changed |= {entity_id for entity_id, in db.session.query(entity_key).filter(Show.updated_at >= since).distinct()}
+    return changed
+
+
+def mark_similar_stale(kind, entity_ids):
+    marked_at = datetime.utcnow()
+    bulk_insert(similar_stale, [{'kind': kind, 'entity_id': entity_id, 'marked_at': marked_at}
+                                for entity_id in sorted(set(entity_ids))])
+
+
+# entities whose lists may be wrong besides the changed ones: those listing a changed entity with its old genres and
+# bookings , and those a changed entity now scores at least as high as the last neighbour they list , so a new or
+# edited entity shows up in the lists it belongs to
+def stale_lists(kind, model, changed, limit):
+    _, table, _, _, _ = SIMILAR_TABLES[kind]
+    key = table.c[kind + '_id']
+    changed = sorted(changed)
+    stale = set()
+    for start in range(0, len(changed), 500):
+        stale |= {entity_id for entity_id, in db.session.query(key).filter(
+            table.c.similar_id.in_(changed[start:start + 500])).distinct()}
+    last_scores = {entity_id: lowest for entity_id, lowest in db.session.query(key, func.min(table.c.score)).group_by(
+        key).having(func.count() >= limit).yield_per(10000)}
+    return stale | set(model.listers(changed, last_scores))
+
+
+def refresh_similar(kind, full=False, batch_size=1000):
+    """Rewrite the neighbours of the venues or artists changed since the last run and the lists they may have made
+    stale , or of all of them when ``full``.
+
+    Every rewritten row is stamped with the start of the run , the latest stamp is where the next run picks up. The
+    caller commits , so a failed run leaves the previous neighbours and stamp in place.
+    """
+    _, table, _, _, _ = SIMILAR_TABLES[kind]
+    key = table.c[kind + '_id']
+    started = datetime.utcnow()
+    since = None if full else db.session.query(func.max(table.c.computed_at)).scalar()
+    # marks of the deletes , the ones read here are cleared with this run's results
+    marks = db.session.query(similar_stale.c.id, similar_stale.c.entity_id).filter(similar_stale.c.kind == kind).all()
+    changed = None if since is None else changed_entities(kind, since) | {entity_id for _, entity_id in marks}
+    if changed == set():
+        return 0
+    model = similarity_model(kind)
+    limit = current_app.config['SIMILAR_LIMIT']
+    if changed is None:
+        entity_ids = model.ids.tolist()
+        db.session.execute(table.delete())
+    else:
+        entity_ids = sorted(changed | stale_lists(kind, model, changed, limit))
+    for start in range(0, len(entity_ids), batch_size):
+        batch = entity_ids[start:start + batch_size]
+        if changed is not None:
+            db.session.execute(table.delete().where(key.in_(batch)))
+        bulk_insert(table, [{kind + '_id': entity_id, 'rank': rank, 'similar_id': similar_id, 'score': score,
+                             'computed_at': started}
+                            for entity_id in batch
+                            for rank, (similar_id, score) in enumerate(model.neighbours(entity_id, limit), start=1)])
+    mark_ids = sorted(mark_id for mark_id, _ in marks)
+    for start in range(0, len(mark_ids), batch_size):
+        db.session.execute(similar_stale.delete().where(similar_stale.c.id.in_(mark_ids[start:start + batch_size])))
+    return len(entity_ids)
+
+
+# ----------------------------------------------------------------------------#
+# Home feed.
+# ----------------------------------------------------------------------------#
+
+class HomeFeed:
+    """Process-wide snapshot of what the home page lists , the newest venues and artists and the next upcoming shows.
+
+    Requests are served from the snapshot without a query. It is rebuilt by the first request after it expired , ``ttl``
+    seconds after it was built or when its first show starts , or after ``invalidate`` was called by a write in this
+    process. While one request rebuilds , the others keep serving the previous snapshot.
+    """
+
+    def __init__(self, size=6, ttl=60):
+        self.size = size
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.snapshot = None
+        self.expires_at = 0
+
+    def _build(self):
+        with primary_reads():
+            return self._query()
+
+    def _query(self):
+        venues, artists, shows = fetch_concurrently(
+            db.session.query(Venue.id, Venue.name, Venue.image_link, Venue.city, Venue.state
+                             ).order_by(Venue.id.desc()).limit(self.size),
+            db.session.query(Artist.id, Artist.name, Artist.image_link, Artist.city, Artist.state
+                             ).order_by(Artist.id.desc()).limit(self.size),
+            show_listing_query().filter(Show.start_time >= datetime.utcnow()
+                                        ).order_by(Show.start_time, Show.id).limit(self.size))
+        venues = [EntityRecord(*row) for row in venues.result()]
+        artists = [EntityRecord(*row) for row in artists.result()]
+        shows = shows.result()
+        expires_at = time.time() + self.ttl
+        if shows:
+            # the first show moves to the past when it starts
+            expires_at = min(expires_at, time.time() + (shows[0].start_time - datetime.utcnow()).total_seconds())
+        return {'venues': venues, 'artists': artists, 'shows': shows}, expires_at
+
+    def get(self):
+        if shared_caches_bypassed():
+            return self._build()[0]
+        if self.snapshot is not None and self.expires_at > time.time():
+            return self.snapshot
+        if not self.lock.acquire(blocking=self.snapshot is None):
+            return self.snapshot
+        try:
+            if self.snapshot is None or self.expires_at <= time.time():
+                self.snapshot, self.expires_at = self._build()
+            return self.snapshot
+        finally:
+            self.lock.release()
+
+    def invalidate(self):
+        self.expires_at = 0
+
+    def clear(self):
+        self.snapshot = None
+        self.expires_at = 0
+
+
+home_feed = HomeFeed()
 
 
 # ----------------------------------------------------------------------------#
@@ -118,140 +868,400 @@ def format_datetime(value, format='medium'):
     return date.strftime(format)
 
 
-app.jinja_env.filters['datetime'] = format_datetime
+main.add_app_template_filter(format_datetime, 'datetime')
+
+
+# keyset cursor of a show row , encodes the (start_time, id) position the next page starts after
+def format_show_cursor(show):
+    return show.start_time.isoformat() + '_' + str(show.id)
+
+
+def parse_show_cursor(cursor):
+    start_time, show_id = cursor.rsplit('_', 1)
+    return datetime.fromisoformat(start_time), int(show_id)
+
+
+main.add_app_template_filter(format_show_cursor, 'show_cursor')
+
+
+# renders a template as a generator so the response body is sent while the context is still being iterated
+def stream_template(template_name, **context):
+    current_app.update_template_context(context)
+    template = current_app.jinja_env.get_template(template_name)
+    stream = template.stream(context)
+    stream.enable_buffering(current_app.config.get('STREAM_BUFFER_SIZE', 5))
+    return stream
 
 
 # ----------------------------------------------------------------------------#
 # Controllers.
 # ----------------------------------------------------------------------------#
 
-# search function , used to both artist search controller and venue search controller , it queries either table to find a match between search term and name column
+# search index loaders , stream every venue or artist with the city , state and genre names that are searchable besides the name
+def load_search_documents(model, genres_table, key):
+    with primary_reads():
+        genre_names = {}
+        for model_id, genre_name in db.session.query(key, Genre.name).join(Genre, genres_table.c.genre_id == Genre.id):
+            genre_names.setdefault(model_id, []).append(genre_name)
+        rows = db.session.query(model.id, model.name, model.city, model.state).yield_per(1000)
+        for model_id, name, city, state in rows:
+            yield model_id, name, [city, state] + genre_names.get(model_id, [])
+
+
+# search index syncs , the venues or artists edited since ``since`` and the ids of all of them , deleted ones drop out
+def load_search_changes(model, genres_table, key, since):
+    with primary_reads():
+        changed = model.updated_at >= since
+        genre_names = {}
+        genre_rows = db.session.query(key, Genre.name).join(Genre, genres_table.c.genre_id == Genre.id).join(
+            model, model.id == key).filter(changed)
+        for model_id, genre_name in genre_rows:
+            genre_names.setdefault(model_id, []).append(genre_name)
+        rows = db.session.query(model.id, model.name, model.city, model.state).filter(changed)
+        documents = [(model_id, name, [city, state] + genre_names.get(model_id, []))
+                     for model_id, name, city, state in rows]
+        return documents, [model_id for model_id, in db.session.query(model.id).yield_per(10000)]
+
+
+venue_search_index = SearchIndex(
+    lambda: load_search_documents(Venue, venue_genres, venue_genres.c.venue_id),
+    lambda since: load_search_changes(Venue, venue_genres, venue_genres.c.venue_id, since),
+    spawn=spawn_in_app_context)
+artist_search_index = SearchIndex(
+    lambda: load_search_documents(Artist, artist_genres, artist_genres.c.artist_id),
+    lambda since: load_search_changes(Artist, artist_genres, artist_genres.c.artist_id, since),
+    spawn=spawn_in_app_context)
+
+
+# keeps the search index in step with a venue or artist that was just created or edited
+def index_model(search_index, entity):
+    search_index.add(entity.id, entity.name, [entity.city, entity.state] + [genre.name for genre in entity.genres])
+
+
+# search function , used to both artist search controller and venue search controller , it looks the search term up in the
+# in-process index of either table instead of scanning the name column , and returns the best ranked matches. While the
+# index of this worker is still loading , names are matched in the database instead
 def model_search(form, model):
     search_term = form.get('search_term', '')
-    search_pattern = "%" + search_term + "%"
-    if model.lower() == 'venue':
-        search_query = db.session.query(Venue).filter(Venue.name.ilike(search_pattern))
-    else:
-        search_query = db.session.query(Artist).filter(Artist.name.ilike(search_pattern))
-    results = search_query.all()
+    entity, search_index = (Venue, venue_search_index) if model.lower() == 'venue' else (Artist, artist_search_index)
+    limit = current_app.config['SEARCH_RESULTS_LIMIT']
+    found = search_index.search(search_term, limit=limit)
+    if found is None:
+        search_query = db.session.query(entity.id, entity.name).filter(
+            entity.name.ilike('%' + ' '.join(search_term.split()) + '%'))
+        results = [{'id': model_id, 'name': name}
+                   for model_id, name in search_query.order_by(func.lower(entity.name), entity.id).limit(limit)]
+        found = search_query.count(), results
+    count, results = found
     response = {}
-    response['count'] = search_query.count()
+    response['count'] = count
     response['data'] = results
     return response
 
 
-@app.route('/')
-def index():
-    recently_added_venues = Venue.query.order_by(Venue.id.desc()).limit(6)
-    recently_added_artists = Artist.query.order_by(Artist.id.desc()).limit(6)
+# show listing query , joins every show with its artist and venue in a single round trip and only selects the columns the show tiles need
+def show_listing_query():
+    return db.session.query(Show.id,
+                            Show.start_time,
+                            Show.venue_id,
+                            Venue.name.label('venue_name'),
+                            Show.artist_id,
+                            Artist.name.label('artist_name'),
+                            Artist.image_link.label('artist_image_link')
+                            ).join(Show.artist).join(Show.venue)
+
+
+# keyset filter of the show listings , keeps the shows ordered after the (start_time, id) cursor passed as ?after=
+def filter_after_show_cursor(query):
+    after = request.args.get('after')
+    if not after:
+        return query
+    try:
+        after_time, after_id = parse_show_cursor(after)
+    except (ValueError, OverflowError):
+        abort(400)
+    return query.filter(or_(Show.start_time > after_time,
+                            and_(Show.start_time == after_time, Show.id > after_id)))
+
+
+# filters of the show listings , every one narrows an indexed scan: ?from= and ?to= the start_time range , ?state= and
+# ?city= the (state, city) index of Venue , ?genre= the genre_id index of the links of the artists playing the shows
+SHOW_FILTERS = ('from', 'to', 'state', 'city', 'genre')
+
+
+def show_filters():
+    return {name: request.args[name] for name in SHOW_FILTERS if request.args.get(name)}
+
+
+def filter_show_listing(query, filters):
+    try:
+        if 'from' in filters:
+            query = query.filter(Show.start_time >= datetime.fromisoformat(filters['from']))
+        if 'to' in filters:
+            query = query.filter(Show.start_time < datetime.fromisoformat(filters['to']))
+    except ValueError:
+        abort(400)
+    if 'state' in filters:
+        query = query.filter(Venue.state == filters['state'])
+    if 'city' in filters:
+        query = query.filter(Venue.city == filters['city'])
+    if 'genre' in filters:
+        genre_ids = [genre_id for genre_id, name in genre_catalog.get_choices() if name.lower() == filters['genre'].lower()]
+        if not genre_ids:
+            abort(400)
+        query = query.filter(Show.artist_id.in_(
+            db.session.query(artist_genres.c.artist_id).filter(artist_genres.c.genre_id == genre_ids[0])))
+    return query
+
+
+# detail function , used by both venue and artist detail controllers , it loads the entity , its genres , all of its shows
+# joined with the other side of the booking and its precomputed similar venues or artists
+def model_detail(model, model_id):
+    if model.lower() == 'venue':
+        entity, counterpart, counterpart_prefix = Venue, Artist, 'artist'
+        entity_key, counterpart_key = Show.venue_id, Show.artist_id
+    else:
+        entity, counterpart, counterpart_prefix = Artist, Venue, 'venue'
+        entity_key, counterpart_key = Show.artist_id, Show.venue_id
+
     current_time = datetime.utcnow()
-    upcoming_shows_query = Show.query.filter(Show.start_time >= current_time).order_by(Show.start_time).limit(6)
-    upcoming_shows = []
-    for show in upcoming_shows_query:
-        upcoming_shows.append({"venue_id": show.venue_id,
-                     "venue_name": Venue.query.get(show.venue_id).name,
-                     "artist_id": show.artist_id,
-                     "artist_name": Artist.query.get(show.artist_id).name,
-                     "artist_image_link": Artist.query.get(show.artist_id).image_link,
-                     "start_time": show.start_time
-                     })
-    return render_template('pages/home.html' , venues=recently_added_venues , artists=recently_added_artists,shows=shows)
+    similar_table = SIMILAR_TABLES[model.lower()][1]
+    similar_query = db.session.query(entity.id, entity.name, entity.image_link, similar_table.c.score
+                                     ).join(similar_table, similar_table.c.similar_id == entity.id
+                                     ).filter(similar_table.c[model.lower() + '_id'] == model_id
+                                     ).order_by(similar_table.c.rank)
+    if query_pool is None:
+        # the entity , its genres and its shows load in a single query , the similar venues or artists in another
+        rows = db.session.query(entity,
+                                Show.id,
+                                Show.start_time,
+                                counterpart.id,
+                                counterpart.name,
+                                counterpart.image_link,
+                                (Show.start_time >= current_time).label('upcoming')
+                                ).outerjoin(Show, entity_key == entity.id
+                                ).outerjoin(counterpart, counterpart_key == counterpart.id
+                                ).options(joinedload(entity.genres)
+                                ).filter(entity.id == model_id
+                                ).order_by(Show.start_time, Show.id).all()
+        if not rows:
+            return None
+        entity_query = rows[0][0]
+        upcoming_shows = []
+        past_shows = []
+        # the genres join repeats every show once per genre , so shows are de-duplicated by id
+        seen_shows = set()
+        for _, show_id, start_time, counterpart_id, counterpart_name, counterpart_image_link, upcoming in rows:
+            if show_id is None or show_id in seen_shows:
+                continue
+            seen_shows.add(show_id)
+            show = {counterpart_prefix + '_id': counterpart_id,
+                    counterpart_prefix + '_name': counterpart_name,
+                    counterpart_prefix + '_image_link': counterpart_image_link,
+                    'start_time': start_time}
+            (upcoming_shows if upcoming else past_shows).append(show)
+        similar = similar_query.all()
+    else:
+        entity_query = entity.query.options(joinedload(entity.genres)).filter(entity.id == model_id).one_or_none()
+        if entity_query is None:
+            return None
+        shows_query = db.session.query(counterpart.id.label(counterpart_prefix + '_id'),
+                                       counterpart.name.label(counterpart_prefix + '_name'),
+                                       counterpart.image_link.label(counterpart_prefix + '_image_link'),
+                                       Show.start_time
+                                       ).join(counterpart, counterpart_key == counterpart.id
+                                       ).filter(entity_key == model_id
+                                       ).order_by(Show.start_time, Show.id)
+        # the upcoming and past shows and the similar venues or artists of an existing entity load concurrently
+        upcoming_shows, past_shows, similar = fetch_concurrently(shows_query.filter(Show.start_time >= current_time),
+                                                                 shows_query.filter(Show.start_time < current_time),
+                                                                 similar_query)
+        upcoming_shows = [dict(zip(show.keys(), show)) for show in upcoming_shows.result()]
+        past_shows = [dict(zip(show.keys(), show)) for show in past_shows.result()]
+        similar = similar.result()
+
+    detail = {column.key: getattr(entity_query, column.key) for column in entity.__table__.columns}
+    detail['genres'] = entity_query.genres
+    detail['upcoming_shows'] = upcoming_shows
+    detail['past_shows'] = past_shows
+    detail['similar'] = [dict(zip(row.keys(), row)) for row in similar]
+    detail['upcoming_shows_count'] = len(detail['upcoming_shows'])
+    detail['past_shows_count'] = len(detail['past_shows'])
+    return detail
+
+
+# rendered venue and artist detail pages , an entry expires when its first upcoming show starts and moves to the past shows
+detail_page_cache = LRUCache()
+
+
+def render_detail_page(model, model_id):
+    key = (model.lower(), model_id)
+    # pending flash messages are rendered into the page , so those responses are neither served from nor stored in the cache
+    cacheable = not session.get('_flashes') and not shared_caches_bypassed()
+    if cacheable:
+        page = detail_page_cache.get(key)
+        if page is not None:
+            return page
+        with primary_reads():
+            detail = model_detail(model=model, model_id=model_id)
+    else:
+        detail = model_detail(model=model, model_id=model_id)
+    if not detail:
+        abort(404)
+    page = render_template('pages/show_' + model.lower() + '.html', **{model.lower(): detail})
+    if cacheable:
+        expires_at = None
+        if detail['upcoming_shows']:
+            next_show_time = detail['upcoming_shows'][0]['start_time']
+            expires_at = time.time() + (next_show_time - datetime.utcnow()).total_seconds()
+        detail_page_cache.set(key, page, expires_at=expires_at)
+    return page
+
+
+# cache keys of the detail pages of venues or artists and of everything booked with them , they render their name and image
+def detail_page_keys(model, model_ids):
+    if model.lower() == 'venue':
+        counterpart, entity_key, counterpart_key = 'artist', Show.venue_id, Show.artist_id
+    else:
+        counterpart, entity_key, counterpart_key = 'venue', Show.artist_id, Show.venue_id
+    keys = [(model.lower(), int(model_id)) for model_id in model_ids]
+    for counterpart_id, in db.session.query(counterpart_key).filter(entity_key.in_(model_ids)).distinct():
+        keys.append((counterpart, counterpart_id))
+    return keys
 
 
-#  Venues
-#  ----------------------------------------------------------------
+def invalidate_detail_pages(keys):
+    for key in keys:
+        detail_page_cache.delete(key)
+        calendar_validators.delete(key)
 
-@app.route('/venues')
-def venues():
 
-    states_query = db.session.query(Venue.state.distinct().label("state")).order_by(Venue.state)
-    states = [venue.state for venue in states_query.all()]
-    venues = Venue.query.order_by(Venue.city).all()
+# validators of the venue and artist calendar feeds , calendar clients poll them every few minutes and are answered
+# 304 Not Modified from here without a query , until a write invalidates the feed with its detail page
+calendar_validators = LRUCache()
+FeedValidator = namedtuple('FeedValidator', ['etag', 'last_modified', 'name'])
+
+
+def calendar_window_start():
+    today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    return today - timedelta(days=current_app.config['CALENDAR_PAST_DAYS'])
+
+
+# the feed changes when its entity , one of its shows or anyone booked with it changes , or when a show is added or
+# removed , so the validator is computed from those update times and the show count in one aggregate query
+def calendar_validator(model, model_id):
+    key = (model, model_id)
+    cacheable = not shared_caches_bypassed()
+    validator = calendar_validators.get(key) if cacheable else None
+    if validator is not None:
+        return validator
+    if model == 'venue':
+        entity, counterpart, entity_key, counterpart_key = Venue, Artist, Show.venue_id, Show.artist_id
+    else:
+        entity, counterpart, entity_key, counterpart_key = Artist, Venue, Show.artist_id, Show.venue_id
+    with primary_reads():
+        row = db.session.query(entity.name, entity.updated_at, func.count(Show.id), func.max(Show.updated_at),
+                               func.max(counterpart.updated_at)
+                               ).outerjoin(Show, entity_key == entity.id).outerjoin(counterpart, counterpart_key == counterpart.id
+                               ).filter(entity.id == model_id).group_by(entity.id, entity.name, entity.updated_at).first()
+    if row is None:
+        return None
+    name, updated_at, show_count, shows_updated_at, counterparts_updated_at = row
+    # http dates have a resolution of seconds
+    last_modified = max(value for value in (updated_at, shows_updated_at, counterparts_updated_at) if value is not None
+                        ).replace(microsecond=0)
+    version = '{}:{}:{}:{}:{}:{}'.format(model_id, show_count, updated_at, shows_updated_at, counterparts_updated_at,
+                                         calendar_window_start().date())
+    validator = FeedValidator('{}-{:08x}'.format(model, zlib.crc32(version.encode())), last_modified, name)
+    if cacheable:
+        calendar_validators.set(key, validator)
+    return validator
+
+
+# delete function , used by the single and batch delete controllers of venues and artists. it removes every row in one
+# statement and lets the database cascade to their shows and genre links , then drops them from the caches and search index
+def model_delete(model, model_ids):
+    if model.lower() == 'venue':
+        entity, search_index, records = Venue, venue_search_index, venue_records
+    else:
+        entity, search_index, records = Artist, artist_search_index, artist_records
+    cached_pages = detail_page_keys(model=model, model_ids=model_ids)
+    kind = entity.__name__.lower()
+    _, similar_table, _, _, _ = SIMILAR_TABLES[kind]
+    listing = {entity_id for entity_id, in db.session.query(similar_table.c[kind + '_id']).filter(
+        similar_table.c.similar_id.in_(model_ids)).distinct()}
+    deleted = entity.query.filter(entity.id.in_(model_ids)).delete(synchronize_session=False)
+    # the cascade took the shows of the deleted rows along , so whoever they were booked with is recounted , and
+    # their similar lists are recomputed by the next refresh with those of the lists that named a deleted row
+    counterpart = Artist if entity is Venue else Venue
+    booked = [key_id for kind_name, key_id in cached_pages if kind_name == counterpart.__name__.lower()]
+    refresh_show_counters(counterpart, booked)
+    mark_similar_stale(kind, listing - {int(model_id) for model_id in model_ids})
+    mark_similar_stale(counterpart.__name__.lower(), booked)
+    db.session.commit()
+    invalidate_detail_pages(cached_pages)
+    home_feed.invalidate()
+    for model_id in model_ids:
+        search_index.remove(model_id)
+        records.invalidate(model_id)
+    return deleted
+
+
+@main.route('/')
+def index():
+    feed = home_feed.get()
+    return render_template('pages/home.html', venues=feed['venues'], artists=feed['artists'], shows=feed['shows'])
 
-    return render_template('pages/venues.html', states=states, venues=venues)
 
+#  Venues
+#  ----------------------------------------------------------------
 
-@app.route('/venues/search', methods=['POST'])
+@main.route('/venues')
+def venues():
+    state = request.args.get('state')
+    if current_app.config['VENUES_LAZY_STATES'] and not state:
+        # only the states and their venue counts are listed , each state expands with ?state=
+        states_query = db.session.query(Venue.state, func.count(Venue.id)).group_by(Venue.state).order_by(Venue.state)
+        states = [{'state': state, 'count': count, 'venues': None} for state, count in states_query]
+        return render_template('pages/venues.html', states=states)
+
+    venues_query = db.session.query(Venue.id, Venue.name, Venue.city, Venue.state, Venue.upcoming_shows_count)
+    if state:
+        venues_query = venues_query.filter(Venue.state == state)
+    venues_query = venues_query.order_by(Venue.state, Venue.city, Venue.name)
+    states = []
+    for state, state_venues in groupby(venues_query, key=lambda venue: venue.state):
+        state_venues = list(state_venues)
+        states.append({'state': state, 'count': len(state_venues), 'venues': state_venues})
+
+    return render_template('pages/venues.html', states=states)
+
+
+@main.route('/venues/search', methods=['POST'])
 def search_venues():
 
     response = model_search(form=request.form, model='Venue')
     return render_template('pages/search_venues.html', results=response, search_term=request.form.get('search_term'))
 
 
-@app.route('/venues/<int:venue_id>')
+@main.route('/venues/<int:venue_id>')
 def show_venue(venue_id):
-    venue_query = Venue.query.get(venue_id)
-    if not venue_query:
-        abort(404)
-
-    venue = {}
-
-    venue['id'] = venue_query.id
-    venue['name'] = venue_query.name
-    venue['city'] = venue_query.city
-    venue['state'] = venue_query.state
-    venue['address'] = venue_query.address
-    venue['phone'] = venue_query.phone
-    venue['image_link'] = venue_query.image_link
-    venue['facebook_link'] = venue_query.facebook_link
-    venue['website'] = venue_query.website
-    venue['seeking_talent'] = venue_query.seeking_talent
-    venue['seeking_description'] = venue_query.seeking_description
-    venue['genres'] = venue_query.genres
-
-    current_time = datetime.utcnow()
-
-    upcoming_shows_query = Show.query.filter_by(venue_id=venue_id).filter(Show.start_time>=current_time).order_by(Show.start_time)
-    venue['upcoming_shows_count'] = upcoming_shows_query.count()
-    venue['upcoming_shows'] = []
-    for show in upcoming_shows_query.all():
-        venue['upcoming_shows'].append({ "artist_id":show.artist_id
-                                        ,"artist_image_link":Artist.query.get(show.artist_id).image_link
-                                        ,"artist_name":Artist.query.get(show.artist_id).name
-                                        ,"start_time":show.start_time
-                                        })
-
-    past_shows_query = Show.query.filter_by(venue_id=venue_id).filter(Show.start_time < current_time).order_by(Show.start_time)
-    venue['past_shows_count'] = past_shows_query.count()
-    venue['past_shows'] = []
-    for show in past_shows_query.all():
-        venue['past_shows'].append({ "artist_id":show.artist_id
-                                        ,"artist_image_link":Artist.query.get(show.artist_id).image_link
-                                        ,"artist_name":Artist.query.get(show.artist_id).name
-                                        , "start_time": show.start_time
-                                        })
-    return render_template('pages/show_venue.html', venue=venue)
+    return render_detail_page(model='Venue', model_id=venue_id)
 
 
 #  Create Venue
 #  ----------------------------------------------------------------
 
-@app.route('/venues/create', methods=['GET'])
+@main.route('/venues/create', methods=['GET'])
 def create_venue_form():
     form = VenueForm()
-    #pre populate the genre multipleselect field with genres from database table
-    genres = Genre.query.all()
-    count = Genre.query.count()
-    if count == 0:
-        genres_list = ['Alternative', 'Blues', 'Classical', 'Country', 'Electronic', 'Folk', 'Funk', 'Hip-Hop',
-                       'Heavy Metal', 'Instrumental', 'Jazz', 'Musical Theatre', 'Pop', 'Punk', 'R&B', 'Reggae',
-                       'Rock n Roll', 'Soul', 'Other']
-        for genre in genres_list:
-            temp = Genre(name=genre)
-            db.session.add(temp)
-        db.session.commit()
-        genres = Genre.query.all()
-        count = Genre.query.count()
-
-    list_of_genres = []
-    for i in range(0, count):
-        list_of_genres.append((genres[i].id, genres[i].name))
-    form.genres.choices = list_of_genres
+    #pre populate the genre multipleselect field with genres from the genre catalog
+    form.genres.choices = genre_catalog.get_choices()
 
     return render_template('forms/new_venue.html', form=form)
 
 
-@app.route('/venues/create', methods=['POST'])
+@main.route('/venues/create', methods=['POST'])
 def create_venue_submission():
     error = False
     try:
@@ -267,13 +1277,13 @@ def create_venue_submission():
                           , seeking_talent=form.data['seeking_talent']
                           , seeking_description=form.data['seeking_description'] if form.data['seeking_description'] != '' else None
                           )
-        genres = []
-        for genre_id in form.data['genres']:
-            genres.append(Genre.query.get(genre_id))
-
+        genres = genre_catalog.resolve(form.data['genres'])
         new_venue.genres = genres
         db.session.add(new_venue)
         db.session.commit()
+        index_model(venue_search_index, new_venue)
+        venue_records.put(new_venue.id, entity_record(new_venue))
+        home_feed.invalidate()
         # on successful db insert, flash success
         flash('Venue ' + request.form['name'] + ' was successfully listed!')
     except:
@@ -283,40 +1293,58 @@ def create_venue_submission():
         flash('An error occurred. Venue ' + request.form['name'] + ' could not be listed.')
     finally:
         db.session.close()
-    return redirect(url_for('index'))
+    return redirect(url_for('main.index'))
 
 
-@app.route('/venues/<venue_id>/delete', methods=['POST'])
+@main.route('/venues/<int:venue_id>/delete', methods=['POST'])
 def delete_venue(venue_id):
+    venue = venue_records.get(venue_id)
+    if not venue:
+        abort(404)
     try:
-        venue = Venue.query.get(venue_id)
-        shows = Show.query.filter_by(venue_id=venue_id)
-        for show in shows:
-            db.session.delete(show)
-        db.session.delete(venue)
-        db.session.commit()
-        # on successful db delete, flash success
-        flash('Venue ' + venue.name + ' was successfully deleted!')
+        deleted = model_delete(model='Venue', model_ids=[venue_id])
     except:
         db.session.rollback()
-        # TODO: on unsuccessful db delete, flash an error instead.
-        flash('An error occurred. Artist ' + venue.name + ' could not be deleted')
-    finally: 
+        flash('An error occurred. Venue ' + venue.name + ' could not be deleted')
+        return redirect(url_for('main.index'))
+    finally:
         db.session.close()
-    return redirect(url_for('index'))
+    if not deleted:
+        # the cached record outlived the row , another process deleted it first
+        flash('Venue ' + venue.name + ' was not found')
+        abort(404)
+    # on successful db delete, flash success
+    flash('Venue ' + venue.name + ' was successfully deleted!')
+    return redirect(url_for('main.index'))
+
+
+@main.route('/venues/delete', methods=['POST'])
+def delete_venues():
+    venue_ids = request.form.getlist('ids', type=int)
+    if not venue_ids or len(venue_ids) > current_app.config['BATCH_DELETE_LIMIT']:
+        abort(400)
+    try:
+        deleted = model_delete(model='Venue', model_ids=venue_ids)
+        flash(str(deleted) + ' venues were successfully deleted!')
+    except:
+        db.session.rollback()
+        flash('An error occurred. Venues could not be deleted')
+    finally:
+        db.session.close()
+    return redirect(url_for('main.index'))
 
 
 
 #  Artists
 #  ----------------------------------------------------------------
-@app.route('/artists')
+@main.route('/artists')
 def artists():
 
     artists = Artist.query.order_by(Artist.name).all()
     return render_template('pages/artists.html', artists=artists)
 
 
-@app.route('/artists/search', methods=['POST'])
+@main.route('/artists/search', methods=['POST'])
 def search_artists():
 
     response = model_search(form=request.form, model='Artist')
@@ -324,81 +1352,55 @@ def search_artists():
                            search_term=request.form.get('search_term', ''))
 
 
-@app.route('/artists/<int:artist_id>')
+@main.route('/artists/<int:artist_id>')
 def show_artist(artist_id):
-    artist_query = Artist.query.get(artist_id)
-    if not artist_query:
-        abort(404)
-
-    artist = {}
-
-    artist['id'] = artist_query.id
-    artist['name'] = artist_query.name
-    artist['city'] = artist_query.city
-    artist['state'] = artist_query.state
-    artist['phone'] = artist_query.phone
-    artist['image_link'] = artist_query.image_link
-    artist['facebook_link'] = artist_query.facebook_link
-    artist['website'] = artist_query.website
-    artist['seeking_venue'] = artist_query.seeking_venue
-    artist['seeking_description'] = artist_query.seeking_description
-    artist['genres'] = artist_query.genres
-
-    current_time = datetime.utcnow()
+    return render_detail_page(model='Artist', model_id=artist_id)
 
-    upcoming_shows_query = Show.query.filter_by(artist_id=artist_id).filter(Show.start_time >= current_time).order_by(Show.start_time)
-    artist['upcoming_shows_count'] = upcoming_shows_query.count()
-    artist['upcoming_shows'] = []
-    for show in upcoming_shows_query.all():
-        artist['upcoming_shows'].append({"venue_id": show.venue_id
-                                           , "venue_image_link": Venue.query.get(show.venue_id).image_link
-                                           , "venue_name": Venue.query.get(show.venue_id).name
-                                           , "start_time": show.start_time
-                                        })
-
-    past_shows_query = Show.query.filter_by(artist_id=artist_id).filter(Show.start_time < current_time).order_by(Show.start_time)
-    artist['past_shows_count'] = past_shows_query.count()
-    artist['past_shows'] = []
-    for show in past_shows_query.all():
-        artist['past_shows'].append({"venue_id": show.venue_id
-                                           , "venue_image_link": Venue.query.get(show.venue_id).image_link
-                                           , "venue_name": Venue.query.get(show.venue_id).name
-                                           , "start_time": show.start_time
-                                    })
-    return render_template('pages/show_artist.html', artist=artist)
-
-@app.route('/artists/<artist_id>/delete', methods=['POST'])
+@main.route('/artists/<int:artist_id>/delete', methods=['POST'])
 def delete_artist(artist_id):
+    artist = artist_records.get(artist_id)
+    if not artist:
+        abort(404)
     try:
-        artist = Artist.query.get(artist_id)
-        shows = Show.query.filter_by(artist_id=artist_id)
-        for show in shows:
-            db.session.delete(show)
-        db.session.delete(artist)
-        db.session.commit()
-        # on successful db delete, flash success
-        flash('Artist ' + artist.name + ' was successfully deleted!')
+        deleted = model_delete(model='Artist', model_ids=[artist_id])
     except:
         db.session.rollback()
-        # TODO: on unsuccessful db delete, flash an error instead.
         flash('An error occurred. Artist ' + artist.name + ' could not be deleted')
+        return redirect(url_for('main.index'))
     finally:
         db.session.close()
-    return redirect(url_for('index'))
+    if not deleted:
+        # the cached record outlived the row , another process deleted it first
+        flash('Artist ' + artist.name + ' was not found')
+        abort(404)
+    # on successful db delete, flash success
+    flash('Artist ' + artist.name + ' was successfully deleted!')
+    return redirect(url_for('main.index'))
+
+
+@main.route('/artists/delete', methods=['POST'])
+def delete_artists():
+    artist_ids = request.form.getlist('ids', type=int)
+    if not artist_ids or len(artist_ids) > current_app.config['BATCH_DELETE_LIMIT']:
+        abort(400)
+    try:
+        deleted = model_delete(model='Artist', model_ids=artist_ids)
+        flash(str(deleted) + ' artists were successfully deleted!')
+    except:
+        db.session.rollback()
+        flash('An error occurred. Artists could not be deleted')
+    finally:
+        db.session.close()
+    return redirect(url_for('main.index'))
 #  Update
 #  ----------------------------------------------------------------
-@app.route('/artists/<int:artist_id>/edit', methods=['GET'])
+@main.route('/artists/<int:artist_id>/edit', methods=['GET'])
 def edit_artist(artist_id):
     artist = Artist.query.get(artist_id)
     if not artist:
         abort(404)
     form = ArtistForm(obj=artist)
-    genres = Genre.query.all()
-    count = Genre.query.count()
-    list_of_genres = []
-    for i in range(0, count):
-        list_of_genres.append((genres[i].id, genres[i].name))
-    form.genres.choices = list_of_genres
+    form.genres.choices = genre_catalog.get_choices()
 
     artist_genres_query = Genre.query.join(artist_genres).join(Artist).filter(
         artist_genres.c.artist_id == artist_id).all()
@@ -410,7 +1412,7 @@ def edit_artist(artist_id):
     return render_template('forms/edit_artist.html', form=form, artist=artist)
 
 
-@app.route('/artists/<int:artist_id>/edit', methods=['POST'])
+@main.route('/artists/<int:artist_id>/edit', methods=['POST'])
 def edit_artist_submission(artist_id):
 
     try:
@@ -426,12 +1428,15 @@ def edit_artist_submission(artist_id):
         edited_artist.website = form.data['website']
         edited_artist.seeking_venue = form.data['seeking_venue']
         edited_artist.seeking_description = form.data['seeking_description']
-        genres = []
-        for genre_id in form.data['genres']:
-            genres.append(Genre.query.get(genre_id))
-
+        genres = genre_catalog.resolve(form.data['genres'])
         edited_artist.genres = genres
+        # changing only the genres does not update the artist row , so the change time is set explicitly
+        edited_artist.updated_at = datetime.utcnow()
         db.session.commit()
+        index_model(artist_search_index, edited_artist)
+        artist_records.put(edited_artist.id, entity_record(edited_artist))
+        invalidate_detail_pages(detail_page_keys(model='Artist', model_ids=[artist_id]))
+        home_feed.invalidate()
         # on successful db insert, flash success
         flash('Artist ' + request.form['name'] + ' was successfully edited!')
 
@@ -442,21 +1447,16 @@ def edit_artist_submission(artist_id):
     finally:
         db.session.close()
 
-    return redirect(url_for('show_artist', artist_id=artist_id))
+    return redirect(url_for('main.show_artist', artist_id=artist_id))
 
 
-@app.route('/venues/<int:venue_id>/edit', methods=['GET'])
+@main.route('/venues/<int:venue_id>/edit', methods=['GET'])
 def edit_venue(venue_id):
     venue = Venue.query.get(venue_id)
     if not venue:
         abort(404)
     form = VenueForm(obj=venue)
-    genres = Genre.query.all()
-    count = Genre.query.count()
-    list_of_genres = []
-    for i in range(0, count):
-        list_of_genres.append((genres[i].id, genres[i].name))
-    form.genres.choices = list_of_genres
+    form.genres.choices = genre_catalog.get_choices()
 
     venue_genres_query = Genre.query.join(venue_genres).join(Venue).filter(venue_genres.c.venue_id == venue_id).all()
     selected_genres = []
@@ -468,7 +1468,7 @@ def edit_venue(venue_id):
     return render_template('forms/edit_venue.html', form=form, venue=venue)
 
 
-@app.route('/venues/<int:venue_id>/edit', methods=['POST'])
+@main.route('/venues/<int:venue_id>/edit', methods=['POST'])
 def edit_venue_submission(venue_id):
 
     try:
@@ -486,12 +1486,15 @@ def edit_venue_submission(venue_id):
         edited_venue.website = form.data['website']
         edited_venue.seeking_talent = form.data['seeking_talent']
         edited_venue.seeking_description = form.data['seeking_description']
-        genres = []
-        for genre_id in form.data['genres']:
-            genres.append(Genre.query.get(genre_id))
-
+        genres = genre_catalog.resolve(form.data['genres'])
         edited_venue.genres = genres
+        # changing only the genres does not update the venue row , so the change time is set explicitly
+        edited_venue.updated_at = datetime.utcnow()
         db.session.commit()
+        index_model(venue_search_index, edited_venue)
+        venue_records.put(edited_venue.id, entity_record(edited_venue))
+        invalidate_detail_pages(detail_page_keys(model='Venue', model_ids=[venue_id]))
+        home_feed.invalidate()
         # on successful db insert, flash success
         flash('Venue ' + request.form['name'] + ' was successfully edited!')
 
@@ -503,36 +1506,20 @@ def edit_venue_submission(venue_id):
     finally:
         db.session.close()
 
-    return redirect(url_for('show_venue', venue_id=venue_id))
+    return redirect(url_for('main.show_venue', venue_id=venue_id))
 
 
 #  Create Artist
 #  ----------------------------------------------------------------
 
-@app.route('/artists/create', methods=['GET'])
+@main.route('/artists/create', methods=['GET'])
 def create_artist_form():
     form = ArtistForm()
-    genres = Genre.query.all()
-    count = Genre.query.count()
-    if count == 0:
-        genres_list = ['Alternative', 'Blues', 'Classical', 'Country', 'Electronic', 'Folk', 'Funk', 'Hip-Hop',
-                       'Heavy Metal', 'Instrumental', 'Jazz', 'Musical Theatre', 'Pop', 'Punk', 'R&B', 'Reggae',
-                       'Rock n Roll', 'Soul', 'Other']
-        for genre in genres_list:
-            temp = Genre(name=genre)
-            db.session.add(temp)
-        db.session.commit()
-        genres = Genre.query.all()
-        count = Genre.query.count()
-
-    list_of_genres = []
-    for i in range(0, count):
-        list_of_genres.append((genres[i].id, genres[i].name))
-    form.genres.choices = list_of_genres
+    form.genres.choices = genre_catalog.get_choices()
     return render_template('forms/new_artist.html', form=form)
 
 
-@app.route('/artists/create', methods=['POST'])
+@main.route('/artists/create', methods=['POST'])
 def create_artist_submission():
     error = False
     try:
@@ -547,13 +1534,13 @@ def create_artist_submission():
                             , seeking_venue=form.data['seeking_venue']
                             , seeking_description=form.data['seeking_description'] if form.data['seeking_description'] != '' else None
                             )
-        genres = []
-        for genre_id in form.data['genres']:
-            genres.append(Genre.query.get(genre_id))
-
+        genres = genre_catalog.resolve(form.data['genres'])
         new_artist.genres = genres
         db.session.add(new_artist)
         db.session.commit()
+        index_model(artist_search_index, new_artist)
+        artist_records.put(new_artist.id, entity_record(new_artist))
+        home_feed.invalidate()
         # on successful db insert, flash success
         flash('Artist ' + request.form['name'] + ' was successfully listed!')
     except:
@@ -564,46 +1551,61 @@ def create_artist_submission():
     finally:
         db.session.close()
 
-    return redirect(url_for('index'))
+    return redirect(url_for('main.index'))
 
 
 #  Shows
 #  ----------------------------------------------------------------
 
-@app.route('/shows')
+@main.route('/shows')
 def shows():
-    shows = Show.query.order_by('start_time').all()
-    data = []
-    for show in shows:
-        data.append({"venue_id": show.venue_id,
-                     "venue_name": Venue.query.get(show.venue_id).name,
-                     "artist_id": show.artist_id,
-                     "artist_name": Artist.query.get(show.artist_id).name,
-                     "artist_image_link": Artist.query.get(show.artist_id).image_link,
-                     "start_time": show.start_time
-                     })
-
-    return render_template('pages/shows.html', shows=data)
-
-
-@app.route('/shows/create')
+    page_size = min(request.args.get('limit', current_app.config['SHOWS_PAGE_SIZE'], type=int),
+                    current_app.config['SHOWS_MAX_PAGE_SIZE'])
+    if page_size < 1:
+        abort(400)
+    filters = show_filters()
+    shows_query = filter_after_show_cursor(filter_show_listing(show_listing_query(), filters))
+    # rows are fetched in batches while the template streams , so memory stays bounded by the page size
+    data = shows_query.order_by(Show.start_time, Show.id).limit(page_size).yield_per(100)
+    return Response(stream_with_context(stream_template('pages/shows.html', shows=data, page_size=page_size,
+                                                        filters=filters, genres=genre_catalog.get_choices())))
+
+
+@main.route('/shows/create')
 def create_shows():
     # renders form. do not touch.
     form = ShowForm()
     return render_template('forms/new_show.html', form=form)
 
 
-@app.route('/shows/create', methods=['POST'])
+@main.route('/shows/create', methods=['POST'])
 def create_show_submission():
     error = False
     try:
         form = ShowForm(request.form)
         new_show = Show(artist_id=form.data['artist_id'], venue_id=form.data['venue_id'],
-                        start_time=form.data['start_time'])
+                        start_time=datetime.fromisoformat(form.data['start_time']))
+        conflict = booking_conflict(new_show.venue_id, new_show.artist_id, new_show.start_time)
+        if conflict:
+            error = True
+            flash('The ' + conflict + ' is already booked at that time. Show could not be listed.')
+            return redirect(url_for('main.create_shows'))
         db.session.add(new_show)
+        db.session.flush()
+        count_new_show(new_show.venue_id, new_show.artist_id, new_show.start_time)
         db.session.commit()
+        invalidate_detail_pages([('venue', new_show.venue_id), ('artist', new_show.artist_id)])
+        home_feed.invalidate()
         # on successful db insert, flash success
         flash('Show was successfully listed!')
+    except IntegrityError as integrity_error:
+        error = True
+        db.session.rollback()
+        if getattr(integrity_error.orig, 'pgcode', None) == EXCLUSION_VIOLATION:
+            # booked by a concurrent request between the check and the insert
+            flash('The venue or artist is already booked at that time. Show could not be listed.')
+            return redirect(url_for('main.create_shows'))
+        flash('An error occurred. Show could not be listed.')
     except:
         error = True
         db.session.rollback()
@@ -611,28 +1613,784 @@ def create_show_submission():
         flash('An error occurred. Show could not be listed.')
     finally:
         db.session.close()
-    return redirect(url_for('index'))
+    return redirect(url_for('main.index'))
+
+
+#  API
+#  ----------------------------------------------------------------
+
+# columns a client can select with ?fields= , listings return all of them by default
+API_VENUE_FIELDS = ['id', 'name', 'city', 'state', 'address', 'phone', 'image_link', 'facebook_link', 'website',
+                    'seeking_talent', 'seeking_description', 'upcoming_shows_count', 'past_shows_count', 'next_show_at']
+API_ARTIST_FIELDS = ['id', 'name', 'city', 'state', 'phone', 'image_link', 'facebook_link', 'website',
+                     'seeking_venue', 'seeking_description', 'upcoming_shows_count', 'past_shows_count', 'next_show_at']
+API_SHOW_COLUMNS = {'id': Show.id,
+                    'start_time': Show.start_time,
+                    'venue_id': Show.venue_id,
+                    'venue_name': Venue.name,
+                    'venue_image_link': Venue.image_link,
+                    'artist_id': Show.artist_id,
+                    'artist_name': Artist.name,
+                    'artist_image_link': Artist.image_link}
+
+
+def json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(repr(value) + ' is not JSON serializable')
+
+
+def dump_json(data):
+    return json.dumps(data, default=json_default, separators=(',', ':'))
+
 
+def json_response(data, status=200):
+    return Response(dump_json(data), status=status, mimetype='application/json')
 
-@app.errorhandler(404)
+
+def api_fields(allowed):
+    requested = request.args.get('fields')
+    if not requested:
+        return allowed
+    fields = requested.split(',')
+    if not set(fields) <= set(allowed):
+        abort(400)
+    return fields
+
+
+# listing response , the query selects its keyset columns first and the requested fields after them.
+# ?format=ndjson streams every row from a server side cursor , otherwise one capped page of json is returned with the
+# cursor of the next page
+def api_listing(query, fields, key_count, cursor):
+    if request.args.get('format') == 'ndjson':
+        limit = request.args.get('limit', type=int)
+        if limit is not None:
+            query = query.limit(limit)
+
+        def generate():
+            for row in query.yield_per(1000):
+                yield dump_json(dict(zip(fields, row[key_count:]))) + '\n'
+
+        return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+    page_size = min(request.args.get('limit', current_app.config['API_PAGE_SIZE'], type=int), current_app.config['API_MAX_PAGE_SIZE'])
+    if page_size < 1:
+        abort(400)
+    rows = query.limit(page_size).all()
+    response = {}
+    response['data'] = [dict(zip(fields, row[key_count:])) for row in rows]
+    response['next'] = cursor(rows[-1]) if len(rows) == page_size else None
+    return json_response(response)
+
+
+def api_model_listing(model, allowed):
+    fields = api_fields(allowed)
+    query = db.session.query(model.id, *[getattr(model, field) for field in fields]).order_by(model.id)
+    after = request.args.get('after')
+    if after:
+        try:
+            query = query.filter(model.id > int(after))
+        except ValueError:
+            abort(400)
+    return api_listing(query, fields, key_count=1, cursor=lambda row: str(row[0]))
+
+
+def api_model_detail(model, model_id):
+    detail = model_detail(model=model, model_id=model_id)
+    if not detail:
+        abort(404)
+    detail['genres'] = [genre.name for genre in detail['genres']]
+    return json_response(detail)
+
+
+@main.route('/api/venues')
+def api_venues():
+    return api_model_listing(Venue, API_VENUE_FIELDS)
+
+
+@main.route('/api/venues/<int:venue_id>')
+def api_venue(venue_id):
+    return api_model_detail(model='Venue', model_id=venue_id)
+
+
+@main.route('/api/artists')
+def api_artists():
+    return api_model_listing(Artist, API_ARTIST_FIELDS)
+
+
+@main.route('/api/artists/<int:artist_id>')
+def api_artist(artist_id):
+    return api_model_detail(model='Artist', model_id=artist_id)
+
+
+@main.route('/api/shows')
+def api_shows():
+    fields = api_fields(list(API_SHOW_COLUMNS))
+    query = db.session.query(Show.start_time, Show.id, *[API_SHOW_COLUMNS[field] for field in fields]
+                             ).join(Show.artist).join(Show.venue).order_by(Show.start_time, Show.id)
+    query = filter_after_show_cursor(filter_show_listing(query, show_filters()))
+    return api_listing(query, fields, key_count=2, cursor=lambda row: row[0].isoformat() + '_' + str(row[1]))
+
+
+@main.route('/api/shows/<int:show_id>')
+def api_show(show_id):
+    show = db.session.query(*API_SHOW_COLUMNS.values()).join(Show.artist).join(Show.venue).filter(Show.id == show_id).first()
+    if not show:
+        abort(404)
+    return json_response(dict(zip(API_SHOW_COLUMNS, show)))
+
+
+# booked and free time of a venue between ?from= and ?to= (the next week by default) , every show blocks
+# SHOW_DURATION_MINUTES from its start
+@main.route('/venues/<int:venue_id>/availability')
+def venue_availability(venue_id):
+    try:
+        start = datetime.fromisoformat(request.args['from']) if request.args.get('from') else datetime.utcnow()
+        end = datetime.fromisoformat(request.args['to']) if request.args.get('to') else start + timedelta(days=7)
+    except ValueError:
+        return json_response({'error': 'from and to must be ISO 8601 times'}, 400)
+    if end <= start or end - start > timedelta(days=current_app.config['AVAILABILITY_MAX_DAYS']):
+        return json_response({'error': 'to must be after from and at most {} days later'.format(
+            current_app.config['AVAILABILITY_MAX_DAYS'])}, 400)
+    if venue_records.get(venue_id, fresh=shared_caches_bypassed()) is None:
+        return json_response({'error': 'not found'}, 404)
+
+    duration = show_duration()
+    booked = []
+    free = []
+    free_from = start
+    for show_id, artist_id, show_start in overlapping_shows(Show.venue_id, venue_id, start, end).with_entities(
+            Show.id, Show.artist_id, Show.start_time).order_by(Show.start_time):
+        show_end = show_start + duration
+        booked.append({'show_id': show_id, 'artist_id': artist_id, 'start_time': show_start, 'end_time': show_end})
+        if show_start > free_from:
+            free.append({'from': free_from, 'to': show_start})
+        free_from = max(free_from, show_end)
+    if free_from < end:
+        free.append({'from': free_from, 'to': end})
+    return json_response({'venue_id': venue_id, 'from': start, 'to': end,
+                          'show_duration_minutes': int(duration.total_seconds() // 60),
+                          'available': not booked, 'booked': booked, 'free': free})
+
+
+# streams the shows of a venue or artist from CALENDAR_PAST_DAYS ago on as an iCalendar feed , a request carrying the
+# feed's current ETag or Last-Modified is answered 304 Not Modified without touching the database
+def calendar_feed(model, model_id):
+    validator = calendar_validator(model, model_id)
+    if validator is None:
+        abort(404)
+    if request.if_none_match:
+        not_modified = request.if_none_match.contains(validator.etag)
+    else:
+        not_modified = request.if_modified_since is not None and request.if_modified_since >= validator.last_modified
+    if not_modified:
+        response = Response(status=304)
+    else:
+        entity_key = Show.venue_id if model == 'venue' else Show.artist_id
+        shows_query = db.session.query(Show.id, Show.start_time, Show.updated_at, Artist.name, Venue.name, Venue.address,
+                                       Venue.city, Venue.state
+                                       ).join(Show.artist).join(Show.venue
+                                       ).filter(entity_key == model_id, Show.start_time >= calendar_window_start()
+                                       ).order_by(Show.start_time, Show.id)
+        host = request.host
+        duration = show_duration()
+
+        def generate():
+            yield ical.calendar_header(validator.name)
+            events = []
+            for show_id, start_time, updated_at, artist_name, venue_name, address, city, state in shows_query.yield_per(500):
+                location = ', '.join(part for part in (venue_name, address, city, state) if part)
+                events.append(ical.event('show-{}@{}'.format(show_id, host), start_time, start_time + duration, updated_at,
+                                         '{} at {}'.format(artist_name, venue_name), location=location))
+                if len(events) == 100:
+                    yield ''.join(events)
+                    events = []
+            yield ''.join(events) + ical.calendar_footer()
+
+        response = Response(stream_with_context(generate()), mimetype='text/calendar')
+    response.set_etag(validator.etag)
+    response.last_modified = validator.last_modified
+    response.cache_control.no_cache = True
+    return response
+
+
+@main.route('/venues/<int:venue_id>/calendar.ics')
+def venue_calendar(venue_id):
+    return calendar_feed('venue', venue_id)
+
+
+@main.route('/artists/<int:artist_id>/calendar.ics')
+def artist_calendar(artist_id):
+    return calendar_feed('artist', artist_id)
+
+
+# best seeking venues for an artist or seeking artists for a venue , by shared genres and locality. The venue or artist
+# itself is read fresh , the seeking side comes from the in-process match index
+def model_matches(model, model_id):
+    if model == 'venue':
+        entity, kind, records = Venue, 'artist', artist_records
+    else:
+        entity, kind, records = Artist, 'venue', venue_records
+    limit = min(request.args.get('limit', current_app.config['MATCHES_LIMIT'], type=int),
+                current_app.config['MATCHES_MAX_LIMIT'])
+    if limit < 1:
+        return json_response({'error': 'limit must be positive'}, 400)
+    profile = entity.query.options(joinedload(entity.genres)).filter(entity.id == model_id).one_or_none()
+    if profile is None:
+        return json_response({'error': 'not found'}, 404)
+    matches = match_index.matches(kind, profile.city, profile.state, [genre.id for genre in profile.genres], limit)
+    found = records.get_many([match_id for match_id, _, _ in matches], fresh=shared_caches_bypassed())
+    genre_names = dict(genre_catalog.get_choices())
+    data = []
+    for match_id, score, genre_ids in matches:
+        # deleted since the index was loaded
+        if match_id not in found:
+            continue
+        record = found[match_id]
+        data.append({kind + '_id': match_id, 'name': record.name, 'image_link': record.image_link, 'city': record.city,
+                     'state': record.state, 'score': score,
+                     'genres': [genre_names[genre_id] for genre_id in genre_ids if genre_id in genre_names]})
+    return json_response({model + '_id': model_id, 'matches': data})
+
+
+@main.route('/artists/<int:artist_id>/matches')
+def artist_matches(artist_id):
+    return model_matches('artist', artist_id)
+
+
+@main.route('/venues/<int:venue_id>/matches')
+def venue_matches(venue_id):
+    return model_matches('venue', venue_id)
+
+
+@main.app_errorhandler(400)
+def bad_request_error(error):
+    if request.path.startswith('/api/'):
+        return json_response({'error': 'bad request'}, 400)
+    return error
+
+
+@main.app_errorhandler(404)
 def not_found_error(error):
+    if request.path.startswith('/api/'):
+        return json_response({'error': 'not found'}, 404)
     return render_template('errors/404.html'), 404
 
 
-@app.errorhandler(500)
+@main.app_errorhandler(500)
 def server_error(error):
+    if request.path.startswith('/api/'):
+        return json_response({'error': 'server error'}, 500)
     return render_template('errors/500.html'), 500
 
 
-if not app.debug:
-    file_handler = FileHandler('error.log')
-    file_handler.setFormatter(
-        Formatter('%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]')
-    )
-    app.logger.setLevel(logging.INFO)
-    file_handler.setLevel(logging.INFO)
-    app.logger.addHandler(file_handler)
-    app.logger.info('errors')
+# ----------------------------------------------------------------------------#
+# Commands.
+# ----------------------------------------------------------------------------#
+
+# models that carry genre links , with their association table and its foreign key column
+GENRE_LINKS = {'venues': (Venue, venue_genres, 'venue_id'),
+               'artists': (Artist, artist_genres, 'artist_id')}
+
+
+def read_records(path, file_format):
+    with open(path, newline='') as records_file:
+        if file_format == 'csv':
+            for line_number, record in enumerate(csv.DictReader(records_file), start=2):
+                yield line_number, record
+        else:
+            for line_number, line in enumerate(records_file, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    yield line_number, json.loads(line)
+                except ValueError:
+                    yield line_number, None
+
+
+# converts one imported record into the column values of table , raising ValueError with the reason of a rejected row
+def convert_record(table, record):
+    if not isinstance(record, dict):
+        raise ValueError('not a record')
+    row = {}
+    for column in table.columns:
+        if column.primary_key:
+            continue
+        value = record.get(column.name)
+        if value == '':
+            value = None
+        if value is None and column.default is not None:
+            # generated values such as updated_at are filled in here as well , every row of a batch carries every column
+            value = column.default.arg(None) if column.default.is_callable else column.default.arg
+        if value is None:
+            if not column.nullable:
+                raise ValueError(column.name + ' is required')
+        elif isinstance(column.type, db.Boolean) and isinstance(value, str):
+            value = value.strip().lower() in ('1', 'true', 'yes', 'y', 't')
+        elif isinstance(column.type, db.DateTime) and isinstance(value, str):
+            value = datetime.fromisoformat(value.strip())
+        elif isinstance(column.type, db.Integer):
+            value = int(value)
+        row[column.name] = value
+    return row
+
+
+def record_genres(record, genre_ids):
+    names = record.get('genres') or []
+    if isinstance(names, str):
+        names = names.split(';')
+    ids = []
+    for name in names:
+        name = name.strip()
+        if not name:
+            continue
+        if name.lower() not in genre_ids:
+            raise ValueError('unknown genre ' + name)
+        ids.append(genre_ids[name.lower()])
+    return ids
+
+
+# reserves ids for a batch up front so genre links can be written in bulk next to their rows
+def allocate_ids(table, count):
+    if db.engine.dialect.name == 'postgresql':
+        ids = db.session.execute("SELECT nextval(pg_get_serial_sequence(:table, 'id')) FROM generate_series(1, :count)",
+                                 {'table': '"' + table.name + '"', 'count': count})
+        return [row[0] for row in ids]
+    start = (db.session.query(func.max(table.c.id)).scalar() or 0) + 1
+    return list(range(start, start + count))
+
+
+# inserts rows with COPY on postgres and a single executemany elsewhere
+def bulk_insert(table, rows):
+    if not rows:
+        return
+    if db.engine.dialect.name == 'postgresql':
+        columns = list(rows[0])
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in rows:
+            writer.writerow([row[column] for column in columns])
+        buffer.seek(0)
+        cursor = db.session.connection().connection.cursor()
+        cursor.copy_expert('COPY "{}" ({}) FROM STDIN WITH (FORMAT csv)'.format(
+            table.name, ', '.join('"' + column + '"' for column in columns)), buffer)
+    else:
+        db.session.execute(table.insert(), rows)
+
+
+def import_batch(kind, batch, genre_ids, rejects):
+    table = Show.__table__ if kind == 'shows' else GENRE_LINKS[kind][0].__table__
+    rows = []
+    row_genres = []
+    row_lines = []
+    for line_number, record in batch:
+        try:
+            row = convert_record(table, record)
+            if kind != 'shows':
+                row_genres.append(record_genres(record, genre_ids))
+        except (ValueError, TypeError) as error:
+            rejects.append((line_number, str(error), record))
+            continue
+        rows.append(row)
+        row_lines.append((line_number, record))
+
+    if kind == 'shows':
+        # shows referencing a missing venue or artist are rejected instead of failing the whole batch
+        venue_ids = {venue_id for venue_id, in db.session.query(Venue.id).filter(Venue.id.in_({row['venue_id'] for row in rows}))}
+        artist_ids = {artist_id for artist_id, in db.session.query(Artist.id).filter(Artist.id.in_({row['artist_id'] for row in rows}))}
+        # shows overlapping a booking already stored or earlier in the batch are rejected as double booked
+        if rows:
+            first = min(row['start_time'] for row in rows)
+            last = max(row['start_time'] for row in rows) + show_duration()
+            venue_starts = booked_starts(Show.venue_id, venue_ids, first, last)
+            artist_starts = booked_starts(Show.artist_id, artist_ids, first, last)
+        valid_rows = []
+        for row, (line_number, record) in zip(rows, row_lines):
+            if row['venue_id'] not in venue_ids or row['artist_id'] not in artist_ids:
+                rejects.append((line_number, 'unknown venue or artist', record))
+            elif slot_taken(venue_starts[row['venue_id']], row['start_time']) or \
+                    slot_taken(artist_starts[row['artist_id']], row['start_time']):
+                rejects.append((line_number, 'double booked', record))
+            else:
+                bisect.insort(venue_starts[row['venue_id']], row['start_time'])
+                bisect.insort(artist_starts[row['artist_id']], row['start_time'])
+                valid_rows.append(row)
+        bulk_insert(table, valid_rows)
+        refresh_show_counters(Venue, {row['venue_id'] for row in valid_rows})
+        refresh_show_counters(Artist, {row['artist_id'] for row in valid_rows})
+        return len(valid_rows)
+
+    _, links_table, link_key = GENRE_LINKS[kind]
+    links = []
+    for row_id, row, genres in zip(allocate_ids(table, len(rows)), rows, row_genres):
+        row['id'] = row_id
+        links.extend({link_key: row_id, 'genre_id': genre_id} for genre_id in genres)
+    bulk_insert(table, rows)
+    bulk_insert(links_table, links)
+    return len(rows)
+
+
+@main.cli.command('import')
+@click.argument('kind', type=click.Choice(['venues', 'artists', 'shows']))
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'file_format', type=click.Choice(['csv', 'ndjson']),
+              help='Input format , guessed from the file extension when omitted.')
+@click.option('--batch-size', type=int, help='Rows inserted and committed per transaction , IMPORT_BATCH_SIZE by default.')
+@click.option('--rejects', type=click.Path(dir_okay=False), help='Write rejected rows and their reason to this ndjson file.')
+def import_command(kind, path, file_format, batch_size, rejects):
+    """Bulk import venues, artists or shows from a CSV or NDJSON file."""
+    if file_format is None:
+        file_format = 'csv' if path.lower().endswith('.csv') else 'ndjson'
+    batch_size = batch_size or current_app.config['IMPORT_BATCH_SIZE']
+    genre_ids = {name.lower(): genre_id for genre_id, name in genre_catalog.get_choices()}
+    records = read_records(path, file_format)
+    imported = 0
+    rejected = []
+    started = time.perf_counter()
+    while True:
+        batch = list(islice(records, batch_size))
+        if not batch:
+            break
+        try:
+            imported += import_batch(kind, batch, genre_ids, rejected)
+            db.session.commit()
+        except:
+            db.session.rollback()
+            raise
+        click.echo('{} {} imported'.format(imported, kind), err=True)
+    elapsed = time.perf_counter() - started
+
+    rejected.sort(key=lambda reject: reject[0])
+    if rejects:
+        with open(rejects, 'w') as rejects_file:
+            for line_number, reason, record in rejected:
+                rejects_file.write(dump_json({'line': line_number, 'reason': reason, 'record': record}) + '\n')
+    else:
+        for line_number, reason, record in rejected:
+            click.echo('rejected line {}: {}'.format(line_number, reason), err=True)
+    click.echo('Imported {} {} in {:.2f}s ({:.0f} rows/sec) , {} rejected'.format(
+        imported, kind, elapsed, imported / elapsed if elapsed else imported, len(rejected)))
+
+
+def insert_rows(table, rows, batch_size):
+    inserted = 0
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            return inserted
+        bulk_insert(table, batch)
+        inserted += len(batch)
+
+
+# generates and bulk inserts a synthetic dataset next to whatever the tables already hold , returns the row counts
+def seed_database(venues, artists, shows, seed=1, skew=0.7, anchor=None, batch_size=None):
+    batch_size = batch_size or current_app.config['IMPORT_BATCH_SIZE']
+    genre_ids = [genre_id for genre_id, _ in genre_catalog.get_choices()]
+    data = SyntheticData(allocate_ids(Venue.__table__, venues), allocate_ids(Artist.__table__, artists), genre_ids,
+                         seed=seed, exponent=skew, anchor=anchor)
+    counts = {}
+    for name, table, rows in (('venues', Venue.__table__, data.venues()),
+                              ('artists', Artist.__table__, data.artists()),
+                              ('venue_genres', venue_genres, data.venue_genres()),
+                              ('artist_genres', artist_genres, data.artist_genres())):
+        counts[name] = insert_rows(table, rows, batch_size)
+        db.session.commit()
+    show_rows = data.shows(allocate_ids(Show.__table__, shows), slot_minutes=current_app.config['SHOW_DURATION_MINUTES'])
+    counts['shows'] = insert_rows(Show.__table__, show_rows, batch_size)
+    refresh_show_counters(Venue, data.venue_ids)
+    refresh_show_counters(Artist, data.artist_ids)
+    db.session.commit()
+    return counts
+
+
+@main.cli.command('seed')
+@click.option('--venues', default=1000, show_default=True)
+@click.option('--artists', default=5000, show_default=True)
+@click.option('--shows', default=100000, show_default=True)
+@click.option('--seed', default=1, show_default=True, help='Same seed , sizes and anchor give the same rows.')
+@click.option('--skew', default=0.7, show_default=True,
+              help='Zipf exponent of venue and artist popularity , higher puts more shows on the most popular ones.')
+@click.option('--anchor', type=click.DateTime(formats=['%Y-%m-%d']),
+              help='Day shows are generated around , today by default.')
+@click.option('--batch-size', type=int, help='Rows per insert , IMPORT_BATCH_SIZE by default.')
+def seed_command(venues, artists, shows, seed, skew, anchor, batch_size):
+    """Fill the database with synthetic venues, artists, genres and shows."""
+    started = time.perf_counter()
+    try:
+        counts = seed_database(venues, artists, shows, seed=seed, skew=skew, anchor=anchor, batch_size=batch_size)
+    except:
+        db.session.rollback()
+        raise
+    click.echo('Seeded {} in {:.2f}s'.format(
+        ' , '.join('{} {}'.format(count, name) for name, count in counts.items()), time.perf_counter() - started))
+
+
+@main.cli.command('double-bookings')
+def double_bookings_command():
+    """List shows overlapping another show of the same venue or artist."""
+    duration = show_duration()
+    found = 0
+    for name, key in (('venue', Show.venue_id), ('artist', Show.artist_id)):
+        previous = None
+        # with one duration for all shows , any overlap shows up between neighbours in start time order
+        for show in db.session.query(key, Show.id, Show.start_time).order_by(key, Show.start_time, Show.id).yield_per(10000):
+            if previous is not None and previous[0] == show[0] and show[2] < previous[2] + duration:
+                click.echo('{} {}: show {} at {} overlaps show {} at {}'.format(
+                    name, show[0], show[1], show[2], previous[1], previous[2]))
+                found += 1
+            previous = show
+    click.echo('{} double bookings'.format(found))
+
+
+@main.cli.command('matches')
+@click.argument('kind', type=click.Choice(['artists', 'venues']))
+@click.option('--limit', type=int, help='Matches per artist or venue , MATCHES_LIMIT by default.')
+@click.option('--output', type=click.Path(dir_okay=False), help='Write the ndjson lines to this file instead of stdout.')
+def matches_command(kind, limit, output):
+    """Match every seeking artist with seeking venues, or every seeking venue with seeking artists."""
+    limit = limit or current_app.config['MATCHES_LIMIT']
+    key, counterpart = ('artist', 'venue') if kind == 'artists' else ('venue', 'artist')
+    started = time.perf_counter()
+    matched = 0
+    with click.open_file(output or '-', 'w') as output_file:
+        for entity_id, matches in match_index.batch(counterpart, limit):
+            output_file.write(dump_json({key + '_id': entity_id, 'matches': [
+                {counterpart + '_id': match_id, 'score': score} for match_id, score in matches]}) + '\n')
+            matched += 1
+    click.echo('Matched {} {} in {:.2f}s'.format(matched, kind, time.perf_counter() - started), err=True)
+
+
+@main.cli.command('refresh-similar')
+@click.option('--full', is_flag=True, help='Recompute every venue and artist , not only those changed since the last run.')
+@click.option('--every', type=int, help='Keep running and refresh every this many seconds.')
+def refresh_similar_command(full, every):
+    """Precompute the similar venues and artists shown on the detail pages."""
+    while True:
+        started = time.perf_counter()
+        try:
+            counts = {kind: refresh_similar(kind, full=full) for kind in ('venue', 'artist')}
+            db.session.commit()
+        except:
+            db.session.rollback()
+            raise
+        finally:
+            db.session.remove()
+        click.echo('Refreshed the similar {} in {:.2f}s'.format(
+            ' , '.join('{} {}s'.format(count, kind) for kind, count in counts.items()), time.perf_counter() - started))
+        if not every:
+            return
+        time.sleep(every)
+
+
+@main.cli.command('roll-shows')
+@click.option('--every', type=int, help='Keep running and roll over every this many seconds.')
+def roll_shows_command(every):
+    """Move shows that have started from the upcoming to the past show counters."""
+    while True:
+        try:
+            rolled = roll_over_shows()
+            db.session.commit()
+        except:
+            db.session.rollback()
+            raise
+        finally:
+            db.session.remove()
+        click.echo('Rolled over {}'.format(' , '.join('{} {}'.format(count, name) for name, count in rolled.items())))
+        if not every:
+            return
+        time.sleep(every)
+
+
+@main.cli.command('reconcile-show-counts')
+def reconcile_show_counts_command():
+    """Recompute the show counters of every venue and artist from the Show table."""
+    started = time.perf_counter()
+    try:
+        counts = {model.__tablename__: refresh_show_counters(model) for model in (Venue, Artist)}
+        db.session.commit()
+    except:
+        db.session.rollback()
+        raise
+    click.echo('Recounted {} in {:.2f}s'.format(
+        ' , '.join('{} {}'.format(count, name) for name, count in counts.items()), time.perf_counter() - started))
+
+
+# tables the export command and endpoint dump , link tables are exported incrementally through their parent row
+EXPORT_TABLES = {'venues': (Venue.__table__, None, None),
+                 'artists': (Artist.__table__, None, None),
+                 'shows': (Show.__table__, None, None),
+                 'venue_genres': (venue_genres, Venue, venue_genres.c.venue_id),
+                 'artist_genres': (artist_genres, Artist, artist_genres.c.artist_id)}
+
+
+def export_query(name, since=None):
+    table, parent, parent_key = EXPORT_TABLES[name]
+    query = db.session.query(*table.columns)
+    if since is not None:
+        if parent is None:
+            query = query.filter(table.c.updated_at >= since)
+        else:
+            query = query.join(parent, parent.id == parent_key).filter(parent.updated_at >= since)
+    return [column.name for column in table.columns], query.order_by(*table.primary_key.columns).yield_per(1000)
+
+
+# streams a table as csv or ndjson text chunks , rows are read from a server side cursor so memory does not grow with the table
+def export_chunks(name, file_format, since=None, rows_per_chunk=1000):
+    columns, rows = export_query(name, since)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if file_format == 'csv':
+        writer.writerow(columns)
+    for count, row in enumerate(rows, start=1):
+        if file_format == 'csv':
+            writer.writerow(row)
+        else:
+            buffer.write(dump_json(dict(zip(columns, row))) + '\n')
+        if count % rows_per_chunk == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def gzip_chunks(chunks):
+    compressor = zlib.compressobj(wbits=31)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+@main.cli.command('export')
+@click.argument('tables', nargs=-1, type=click.Choice(list(EXPORT_TABLES)))
+@click.option('--format', 'file_format', type=click.Choice(['csv', 'ndjson']), default='csv', show_default=True)
+@click.option('--since', type=click.DateTime(formats=['%Y-%m-%d', '%Y-%m-%dT%H:%M:%S', '%Y-%m-%d %H:%M:%S']),
+              help='Only export rows changed at or after this UTC time.')
+@click.option('--output-dir', type=click.Path(file_okay=False), default='.', show_default=True)
+@click.option('--gzip', 'compress', is_flag=True, help='Gzip the exported files.')
+def export_command(tables, file_format, since, output_dir, compress):
+    """Export venues, artists, shows and genre links , every table when none is named."""
+    os.makedirs(output_dir, exist_ok=True)
+    for name in tables or EXPORT_TABLES:
+        path = os.path.join(output_dir, name + '.' + file_format + ('.gz' if compress else ''))
+        chunks = export_chunks(name, file_format, since)
+        with open(path, 'wb') as export_file:
+            for data in (gzip_chunks(chunks) if compress else (chunk.encode('utf-8') for chunk in chunks)):
+                export_file.write(data)
+        click.echo('Exported ' + path)
+
+
+@main.route('/export/<table>.<file_format>')
+def export_download(table, file_format):
+    token = current_app.config['EXPORT_TOKEN']
+    if not token or not hmac.compare_digest(request.headers.get('Authorization', ''), 'Bearer ' + token):
+        abort(401)
+    if table not in EXPORT_TABLES or file_format not in ('csv', 'ndjson'):
+        abort(404)
+    since = request.args.get('since')
+    if since:
+        try:
+            since = datetime.fromisoformat(since)
+        except ValueError:
+            abort(400)
+    filename = table + '.' + file_format
+    chunks = export_chunks(table, file_format, since or None)
+    if request.args.get('gzip'):
+        return Response(stream_with_context(gzip_chunks(chunks)), mimetype='application/gzip',
+                        headers={'Content-Disposition': 'attachment; filename=' + filename + '.gz'})
+    mimetype = 'text/csv' if file_format == 'csv' else 'application/x-ndjson'
+    return Response(stream_with_context(chunks), mimetype=mimetype,
+                    headers={'Content-Disposition': 'attachment; filename=' + filename})
+
+
+@main.cli.command('pool-check')
+def pool_check_command():
+    """Connect to the database and print the effective pool settings."""
+    for key, value in pool_report(db.engine, current_app.config).items():
+        click.echo('{}: {}'.format(key, value))
+
+
+# ----------------------------------------------------------------------------#
+# App Factory.
+# ----------------------------------------------------------------------------#
+
+def create_app(test_config=None):
+    app = Flask(__name__)
+    app.config.from_object('config')
+    if test_config:
+        app.config.update(test_config)
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options(app.config))
+    replica_binds = {'replica_{}'.format(number): uri for number, uri in enumerate(app.config['SQLALCHEMY_REPLICA_URIS'])}
+    app.config['SQLALCHEMY_BINDS'] = dict(app.config.get('SQLALCHEMY_BINDS') or {}, **replica_binds)
+    app.config['REPLICA_BINDS'] = list(replica_binds)
+
+    db.init_app(app)
+    migrate.init_app(app, db)
+    moment.init_app(app)
+    app.register_blueprint(main)
+
+    # caches , indexes and the query pool are module globals rather than app.extensions: the views , models and
+    # commands reach them without an app at hand , and a process serves a single app. Creating an app resets them to
+    # its database and settings , so apps created one after the other , like in the tests , never see each other's data
+    for cache in (detail_page_cache, calendar_validators, venue_records.cache, artist_records.cache, home_feed,
+                  venue_search_index, artist_search_index, match_index):
+        cache.clear()
+    genre_catalog.invalidate()
+    detail_page_cache.max_size = app.config['DETAIL_PAGE_CACHE_SIZE']
+    detail_page_cache.ttl = app.config['DETAIL_PAGE_CACHE_TTL']
+    for records in (venue_records, artist_records):
+        records.cache.max_size = app.config['RECORD_CACHE_SIZE']
+        records.cache.ttl = app.config['RECORD_CACHE_TTL']
+    calendar_validators.max_size = app.config['CALENDAR_CACHE_SIZE']
+    calendar_validators.ttl = app.config['CALENDAR_CACHE_TTL']
+    match_index.max_age = app.config['MATCH_INDEX_TTL']
+    for search_index in (venue_search_index, artist_search_index):
+        search_index.max_age = app.config['SEARCH_INDEX_MAX_AGE']
+        search_index.rebuild_age = app.config['SEARCH_INDEX_REBUILD_AGE']
+    home_feed.size = app.config['HOME_FEED_SIZE']
+    home_feed.ttl = app.config['HOME_FEED_TTL']
+
+    global query_pool
+    if query_pool is not None:
+        query_pool.shutdown(wait=False)
+        query_pool = None
+    # an in-memory sqlite database only exists on the connection that opened it , the pool's connections would not see it
+    database = make_url(app.config['SQLALCHEMY_DATABASE_URI'])
+    in_memory = database.drivername.startswith('sqlite') and database.database in (None, '', ':memory:')
+    if app.config['DB_QUERY_CONCURRENCY'] > 1 and not in_memory:
+        query_pool = ThreadPoolExecutor(max_workers=app.config['DB_QUERY_CONCURRENCY'], thread_name_prefix='query')
+
+    with app.app_context():
+        engines = [db.engine] + [db.get_engine(app, bind=bind) for bind in app.config['REPLICA_BINDS']]
+        for engine in engines:
+            tune_engine(engine, app.config)
+            if app.config['SQL_INSTRUMENTATION']:
+                instrument_engine(engine)
+
+    if not app.debug:
+        file_handler = FileHandler('error.log')
+        file_handler.setFormatter(
+            Formatter('%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]')
+        )
+        app.logger.setLevel(logging.INFO)
+        file_handler.setLevel(logging.INFO)
+        app.logger.addHandler(file_handler)
+        app.logger.info('errors')
+
+    if app.config['DB_STARTUP_CHECK']:
+        # checked by the first request , so importing the app or running a command never connects for it
+        @app.before_first_request
+        def startup_check():
+            try:
+                app.logger.info('database pool: %s', pool_report(db.engine, app.config))
+            except Exception as error:
+                app.logger.error('database startup check failed: %s', error)
+
+    return app
+
+
+app = create_app()
 
 # ----------------------------------------------------------------------------#
 # Launch.
@@ -0,0 +1,327 @@
+"""Route level benchmark of Fyyur.
+
+Seeds a SQLite database of the requested size with the ``flask seed`` generator , drives every route of the app through the Flask test client and reports
+p50 , p95 and p99 latency , queries per request and how much the resident memory grew per route. Results are written as JSON , and when a baseline
+result is given the run fails if any route got slower or runs more queries than in the baseline.
+
+    python bench.py --venues 10000 --artists 50000 --shows 1000000
+    python bench.py --baseline benchmarks/baseline.json
+"""
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from itertools import islice
+
+import click
+
+from seed import CITIES
+
+# ----------------------------------------------------------------------------#
+# Scenarios.
+# ----------------------------------------------------------------------------#
+
+def scenarios(venues, artists, shows, reserved, genre_ids, rng):
+    """Return ``(endpoint, method, request_factory, heavy)`` for every route.
+
+    The last ``reserved`` venues and artists are never read , the delete scenarios remove them one request at a time.
+    Heavy scenarios stream a whole table and run fewer times.
+    """
+    read_venues = venues - reserved
+    read_artists = artists - reserved
+    doomed_venues = iter(range(read_venues + 1, venues + 1))
+    doomed_artists = iter(range(read_artists + 1, artists + 1))
+    venue = lambda: rng.randint(1, read_venues)
+    artist = lambda: rng.randint(1, read_artists)
+    term = lambda: str(rng.randint(1, 999))
+
+    def venue_form():
+        city, state = rng.choice(CITIES)
+        return {'name': 'Bench Venue', 'city': city, 'state': state, 'address': '1 Bench Road', 'phone': '555-000-0000',
+                'genres': [str(genre_id) for genre_id in rng.sample(genre_ids, 2)], 'facebook_link': '', 'website': ''}
+
+    def artist_form():
+        city, state = rng.choice(CITIES)
+        return {'name': 'Bench Artist', 'city': city, 'state': state, 'phone': '555-000-0000',
+                'genres': [str(genre_id) for genre_id in rng.sample(genre_ids, 2)], 'facebook_link': '', 'website': ''}
+
+    def batch(doomed):
+        return {'ids': [str(entity_id) for entity_id in islice(doomed, 10)]}
+
+    return [
+        ('main.index', 'GET', lambda: ('/', None), False),
+        ('main.venues', 'GET', lambda: ('/venues', None), False),
+        ('main.artists', 'GET', lambda: ('/artists', None), False),
+        ('main.shows', 'GET', lambda: ('/shows', None), False),
+        ('main.shows filtered', 'GET', lambda: ('/shows?state={1}&city={0}'.format(*rng.choice(CITIES)), None), False),
+        ('main.show_venue', 'GET', lambda: ('/venues/{}'.format(venue()), None), False),
+        ('main.show_artist', 'GET', lambda: ('/artists/{}'.format(artist()), None), False),
+        ('main.search_venues', 'POST', lambda: ('/venues/search', {'search_term': term()}), False),
+        ('main.search_artists', 'POST', lambda: ('/artists/search', {'search_term': term()}), False),
+        ('main.create_venue_form', 'GET', lambda: ('/venues/create', None), False),
+        ('main.create_artist_form', 'GET', lambda: ('/artists/create', None), False),
+        ('main.create_shows', 'GET', lambda: ('/shows/create', None), False),
+        ('main.edit_venue', 'GET', lambda: ('/venues/{}/edit'.format(venue()), None), False),
+        ('main.edit_artist', 'GET', lambda: ('/artists/{}/edit'.format(artist()), None), False),
+        ('main.create_venue_submission', 'POST', lambda: ('/venues/create', venue_form()), False),
+        ('main.create_artist_submission', 'POST', lambda: ('/artists/create', artist_form()), False),
+        ('main.create_show_submission', 'POST', lambda: ('/shows/create', {
+            'venue_id': str(venue()), 'artist_id': str(artist()),
+            'start_time': (datetime.utcnow() + timedelta(days=rng.randint(1, 365))).strftime('%Y-%m-%d %H:%M')}), False),
+        ('main.edit_venue_submission', 'POST', lambda: ('/venues/{}/edit'.format(venue()), venue_form()), False),
+        ('main.edit_artist_submission', 'POST', lambda: ('/artists/{}/edit'.format(artist()), artist_form()), False),
+        ('main.delete_venue', 'POST', lambda: ('/venues/{}/delete'.format(next(doomed_venues)), {}), False),
+        ('main.delete_artist', 'POST', lambda: ('/artists/{}/delete'.format(next(doomed_artists)), {}), False),
+        ('main.delete_venues', 'POST', lambda: ('/venues/delete', batch(doomed_venues)), False),
+        ('main.delete_artists', 'POST', lambda: ('/artists/delete', batch(doomed_artists)), False),
+        ('main.venue_availability', 'GET', lambda: ('/venues/{}/availability'.format(venue()), None), False),
+        ('main.venue_calendar', 'GET', lambda: ('/venues/{}/calendar.ics'.format(venue()), None), False),
+        ('main.artist_calendar', 'GET', lambda: ('/artists/{}/calendar.ics'.format(artist()), None), False),
+        ('main.artist_matches', 'GET', lambda: ('/artists/{}/matches'.format(artist()), None), False),
+        ('main.venue_matches', 'GET', lambda: ('/venues/{}/matches'.format(venue()), None), False),
+        ('main.api_venues', 'GET', lambda: ('/api/venues', None), False),
+        ('main.api_artists', 'GET', lambda: ('/api/artists', None), False),
+        ('main.api_shows', 'GET', lambda: ('/api/shows', None), False),
+        ('main.api_venue', 'GET', lambda: ('/api/venues/{}'.format(venue()), None), False),
+        ('main.api_artist', 'GET', lambda: ('/api/artists/{}'.format(artist()), None), False),
+        ('main.api_show', 'GET', lambda: ('/api/shows/{}'.format(rng.randint(1, shows)), None), False),
+        ('main.export_download', 'GET', lambda: ('/export/shows.csv', None), True),
+    ]
+
+
+# ----------------------------------------------------------------------------#
+# Measurements.
+# ----------------------------------------------------------------------------#
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def peak_rss_kb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # linux reports kilobytes , macOS bytes
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+def rss_kb():
+    # current resident set size , the peak only ever grows so it cannot tell routes apart. None without /proc
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') // 1024
+    except (OSError, ValueError):
+        return None
+
+
+def run_scenario(flask_app, method, request_factory, count, clients, query_counter, headers):
+    timings = []
+    statuses = set()
+
+    def run_client(requests):
+        client = flask_app.test_client()
+        for _ in range(requests):
+            url, data = request_factory()
+            started = time.perf_counter()
+            response = client.open(url, method=method, data=data, headers=headers)
+            response.get_data()
+            timings.append(time.perf_counter() - started)
+            statuses.add(response.status_code)
+            response.close()
+
+    queries_before = query_counter[0]
+    rss_before = rss_kb()
+    started = time.perf_counter()
+    threads = [threading.Thread(target=run_client, args=(count // clients + (number < count % clients),))
+               for number in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    rss_after = rss_kb()
+    return {'method': method,
+            'requests': count,
+            'clients': clients,
+            'status': sorted(statuses),
+            'p50_ms': round(percentile(timings, 0.50) * 1000, 3),
+            'p95_ms': round(percentile(timings, 0.95) * 1000, 3),
+            'p99_ms': round(percentile(timings, 0.99) * 1000, 3),
+            'mean_ms': round(sum(timings) / count * 1000, 3),
+            'requests_per_second': round(count / elapsed, 1),
+            'queries_per_request': round((query_counter[0] - queries_before) / count, 2),
+            'rss_kb': rss_after,
+            'rss_delta_kb': None if rss_after is None else rss_after - rss_before}
+
+
+def regressions(result, baseline, max_regression, min_delta_ms):
+    found = []
+    for endpoint, route in result['routes'].items():
+        before = baseline['routes'].get(endpoint)
+        if before is None:
+            continue
+        if route['p95_ms'] > before['p95_ms'] * (1 + max_regression) and route['p95_ms'] - before['p95_ms'] > min_delta_ms:
+            found.append('{} p95 {} ms -> {} ms'.format(endpoint, before['p95_ms'], route['p95_ms']))
+        if route['queries_per_request'] > before['queries_per_request'] + 0.5:
+            found.append('{} queries per request {} -> {}'.format(
+                endpoint, before['queries_per_request'], route['queries_per_request']))
+    return found
+
+
+# ----------------------------------------------------------------------------#
+# Command.
+# ----------------------------------------------------------------------------#
+
+@click.command()
+@click.option('--venues', default=10000, show_default=True)
+@click.option('--artists', default=50000, show_default=True)
+@click.option('--shows', default=1000000, show_default=True)
+@click.option('--requests', 'request_count', default=50, show_default=True, help='Requests per route.')
+@click.option('--heavy-requests', default=3, show_default=True, help='Requests per route streaming a whole table.')
+@click.option('--clients', default=1, show_default=True, help='Concurrent clients sending the requests of a route.')
+@click.option('--seed', default=1, show_default=True)
+@click.option('--database-url', help='Benchmark this database instead of a copy of a seeded sqlite file , it is '
+                                     'seeded when empty and changed by the write scenarios.')
+@click.option('--set', 'overrides', multiple=True, metavar='KEY=VALUE',
+              help='Config override , e.g. --set DB_QUERY_CONCURRENCY=1 , values are parsed as JSON when they can be.')
+@click.option('--cache-dir', default=os.path.join('benchmarks', 'data'), show_default=True,
+              help='Seeded databases are kept here and copied for every run.')
+@click.option('--output', type=click.Path(dir_okay=False), help='Defaults to benchmarks/results/<time>.json.')
+@click.option('--baseline', type=click.Path(dir_okay=False), help='Earlier result to compare against.')
+@click.option('--max-regression', default=0.25, show_default=True, help='Allowed relative p95 slowdown.')
+@click.option('--min-delta-ms', default=2.0, show_default=True, help='Slowdowns below this are noise.')
+def bench(venues, artists, shows, request_count, heavy_requests, clients, seed, database_url, overrides, cache_dir, output,
+          baseline, max_regression, min_delta_ms):
+    """Seed a SQLite database and benchmark every route against it."""
+    reserved = request_count * 11
+    if min(venues, artists) <= 2 * reserved:
+        raise click.UsageError('need more than {} venues and artists for {} requests per route'.format(
+            2 * reserved, request_count))
+
+    config = {'WTF_CSRF_ENABLED': False, 'EXPORT_TOKEN': 'bench'}
+    for override in overrides:
+        key, _, value = override.partition('=')
+        try:
+            config[key] = json.loads(value)
+        except ValueError:
+            config[key] = value
+
+    # shows are generated around today , so a seeded database is reused for the rest of the day
+    anchor = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    workdir = tempfile.mkdtemp(prefix='fyyur-bench-')
+    if database_url:
+        seeded = None
+    else:
+        os.makedirs(cache_dir, exist_ok=True)
+        seeded = os.path.abspath(os.path.join(cache_dir, 'fyyur-{}-{}-{}-{}-{:%Y%m%d}.db'.format(
+            venues, artists, shows, seed, anchor)))
+        database_url = 'sqlite:///' + os.path.join(workdir, 'fyyur.db')
+    os.environ['DATABASE_URL'] = database_url
+    os.environ['FYYUR_SQL_INSTRUMENTATION'] = '0'
+    import app as fyyur
+    from sqlalchemy import event
+
+    def seed_into(url):
+        click.echo('seeding {} venues , {} artists and {} shows'.format(venues, artists, shows))
+        started = time.perf_counter()
+        seed_app = fyyur.create_app(dict(config, SQLALCHEMY_DATABASE_URI=url))
+        with seed_app.app_context():
+            fyyur.db.create_all()
+            fyyur.genre_catalog.invalidate()
+            if not fyyur.Venue.query.first():
+                fyyur.seed_database(venues, artists, shows, seed=seed, anchor=anchor, batch_size=50000)
+            fyyur.db.session.remove()
+            fyyur.db.engine.dispose()
+        return round(time.perf_counter() - started, 1)
+
+    seed_seconds = None
+    if seeded is None:
+        seed_seconds = seed_into(database_url)
+    else:
+        if not os.path.exists(seeded):
+            seed_seconds = seed_into('sqlite:///' + seeded + '.tmp')
+            os.replace(seeded + '.tmp', seeded)
+        shutil.copy(seeded, database_url[len('sqlite:///'):])
+
+    token = config['EXPORT_TOKEN']
+    flask_app = fyyur.create_app(dict(config, SQLALCHEMY_DATABASE_URI=database_url))
+    query_counter = [0]
+    routes = {}
+    try:
+        with flask_app.app_context():
+            fyyur.genre_catalog.invalidate()
+            genre_ids = [genre_id for genre_id, _ in fyyur.genre_catalog.get_choices()]
+
+            count_lock = threading.Lock()
+
+            @event.listens_for(fyyur.db.engine, 'after_cursor_execute')
+            def count_query(*args):
+                with count_lock:
+                    query_counter[0] += 1
+
+        rng = random.Random(seed)
+        headers = {'Authorization': 'Bearer ' + token}
+        benchmarked = set()
+        for endpoint, method, request_factory, heavy in scenarios(venues, artists, shows, reserved, genre_ids, rng):
+            count = heavy_requests if heavy else request_count
+            routes[endpoint] = run_scenario(flask_app, method, request_factory, count, min(clients, count), query_counter,
+                                            headers)
+            benchmarked.add((endpoint, method))
+            rss_delta = routes[endpoint]['rss_delta_kb']
+            click.echo('{:34} {:>9.2f} {:>9.2f} {:>9.2f} ms {:>8.1f} req/s {:>6.1f} queries {:>9} kB  status {}'.format(
+                endpoint, routes[endpoint]['p50_ms'], routes[endpoint]['p95_ms'], routes[endpoint]['p99_ms'],
+                routes[endpoint]['requests_per_second'], routes[endpoint]['queries_per_request'],
+                '-' if rss_delta is None else '{:+d}'.format(rss_delta), routes[endpoint]['status']))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    missing = sorted('{} {}'.format(rule.endpoint, method) for rule in flask_app.url_map.iter_rules()
+                     if rule.endpoint != 'static'
+                     for method in rule.methods - {'HEAD', 'OPTIONS'} if (rule.endpoint, method) not in benchmarked)
+    for route in missing:
+        click.echo('not benchmarked: ' + route, err=True)
+
+    result = {'created_at': datetime.utcnow().isoformat(timespec='seconds'),
+              'python': platform.python_version(),
+              'machine': platform.machine(),
+              'sizes': {'venues': venues, 'artists': artists, 'shows': shows},
+              'dialect': database_url.split(':', 1)[0],
+              'clients': clients,
+              'config': {key: value for key, value in config.items() if key != 'EXPORT_TOKEN'},
+              'seed': seed,
+              'seed_seconds': seed_seconds,
+              'peak_rss_kb': peak_rss_kb(),
+              'routes': routes}
+    if not output:
+        output = os.path.join('benchmarks', 'results', datetime.utcnow().strftime('%Y%m%dT%H%M%SZ') + '.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as result_file:
+        json.dump(result, result_file, indent=2, sort_keys=True)
+    click.echo('peak rss {} kB , results written to {}'.format(result['peak_rss_kb'], output))
+
+    if baseline and not os.path.exists(baseline):
+        # the first run on a machine has nothing to compare with , its result can become the baseline
+        click.echo('no baseline at {} , skipping the comparison. Copy {} there to compare later runs against it'.format(
+            baseline, output), err=True)
+    elif baseline:
+        with open(baseline) as baseline_file:
+            before = json.load(baseline_file)
+        if before['sizes'] != result['sizes']:
+            click.echo('baseline was measured on {} , not comparable'.format(before['sizes']), err=True)
+            sys.exit(2)
+        found = regressions(result, before, max_regression, min_delta_ms)
+        for regression in found:
+            click.echo('regression: ' + regression, err=True)
+        if found:
+            sys.exit(1)
+        click.echo('no regressions against ' + baseline)
+
+
+if __name__ == '__main__':
+    bench()
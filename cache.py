@@ -0,0 +1,106 @@
+import threading
+import time
+from collections import OrderedDict
+
+# ----------------------------------------------------------------------------#
+# Bounded in-process cache.
+# ----------------------------------------------------------------------------#
+
+
+class LRUCache:
+    """Thread-safe least recently used cache with per-entry expiry.
+
+    Every entry expires ``ttl`` seconds after it was set unless an earlier ``expires_at`` timestamp is given.
+    Once ``max_size`` entries are held , setting a new key evicts the least recently used one.
+    """
+
+    def __init__(self, max_size=1024, ttl=300):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at > time.time():
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self.entries[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value, expires_at=None):
+        deadline = time.time() + self.ttl
+        if expires_at is not None:
+            deadline = min(deadline, expires_at)
+        with self.lock:
+            self.entries[key] = (value, deadline)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        with self.lock:
+            return {'size': len(self.entries), 'max_size': self.max_size,
+                    'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
+
+
+class ReadThroughCache:
+    """Read-through cache in front of a loader that fetches many records by key in one query.
+
+    ``load_many`` receives the keys that missed the cache and returns a dict of the records it found ,
+    keys it did not return are not cached. Writers keep the cache current with ``put`` and ``invalidate``. ``fresh``
+    loads every key and leaves the cache as it is.
+    """
+
+    def __init__(self, load_many, max_size=4096, ttl=60):
+        self.load_many = load_many
+        self.cache = LRUCache(max_size=max_size, ttl=ttl)
+
+    def get(self, key, fresh=False):
+        return self.get_many([key], fresh).get(key)
+
+    def get_many(self, keys, fresh=False):
+        if fresh:
+            return self.load_many(list(dict.fromkeys(keys)))
+        found = {}
+        missing = []
+        for key in dict.fromkeys(keys):
+            value = self.cache.get(key)
+            if value is None:
+                missing.append(key)
+            else:
+                found[key] = value
+        if missing:
+            for key, value in self.load_many(missing).items():
+                self.cache.set(key, value)
+                found[key] = value
+        return found
+
+    def put(self, key, value):
+        self.cache.set(key, value)
+
+    def invalidate(self, key):
+        self.cache.delete(key)
+
+    def clear(self):
+        self.cache.clear()
+
+    def stats(self):
+        return self.cache.stats()
@@ -5,11 +5,21 @@ from fabric.contrib.console import confirm
 
 
 def test():
+    local("python -m pytest -q tests")
+    bench()
+
+
+# route benchmark , fails when a route got slower or runs more queries than in benchmarks/baseline.json , the comparison
+# is skipped until a result was copied there
+
+
+def bench():
     with settings(warn_only=True):
         result = local(
-            "python test_tasks.py -v && python test_users.py -v", capture=True
+            "python bench.py --venues 2000 --artists 5000 --shows 100000"
+            " --output benchmarks/results/latest.json --baseline benchmarks/baseline.json", capture=True
         )
-    if result.failed and not confirm("Tests failed. Continue?"):
+    if result.failed and not confirm("Benchmark regressed. Continue?"):
         abort("Aborted at user request.")
 
 
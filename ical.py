@@ -0,0 +1,59 @@
+# ----------------------------------------------------------------------------#
+# iCalendar (RFC 5545) serialization.
+# ----------------------------------------------------------------------------#
+
+CRLF = '\r\n'
+LINE_OCTETS = 75
+
+
+def escape_text(value):
+    return str(value).replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,').replace('\r\n', '\\n') \
+        .replace('\n', '\\n')
+
+
+def format_utc(value):
+    """A naive utc datetime as an iCalendar UTC date-time , e.g. ``20210601T200000Z``."""
+    return value.strftime('%Y%m%dT%H%M%SZ')
+
+
+def content_line(name, value):
+    """One ``NAME:value`` line , folded so no line is longer than 75 octets."""
+    line = (name + ':' + value).encode('utf-8')
+    folded = []
+    while len(line) > LINE_OCTETS:
+        cut = LINE_OCTETS if not folded else LINE_OCTETS - 1
+        # never split a multi byte character , continuation bytes look like 0b10xxxxxx
+        while line[cut] & 0xC0 == 0x80:
+            cut -= 1
+        folded.append(line[:cut])
+        line = line[cut:]
+    folded.append(line)
+    return (CRLF + ' ').join(part.decode('utf-8') for part in folded) + CRLF
+
+
+def calendar_header(name, product_id='-//Fyyur//Shows//EN'):
+    return ''.join([content_line('BEGIN', 'VCALENDAR'),
+                    content_line('VERSION', '2.0'),
+                    content_line('PRODID', product_id),
+                    content_line('CALSCALE', 'GREGORIAN'),
+                    content_line('METHOD', 'PUBLISH'),
+                    content_line('X-WR-CALNAME', escape_text(name))])
+
+
+def calendar_footer():
+    return content_line('END', 'VCALENDAR')
+
+
+def event(uid, start, end, stamp, summary, location=None, url=None):
+    lines = [content_line('BEGIN', 'VEVENT'),
+             content_line('UID', uid),
+             content_line('DTSTAMP', format_utc(stamp)),
+             content_line('DTSTART', format_utc(start)),
+             content_line('DTEND', format_utc(end)),
+             content_line('SUMMARY', escape_text(summary))]
+    if location:
+        lines.append(content_line('LOCATION', escape_text(location)))
+    if url:
+        lines.append(content_line('URL', url))
+    lines.append(content_line('END', 'VEVENT'))
+    return ''.join(lines)
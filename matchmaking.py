@@ -0,0 +1,264 @@
+import threading
+import time
+from functools import partial
+
+import numpy as np
+
+from search import start_thread
+
+# ----------------------------------------------------------------------------#
+# Artist and venue matchmaking.
+# ----------------------------------------------------------------------------#
+
+# a match needs at least one shared genre , it scores the jaccard similarity of both genre sets plus a bonus for
+# playing close to home
+SAME_CITY_SCORE = 0.5
+SAME_STATE_SCORE = 0.25
+
+# upper bound of the scores held in memory at once by a batch run , in cells of the query x candidate matrix
+BLOCK_CELLS = 1 << 22
+
+# ranking keys of _top , ids fit in the low 32 bits
+SCORE_BITS = np.int64(0x7fffffff)
+ID_MASK = np.int64(0xffffffff)
+NO_MATCH = np.iinfo(np.int64).max
+
+# set bits of every 16 bit value , looked up a quarter word at a time
+POPCOUNT = np.array([bin(value).count('1') for value in range(1 << 16)], dtype=np.uint8)
+
+
+def popcount(words):
+    """Set bits of every bitset , ``words`` is a ``(..., words)`` uint64 array."""
+    words = np.ascontiguousarray(words)
+    return POPCOUNT[words.view(np.uint16)].reshape(words.shape[:-1] + (-1,)).sum(axis=-1, dtype=np.int32)
+
+
+def genre_bitsets(genre_id_lists, word_count):
+    bitsets = np.zeros((len(genre_id_lists), word_count), dtype=np.uint64)
+    for row, genre_ids in enumerate(genre_id_lists):
+        for genre_id in genre_ids:
+            if genre_id < word_count * 64:
+                bitsets[row, genre_id // 64] |= np.uint64(1 << (genre_id % 64))
+    return bitsets
+
+
+def bitset_genres(bitset):
+    return [word * 64 + bit for word, value in enumerate(bitset.tolist()) for bit in range(64) if value >> bit & 1]
+
+
+class MatchSide:
+    """The seeking venues or artists as arrays , grouped by profile.
+
+    Entities with the same genres in the same city score the same against anyone , so they form one group and scoring
+    runs over the groups. Every group holds the code of its genre bitset , city and state , and its members are
+    ``ids[starts[group]:starts[group + 1]]`` in ascending order.
+    """
+
+    def __init__(self, ids, starts, bitset_codes, bitsets, genre_counts, cities, states):
+        self.ids = ids
+        self.starts = starts
+        self.bitset_codes = bitset_codes
+        self.bitsets = bitsets
+        self.genre_counts = genre_counts
+        self.cities = cities
+        self.states = states
+        # groups of every state , the only ones a locality bonus applies to
+        order = np.argsort(states, kind='stable')
+        bounds = np.flatnonzero(np.diff(states[order])) + 1
+        self.state_groups = {int(states[groups[0]]): groups for groups in np.split(order, bounds) if len(groups)}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def members(self, group, limit):
+        return self.ids[self.starts[group]:min(self.starts[group + 1], self.starts[group] + limit)]
+
+
+class MatchIndex:
+    """Scores seeking artists against seeking venues by shared genres and locality , held in memory as NumPy arrays.
+
+    ``load_artists`` and ``load_venues`` yield ``(id, city, state, genre_ids)`` of the seeking entities. The index loads
+    itself on first use. Once it is older than ``max_age`` seconds , so a worker sees entities that start or stop
+    seeking , or change genres , at most about that late , it is reloaded by ``spawn`` in the background while matches
+    keep using the previous load.
+    """
+
+    def __init__(self, load_artists, load_venues, max_age=300, spawn=start_thread):
+        self.loaders = {'artist': load_artists, 'venue': load_venues}
+        self.max_age = max_age
+        self.spawn = spawn
+        self.lock = threading.Lock()
+        self.loaded_at = None
+        # sides , place codes and bitset width are swapped together on reload
+        self.loaded = None
+        self.reloading = False
+        self.generation = 0
+
+    @staticmethod
+    def _place(places, city, state, add=True):
+        # cities are only compared within their state , codes are handed out while loading , a place the index has
+        # not seen matches nothing
+        state = (state or '').strip().lower()
+        city = (city or '').strip().lower()
+        if not add:
+            return places.get((state, city), -1), places.get(state, -1)
+        state_code = places.setdefault(state, len(places))
+        city_code = places.setdefault((state, city), len(places))
+        return city_code, state_code
+
+    def _build(self, rows, places, word_count):
+        bitset_codes = {}
+        groups = {}
+        for entity_id, city, state, genre_ids in rows:
+            bitset_code = bitset_codes.setdefault(tuple(sorted(set(genre_ids))), len(bitset_codes))
+            groups.setdefault((bitset_code,) + self._place(places, city, state), []).append(entity_id)
+        members = [sorted(ids) for ids in groups.values()]
+        genre_sets = list(bitset_codes)
+        profiles = np.array(list(groups), dtype=np.int32).reshape(-1, 3)
+        return MatchSide(ids=np.array([entity_id for ids in members for entity_id in ids], dtype=np.int64),
+                         starts=np.cumsum([0] + [len(ids) for ids in members]),
+                         bitset_codes=profiles[:, 0], bitsets=genre_bitsets(genre_sets, word_count),
+                         genre_counts=np.array([len(genre_set) for genre_set in genre_sets], dtype=np.int32),
+                         cities=profiles[:, 1], states=profiles[:, 2])
+
+    def _load(self):
+        rows = {kind: list(loader()) for kind, loader in self.loaders.items()}
+        highest = max([genre_id for side in rows.values() for _, _, _, genre_ids in side for genre_id in genre_ids],
+                      default=0)
+        word_count = highest // 64 + 1
+        places = {}
+        sides = {kind: self._build(side, places, word_count) for kind, side in rows.items()}
+        return sides, places, word_count
+
+    def _ensure_loaded(self):
+        with self.lock:
+            if self.loaded is None:
+                # nothing to serve yet , the first load is waited for
+                self.loaded = self._load()
+                self.loaded_at = time.monotonic()
+            elif not self.reloading and (self.loaded_at is None or time.monotonic() - self.loaded_at >= self.max_age):
+                self.reloading = True
+                self.spawn(partial(self._reload, self.generation))
+            return self.loaded
+
+    def _reload(self, generation):
+        # ``generation`` is the one that spawned the reload , a clear since makes its result stale
+        started_at = time.monotonic()
+        try:
+            loaded = self._load()
+        except Exception:
+            with self.lock:
+                # retried once the previous load is ``max_age`` old again
+                if generation == self.generation:
+                    self.reloading = False
+                    self.loaded_at = started_at
+            raise
+        with self.lock:
+            if generation == self.generation:
+                self.loaded = loaded
+                self.loaded_at = started_at
+                self.reloading = False
+
+    def invalidate(self):
+        """Reload in the background on the next match."""
+        with self.lock:
+            self.loaded_at = None
+
+    def clear(self):
+        """Drop the index , the next match loads it again before it answers."""
+        with self.lock:
+            self.loaded = None
+            self.loaded_at = None
+            self.reloading = False
+            self.generation += 1
+
+    def genre_scores(self, bitsets, genre_counts, side):
+        """Jaccard similarity of every query bitset with every bitset of ``side`` , zero without a shared genre."""
+        shared = popcount(bitsets[:, None, :] & side.bitsets[None, :, :])
+        union = genre_counts[:, None] + side.genre_counts[None, :] - shared
+        return np.where(shared > 0, shared / np.maximum(union, 1), 0).astype(np.float32)
+
+    def _scores(self, genre_scores, side, cities, states):
+        # score of every query against every group of ``side`` , the locality bonus is only added within the blocks of
+        # queries and groups sharing a state , and city codes are unique across states
+        scores = genre_scores[:, side.bitset_codes]
+        for state in np.unique(states).tolist():
+            groups = side.state_groups.get(state)
+            if groups is None:
+                continue
+            queries = np.flatnonzero(states == state)
+            block = scores[np.ix_(queries, groups)]
+            locality = np.where(side.cities[groups][None, :] == cities[queries][:, None],
+                                np.float32(SAME_CITY_SCORE), np.float32(SAME_STATE_SCORE))
+            block += locality * (block > 0)
+            scores[np.ix_(queries, groups)] = block
+        return scores
+
+    def _top(self, scores, side, limit):
+        # members of the best scoring groups of every query , up to ``limit`` , the highest score first and the lowest
+        # id first among equal scores. Every candidate is ranked by one int64 key , the float32 bits of its score
+        # inverted in the high half and its id in the low half , a zero score ranks last
+        if not limit or not scores.shape[1]:
+            return [[] for _ in range(scores.shape[0])]
+        score_keys = SCORE_BITS - scores.view(np.int32).astype(np.int64)
+        score_keys <<= 32
+        # a group whose first member does not make the top ``limit`` entities has ``limit`` better groups before it ,
+        # so the best ``limit`` groups by score and first id hold every result
+        group_keys = score_keys | side.ids[side.starts[:-1]]
+        group_limit = min(limit, scores.shape[1])
+        if group_limit < scores.shape[1]:
+            groups = np.argpartition(group_keys, group_limit - 1, axis=1)[:, :group_limit]
+        else:
+            groups = np.broadcast_to(np.arange(scores.shape[1]), scores.shape)
+        positions = side.starts[groups][..., None] + np.arange(limit)
+        members = side.ids[np.minimum(positions, len(side.ids) - 1)]
+        keys = np.where(positions < side.starts[groups + 1][..., None],
+                        np.take_along_axis(score_keys, groups, axis=1)[..., None] | members, NO_MATCH)
+        keys = keys.reshape(len(keys), -1)
+        order = np.argsort(keys, axis=1)[:, :limit]
+        keys = np.take_along_axis(keys, order, axis=1)
+        groups = np.take_along_axis(groups, order // limit, axis=1)
+        found = np.take_along_axis(scores, groups, axis=1)
+        found[keys == NO_MATCH] = 0
+        counts = np.count_nonzero(found > 0, axis=1).tolist()
+        return [list(zip(row_ids[:count], row_scores[:count], row_codes[:count]))
+                for row_ids, row_scores, row_codes, count in zip((keys & ID_MASK).tolist(), found.tolist(),
+                                                                 side.bitset_codes[groups].tolist(), counts)]
+
+    def matches(self, kind, city, state, genre_ids, limit=10):
+        """Best seeking entities of ``kind`` for one venue or artist , as ``(id, score, shared_genre_ids)``."""
+        sides, places, word_count = self._ensure_loaded()
+        side = sides[kind]
+        if not len(side) or not genre_ids:
+            return []
+        genre_ids = set(genre_ids)
+        city_code, state_code = self._place(places, city, state, add=False)
+        bitset = genre_bitsets([genre_ids], word_count)
+        genre_scores = self.genre_scores(bitset, np.array([len(genre_ids)], dtype=np.int32), side)
+        scores = self._scores(genre_scores, side, np.array([city_code]), np.array([state_code]))
+        return [(entity_id, round(score, 4), bitset_genres(side.bitsets[code] & bitset[0]))
+                for entity_id, score, code in self._top(scores, side, limit)[0]]
+
+    def batch(self, kind, limit=10):
+        """Yield ``(id, [(match_id, score), ...])`` for every seeking entity of the other side against ``kind``.
+
+        Every group of the other side is scored once , in blocks of groups bounded by BLOCK_CELLS , and its result is
+        shared by all of its members. Genre scores are computed per block for the bitsets it holds , so memory stays
+        within the block however many genre sets either side has.
+        """
+        sides, _, _ = self._ensure_loaded()
+        side = sides[kind]
+        queries = sides['venue' if kind == 'artist' else 'artist']
+        if not len(side) or not len(queries):
+            return
+        block_size = max(1, BLOCK_CELLS // max(len(side.bitset_codes), limit * limit))
+        for start in range(0, len(queries.bitset_codes), block_size):
+            block = slice(start, start + block_size)
+            # genre scores of the bitsets this block uses , never more of them than the block has groups
+            codes, inverse = np.unique(queries.bitset_codes[block], return_inverse=True)
+            genre_scores = self.genre_scores(queries.bitsets[codes], queries.genre_counts[codes], side)
+            scores = self._scores(genre_scores[inverse.reshape(-1)], side, queries.cities[block], queries.states[block])
+            for group, matches in enumerate(self._top(scores, side, limit), start):
+                matches = [(match_id, round(score, 4)) for match_id, score, _ in matches]
+                for entity_id in queries.ids[queries.starts[group]:queries.starts[group + 1]].tolist():
+                    yield entity_id, matches
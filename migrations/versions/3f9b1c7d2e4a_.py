@@ -0,0 +1,47 @@
+"""add indexes for show lookups, directory ordering and name search
+
+Revision ID: 3f9b1c7d2e4a
+Revises: 214a51c2b220
+Create Date: 2026-10-18 10:12:31.402117
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '3f9b1c7d2e4a'
+down_revision = '214a51c2b220'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_Show_venue_id_start_time', 'Show', ['venue_id', 'start_time'], unique=False)
+    op.create_index('ix_Show_artist_id_start_time', 'Show', ['artist_id', 'start_time'], unique=False)
+    op.create_index('ix_Show_start_time', 'Show', ['start_time'], unique=False)
+    op.create_index('ix_venue_genres_genre_id', 'venue_genres', ['genre_id'], unique=False)
+    op.create_index('ix_artist_genres_genre_id', 'artist_genres', ['genre_id'], unique=False)
+    op.create_index('ix_Venue_state_city', 'Venue', ['state', 'city'], unique=False)
+    op.create_index('ix_Artist_name', 'Artist', ['name'], unique=False)
+
+    # name ilike '%term%' can only use a trigram index , which needs pg_trgm on postgres.
+    # other databases get no name index here , ix_Artist_name already serves prefix matches and ordering.
+    if op.get_context().dialect.name == 'postgresql':
+        op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        op.create_index('ix_Venue_name_trgm', 'Venue', ['name'], unique=False,
+                        postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'})
+        op.create_index('ix_Artist_name_trgm', 'Artist', ['name'], unique=False,
+                        postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'})
+
+
+def downgrade():
+    if op.get_context().dialect.name == 'postgresql':
+        op.drop_index('ix_Artist_name_trgm', table_name='Artist')
+        op.drop_index('ix_Venue_name_trgm', table_name='Venue')
+    op.drop_index('ix_Artist_name', table_name='Artist')
+    op.drop_index('ix_Venue_state_city', table_name='Venue')
+    op.drop_index('ix_artist_genres_genre_id', table_name='artist_genres')
+    op.drop_index('ix_venue_genres_genre_id', table_name='venue_genres')
+    op.drop_index('ix_Show_start_time', table_name='Show')
+    op.drop_index('ix_Show_artist_id_start_time', table_name='Show')
+    op.drop_index('ix_Show_venue_id_start_time', table_name='Show')
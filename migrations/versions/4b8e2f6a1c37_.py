@@ -0,0 +1,31 @@
+"""log the venues and artists a delete made stale to refresh-similar
+
+Revision ID: 4b8e2f6a1c37
+Revises: d41c8a2e7f95
+Create Date: 2026-10-19 09:12:37.418205
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4b8e2f6a1c37'
+down_revision = 'd41c8a2e7f95'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('similar_stale',
+                    sa.Column('id', sa.Integer(), nullable=False),
+                    sa.Column('kind', sa.String(length=10), nullable=False),
+                    sa.Column('entity_id', sa.Integer(), nullable=False),
+                    sa.Column('marked_at', sa.DateTime(), nullable=False),
+                    sa.PrimaryKeyConstraint('id'))
+    op.create_index('ix_similar_stale_kind', 'similar_stale', ['kind'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_similar_stale_kind', table_name='similar_stale')
+    op.drop_table('similar_stale')
@@ -0,0 +1,37 @@
+"""cascade deletes of venues, artists and genres to their genre links
+
+Revision ID: 5e7a9b0c4d21
+Revises: 8c2d4e6f1a3b
+Create Date: 2026-10-18 16:02:47.530914
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '5e7a9b0c4d21'
+down_revision = '8c2d4e6f1a3b'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.drop_constraint('venue_genres_venue_id_fkey', 'venue_genres', type_='foreignkey')
+    op.drop_constraint('venue_genres_genre_id_fkey', 'venue_genres', type_='foreignkey')
+    op.drop_constraint('artist_genres_artist_id_fkey', 'artist_genres', type_='foreignkey')
+    op.drop_constraint('artist_genres_genre_id_fkey', 'artist_genres', type_='foreignkey')
+    op.create_foreign_key('venue_genres_venue_id_fkey', 'venue_genres', 'Venue', ['venue_id'], ['id'], ondelete='CASCADE')
+    op.create_foreign_key('venue_genres_genre_id_fkey', 'venue_genres', 'Genre', ['genre_id'], ['id'], ondelete='CASCADE')
+    op.create_foreign_key('artist_genres_artist_id_fkey', 'artist_genres', 'Artist', ['artist_id'], ['id'], ondelete='CASCADE')
+    op.create_foreign_key('artist_genres_genre_id_fkey', 'artist_genres', 'Genre', ['genre_id'], ['id'], ondelete='CASCADE')
+
+
+def downgrade():
+    op.drop_constraint('artist_genres_genre_id_fkey', 'artist_genres', type_='foreignkey')
+    op.drop_constraint('artist_genres_artist_id_fkey', 'artist_genres', type_='foreignkey')
+    op.drop_constraint('venue_genres_genre_id_fkey', 'venue_genres', type_='foreignkey')
+    op.drop_constraint('venue_genres_venue_id_fkey', 'venue_genres', type_='foreignkey')
+    op.create_foreign_key('artist_genres_genre_id_fkey', 'artist_genres', 'Genre', ['genre_id'], ['id'])
+    op.create_foreign_key('artist_genres_artist_id_fkey', 'artist_genres', 'Artist', ['artist_id'], ['id'])
+    op.create_foreign_key('venue_genres_genre_id_fkey', 'venue_genres', 'Genre', ['genre_id'], ['id'])
+    op.create_foreign_key('venue_genres_venue_id_fkey', 'venue_genres', 'Venue', ['venue_id'], ['id'])
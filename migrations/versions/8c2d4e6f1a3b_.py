@@ -0,0 +1,34 @@
+"""add updated_at to venues, artists and shows for incremental exports
+
+Revision ID: 8c2d4e6f1a3b
+Revises: 3f9b1c7d2e4a
+Create Date: 2026-10-18 14:40:09.118356
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8c2d4e6f1a3b'
+down_revision = '3f9b1c7d2e4a'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('Venue', sa.Column('updated_at', sa.DateTime(), server_default=sa.text('CURRENT_TIMESTAMP'), nullable=False))
+    op.add_column('Artist', sa.Column('updated_at', sa.DateTime(), server_default=sa.text('CURRENT_TIMESTAMP'), nullable=False))
+    op.add_column('Show', sa.Column('updated_at', sa.DateTime(), server_default=sa.text('CURRENT_TIMESTAMP'), nullable=False))
+    op.create_index('ix_Venue_updated_at', 'Venue', ['updated_at'], unique=False)
+    op.create_index('ix_Artist_updated_at', 'Artist', ['updated_at'], unique=False)
+    op.create_index('ix_Show_updated_at', 'Show', ['updated_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_Show_updated_at', table_name='Show')
+    op.drop_index('ix_Artist_updated_at', table_name='Artist')
+    op.drop_index('ix_Venue_updated_at', table_name='Venue')
+    op.drop_column('Show', 'updated_at')
+    op.drop_column('Artist', 'updated_at')
+    op.drop_column('Venue', 'updated_at')
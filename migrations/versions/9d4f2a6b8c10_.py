@@ -0,0 +1,42 @@
+"""add denormalized show counters to venues and artists
+
+Revision ID: 9d4f2a6b8c10
+Revises: 5e7a9b0c4d21
+Create Date: 2026-10-18 16:05:27.402118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9d4f2a6b8c10'
+down_revision = '5e7a9b0c4d21'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # start times are stored as naive utc
+    now = "(now() AT TIME ZONE 'utc')" if op.get_context().dialect.name == 'postgresql' else 'CURRENT_TIMESTAMP'
+    for table, key in (('Venue', 'venue_id'), ('Artist', 'artist_id')):
+        op.add_column(table, sa.Column('upcoming_shows_count', sa.Integer(), server_default='0', nullable=False))
+        op.add_column(table, sa.Column('past_shows_count', sa.Integer(), server_default='0', nullable=False))
+        op.add_column(table, sa.Column('next_show_at', sa.DateTime(), nullable=True))
+        op.create_index('ix_{}_next_show_at'.format(table), table, ['next_show_at'], unique=False)
+        # backfill , later runs of flask reconcile-show-counts recompute the same values
+        op.execute('UPDATE "{table}" SET '
+                   'upcoming_shows_count = (SELECT count(*) FROM "Show" WHERE "Show".{key} = "{table}".id '
+                   'AND "Show".start_time >= {now}), '
+                   'past_shows_count = (SELECT count(*) FROM "Show" WHERE "Show".{key} = "{table}".id '
+                   'AND "Show".start_time < {now}), '
+                   'next_show_at = (SELECT min("Show".start_time) FROM "Show" WHERE "Show".{key} = "{table}".id '
+                   'AND "Show".start_time >= {now})'.format(table=table, key=key, now=now))
+
+
+def downgrade():
+    for table in ('Artist', 'Venue'):
+        op.drop_index('ix_{}_next_show_at'.format(table), table_name=table)
+        op.drop_column(table, 'next_show_at')
+        op.drop_column(table, 'past_shows_count')
+        op.drop_column(table, 'upcoming_shows_count')
@@ -0,0 +1,36 @@
+"""reject overlapping venue and artist bookings on postgres
+
+Revision ID: b7e3c1f5a9d2
+Revises: 9d4f2a6b8c10
+Create Date: 2026-10-18 18:42:11.530917
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7e3c1f5a9d2'
+down_revision = '9d4f2a6b8c10'
+branch_labels = None
+depends_on = None
+
+# matches SHOW_DURATION_MINUTES , existing double bookings have to be resolved first , see flask double-bookings
+SHOW_DURATION_MINUTES = 120
+CONSTRAINTS = {'ex_Show_venue_slot': 'venue_id', 'ex_Show_artist_slot': 'artist_id'}
+
+
+def upgrade():
+    if op.get_context().dialect.name != 'postgresql':
+        return
+    op.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+    for name, key in CONSTRAINTS.items():
+        op.execute('ALTER TABLE "Show" ADD CONSTRAINT "{}" EXCLUDE USING gist ({} WITH =, '
+                   "tsrange(start_time, start_time + interval '{:d} minutes') WITH &&)".format(
+                       name, key, SHOW_DURATION_MINUTES))
+
+
+def downgrade():
+    if op.get_context().dialect.name != 'postgresql':
+        return
+    for name in CONSTRAINTS:
+        op.execute('ALTER TABLE "Show" DROP CONSTRAINT "{}"'.format(name))
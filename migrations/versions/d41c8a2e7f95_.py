@@ -0,0 +1,36 @@
+"""add precomputed similar venues and artists
+
+Revision ID: d41c8a2e7f95
+Revises: b7e3c1f5a9d2
+Create Date: 2026-10-18 20:15:44.207613
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd41c8a2e7f95'
+down_revision = 'b7e3c1f5a9d2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    for table, parent, key in (('similar_venues', 'Venue', 'venue_id'), ('similar_artists', 'Artist', 'artist_id')):
+        op.create_table(table,
+                        sa.Column(key, sa.Integer(), nullable=False),
+                        sa.Column('rank', sa.Integer(), nullable=False),
+                        sa.Column('similar_id', sa.Integer(), nullable=False),
+                        sa.Column('score', sa.Float(), nullable=False),
+                        sa.Column('computed_at', sa.DateTime(), nullable=False),
+                        sa.ForeignKeyConstraint([key], [parent + '.id'], ondelete='CASCADE'),
+                        sa.ForeignKeyConstraint(['similar_id'], [parent + '.id'], ondelete='CASCADE'),
+                        sa.PrimaryKeyConstraint(key, 'rank'))
+        op.create_index('ix_{}_similar_id'.format(table), table, ['similar_id'], unique=False)
+
+
+def downgrade():
+    for table in ('similar_artists', 'similar_venues'):
+        op.drop_index('ix_{}_similar_id'.format(table), table_name=table)
+        op.drop_table(table)
@@ -0,0 +1,68 @@
+import heapq
+import re
+import threading
+from collections import Counter
+
+# ----------------------------------------------------------------------------#
+# Per request query statistics.
+# ----------------------------------------------------------------------------#
+
+STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+NUMBER_LITERAL = re.compile(r'\b\d+(?:\.\d+)?\b')
+PLACEHOLDER_LIST = re.compile(r'\(\s*(?:\?|%s|%\(\w+\)s)(?:\s*,\s*(?:\?|%s|%\(\w+\)s))*\s*\)')
+WHITESPACE = re.compile(r'\s+')
+
+
+def statement_shape(statement):
+    """Return the statement with literals and the length of IN lists blanked out.
+
+    Two statements with the same shape only differ in the values they look up , so many of them in one request are
+    usually a loop that should have been one query.
+    """
+    shape = STRING_LITERAL.sub('?', statement)
+    shape = NUMBER_LITERAL.sub('?', shape)
+    shape = PLACEHOLDER_LIST.sub('(?)', shape)
+    return WHITESPACE.sub(' ', shape).strip()
+
+
+class QueryStats:
+    """Counts , times and groups by shape the statements one request executes.
+
+    Only the ``keep_slowest`` slowest statements are kept , so a request running thousands of queries stays cheap to track.
+    Statements the request runs concurrently from other threads may be recorded at the same time.
+    """
+
+    def __init__(self, keep_slowest=5):
+        self.keep_slowest = keep_slowest
+        self.count = 0
+        self.total_time = 0.0
+        self.slowest = []
+        self.shapes = Counter()
+        self.lock = threading.Lock()
+
+    def record(self, statement, duration):
+        shape = statement_shape(statement)
+        with self.lock:
+            self.count += 1
+            self.total_time += duration
+            self.shapes[shape] += 1
+            entry = (duration, self.count, statement)
+            if len(self.slowest) < self.keep_slowest:
+                heapq.heappush(self.slowest, entry)
+            elif entry > self.slowest[0]:
+                heapq.heapreplace(self.slowest, entry)
+
+    def slowest_statements(self):
+        return [{'ms': round(duration * 1000, 2), 'statement': statement}
+                for duration, _, statement in sorted(self.slowest, reverse=True)]
+
+    def repeated_shapes(self, threshold):
+        """Shapes executed at least ``threshold`` times , the suspected N+1 loops of the request."""
+        return [{'count': count, 'statement': shape}
+                for shape, count in self.shapes.most_common() if count >= threshold]
+
+    def server_timing(self, request_time=None):
+        timings = ['db;dur={:.2f};desc="{} queries"'.format(self.total_time * 1000, self.count)]
+        if request_time is not None:
+            timings.append('app;dur={:.2f}'.format(request_time * 1000))
+        return ', '.join(timings)
@@ -0,0 +1,324 @@
+import heapq
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from datetime import datetime, timedelta
+from functools import partial
+from itertools import chain, islice
+
+# ----------------------------------------------------------------------------#
+# In-process search index.
+# ----------------------------------------------------------------------------#
+
+# upper bound of a name , every name starting with a term sorts below the term followed by it
+HIGHEST_CHARACTER = '\U0010ffff'
+
+# rows changed this long before the previous sync started are read again , so a write whose transaction committed
+# after that sync read its rows is not missed
+SYNC_OVERLAP = timedelta(minutes=1)
+
+# changes a sync applies per hold of the lock , searches run in between
+SYNC_BATCH = 10
+
+
+def name_grams(text):
+    # every substring of one to three letters , a term of up to three letters is looked up as is and a longer one
+    # through its trigrams
+    return {text[i:i + size] for size in (1, 2, 3) for i in range(len(text) - size + 1)}
+
+
+def term_grams(term):
+    return {term} if len(term) <= 3 else {term[i:i + 3] for i in range(len(term) - 2)}
+
+
+def start_thread(target):
+    threading.Thread(target=target, daemon=True).start()
+
+
+def remove_key(keys, key):
+    position = bisect_left(keys, key)
+    if position < len(keys) and keys[position] == key:
+        del keys[position]
+
+
+def merge_unique(key_lists):
+    # the keys of several sorted lists in order , each once
+    previous = None
+    for key in heapq.merge(*key_lists):
+        if key != previous:
+            yield key
+            previous = key
+
+
+class IndexData:
+    """Documents of one index load , every list holds ``(lower_name, doc_id)`` keys sorted in result order.
+
+    ``names`` holds every document , ``postings`` the documents whose name contains a gram and ``fields`` the
+    documents carrying a lowercased field value. ``documents`` maps every id to its key , name and field values.
+    """
+
+    def __init__(self):
+        self.documents = {}
+        self.names = []
+        self.postings = defaultdict(list)
+        self.fields = defaultdict(list)
+
+    @classmethod
+    def load(cls, rows):
+        data = cls()
+        for doc_id, name, fields in rows:
+            data._post(doc_id, name, fields, append=list.append)
+        for keys in chain([data.names], data.postings.values(), data.fields.values()):
+            keys.sort()
+        return data
+
+    def _post(self, doc_id, name, fields, append):
+        key = (name.lower(), doc_id)
+        fields = {field.lower() for field in fields if field}
+        self.documents[doc_id] = (key, name, fields)
+        append(self.names, key)
+        for gram in name_grams(key[0]):
+            append(self.postings[gram], key)
+        for field in fields:
+            append(self.fields[field], key)
+
+    def add(self, doc_id, name, fields):
+        self.remove(doc_id)
+        self._post(doc_id, name, fields, append=lambda keys, key: keys.insert(bisect_left(keys, key), key))
+
+    def remove(self, doc_id):
+        document = self.documents.pop(doc_id, None)
+        if document is None:
+            return
+        key, _, fields = document
+        remove_key(self.names, key)
+        for index, values in ((self.postings, name_grams(key[0])), (self.fields, fields)):
+            for value in values:
+                keys = index.get(value)
+                if keys is not None:
+                    remove_key(keys, key)
+                    if not keys:
+                        del index[value]
+
+
+class SearchIndex:
+    """Name search over one model , with a few extra searchable fields , held in memory.
+
+    A match on the name always ranks above a match on city , state or genre only , a name starting with the term above
+    a name containing it , and equal matches rank by name. Names starting with the term are one range of the sorted
+    names , names containing it are verified in name order from the shortest posting list of its grams , and fields
+    are matched against their distinct values. Only the first ``max_candidates`` keys of a posting list are verified
+    , ``total`` is extrapolated from them past that.
+
+    The index loads itself through ``loader`` , run by ``spawn`` in the background on first use , and ``search``
+    returns None until that load is in. Once it is older than ``max_age`` seconds , which bounds how stale a worker
+    gets when another process wrote the change , it syncs in the background: ``load_changes(since)`` returns the rows
+    changed since the previous sync and the ids of every document , and both are applied in small batches. Every
+    ``rebuild_age`` seconds , or on every sync without ``load_changes`` , it is reloaded through ``loader`` instead
+    while searches keep using the previous load. Either way the changes made meanwhile are replayed at the end.
+    """
+
+    def __init__(self, loader, load_changes=None, max_age=300, rebuild_age=86400, max_candidates=1000,
+                 spawn=start_thread):
+        self.loader = loader
+        self.load_changes = load_changes
+        self.max_age = max_age
+        self.rebuild_age = rebuild_age
+        self.max_candidates = max_candidates
+        self.spawn = spawn
+        self.lock = threading.Lock()
+        self.data = None
+        # monotonic start of the last sync or load , and of the last load , and the utc start of the last sync or load
+        self.loaded_at = None
+        self.rebuilt_at = None
+        self.synced_at = None
+        # changes made while a sync or load runs , replayed on the index at its end
+        self.changes = None
+        self.generation = 0
+
+    def _due(self):
+        # the background job to start , if any
+        if self.data is None:
+            return self._reload
+        now = time.monotonic()
+        if self.loaded_at is not None and now - self.loaded_at < self.max_age:
+            return None
+        if self.load_changes is None or now - self.rebuilt_at >= self.rebuild_age:
+            return self._reload
+        return self._sync
+
+    def _ensure_loaded(self):
+        if self.changes is None:
+            job = self._due()
+            if job is not None:
+                self.changes = []
+                # the job belongs to the current generation , a clear before it runs discards its result
+                self.spawn(partial(job, self.generation))
+        return self.data
+
+    @staticmethod
+    def _apply(data, changes):
+        for doc_id, name, fields in changes:
+            if name is None:
+                data.remove(doc_id)
+            else:
+                data.add(doc_id, name, fields)
+
+    def _failed(self, generation, started_at):
+        with self.lock:
+            # retried once the index is ``max_age`` old again , or on the next search before the first load
+            if generation == self.generation:
+                self.changes = None
+                self.loaded_at = started_at
+
+    def _finish(self, started_at, synced_at):
+        # called with the lock held
+        self._apply(self.data, self.changes)
+        self.changes = None
+        self.loaded_at = started_at
+        self.synced_at = synced_at
+
+    def _reload(self, generation):
+        started_at = time.monotonic()
+        synced_at = datetime.utcnow()
+        try:
+            data = IndexData.load(self.loader())
+        except Exception:
+            self._failed(generation, started_at)
+            raise
+        with self.lock:
+            if generation == self.generation:
+                self.data = data
+                self.rebuilt_at = started_at
+                self._finish(started_at, synced_at)
+
+    def _sync(self, generation):
+        started_at = time.monotonic()
+        synced_at = datetime.utcnow()
+        with self.lock:
+            if generation != self.generation:
+                return
+            since = self.synced_at - SYNC_OVERLAP
+        try:
+            rows, doc_ids = self.load_changes(since)
+            rows = list(rows)
+            doc_ids = set(doc_ids)
+        except Exception:
+            self._failed(generation, started_at)
+            raise
+        with self.lock:
+            if generation != self.generation:
+                return
+            indexed = list(self.data.documents)
+        # documents deleted by another process , a document this process added after ``doc_ids`` were read is removed
+        # here too , and added back when the changes made meanwhile are replayed
+        changes = [(doc_id, None, None) for doc_id in set(indexed).difference(doc_ids)] + rows
+        for start in range(0, len(changes), SYNC_BATCH):
+            with self.lock:
+                if generation != self.generation:
+                    return
+                self._apply(self.data, changes[start:start + SYNC_BATCH])
+        with self.lock:
+            if generation == self.generation:
+                self._finish(started_at, synced_at)
+
+    def add(self, doc_id, name, fields=()):
+        """Index a new document or replace the indexed text of an existing one."""
+        with self.lock:
+            if self.data is not None:
+                self.data.add(doc_id, name, fields)
+            if self.changes is not None:
+                self.changes.append((doc_id, name, fields))
+
+    def remove(self, doc_id):
+        with self.lock:
+            if self.data is not None:
+                self.data.remove(doc_id)
+            if self.changes is not None:
+                self.changes.append((doc_id, None, None))
+
+    def invalidate(self):
+        """Sync in the background on the next search."""
+        with self.lock:
+            self.loaded_at = None
+
+    def clear(self):
+        """Drop the index , the next search starts loading it again."""
+        with self.lock:
+            self.data = None
+            self.loaded_at = None
+            self.rebuilt_at = None
+            self.synced_at = None
+            self.changes = None
+            self.generation += 1
+
+    def _sample(self, keys, accept, wanted):
+        # verifies the first ``max_candidates`` of ``keys`` , returns how many were accepted out of how many checked ,
+        # the first ``wanted`` accepted keys and the last key checked
+        found = []
+        accepted = checked = 0
+        key = None
+        for key in islice(keys, self.max_candidates):
+            checked += 1
+            if accept(key):
+                accepted += 1
+                if len(found) < wanted:
+                    found.append(key)
+        return accepted, checked, found, key
+
+    def search(self, term, limit=50):
+        """Return ``(total, results)`` , the ``limit`` best ``{'id', 'name'}`` matches , None until first loaded."""
+        term = ' '.join(term.lower().split())
+        with self.lock:
+            data = self._ensure_loaded()
+            if data is None:
+                return None
+            if not term:
+                return len(data.names), self._results(data, data.names[:limit])
+
+            start = bisect_left(data.names, (term,))
+            prefix_total = bisect_left(data.names, (term + HIGHEST_CHARACTER,)) - start
+            found = data.names[start:start + min(prefix_total, limit)]
+
+            posting = min((data.postings.get(gram, ()) for gram in term_grams(term)), key=len)
+            # names starting with the term are one range of the posting as well , the rest contains the term elsewhere
+            start = bisect_left(posting, (term,))
+            end = bisect_left(posting, (term + HIGHEST_CHARACTER,))
+            others = chain(islice(posting, start), islice(posting, end, None))
+            size = len(posting) - (end - start)
+            if len(term) <= 3:
+                # the posting of the term itself holds exactly the names containing it
+                name_total = size
+                found += islice(others, limit - len(found))
+            else:
+                name_total, checked, matched, _ = self._sample(others, lambda key: term in key[0], limit - len(found))
+                if checked < size:
+                    name_total = int(size * name_total / checked)
+                found += matched
+
+            # documents matching on a field only , a document carrying several matching values is counted under the
+            # lowest of them
+            values = sorted(value for value in data.fields if term in value)
+            size = sum(len(data.fields[value]) for value in values)
+            keys = data.fields[values[0]] if len(values) == 1 else merge_unique(data.fields[value] for value in values)
+            keys = (key for key in islice(keys, self.max_candidates) if term not in key[0])
+            found += islice(keys, limit - len(found))
+            if size <= self.max_candidates:
+                field_total = sum(1 for name, _ in set(chain.from_iterable(data.fields[value] for value in values))
+                                  if term not in name)
+            else:
+                # counted on evenly spaced documents of every value
+                step = size // self.max_candidates
+                field_total = 0
+                lower_values = set()
+                for value in values:
+                    field_total += step * sum(1 for name, doc_id in data.fields[value][::step]
+                                              if term not in name and lower_values.isdisjoint(data.documents[doc_id][2]))
+                    lower_values.add(value)
+
+            return prefix_total + name_total + field_total, self._results(data, found)
+
+    @staticmethod
+    def _results(data, keys):
+        return [{'id': doc_id, 'name': data.documents[doc_id][1]} for _, doc_id in keys]
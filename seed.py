@@ -0,0 +1,155 @@
+import random
+from datetime import datetime, timedelta
+from itertools import accumulate
+
+# ----------------------------------------------------------------------------#
+# Deterministic synthetic data.
+# ----------------------------------------------------------------------------#
+
+CITIES = [('New York', 'NY'), ('Los Angeles', 'CA'), ('Chicago', 'IL'), ('Austin', 'TX'), ('Nashville', 'TN'),
+          ('San Francisco', 'CA'), ('Brooklyn', 'NY'), ('Seattle', 'WA'), ('New Orleans', 'LA'), ('Atlanta', 'GA'),
+          ('Denver', 'CO'), ('Portland', 'OR'), ('Boston', 'MA'), ('Miami', 'FL'), ('Philadelphia', 'PA'),
+          ('Minneapolis', 'MN'), ('Detroit', 'MI'), ('Houston', 'TX'), ('Phoenix', 'AZ'), ('Las Vegas', 'NV'),
+          ('San Diego', 'CA'), ('Oakland', 'CA'), ('Washington', 'DC'), ('Baltimore', 'MD'), ('Pittsburgh', 'PA'),
+          ('Kansas City', 'MO'), ('St. Louis', 'MO'), ('Memphis', 'TN'), ('Columbus', 'OH'), ('Salt Lake City', 'UT')]
+
+VENUE_WORDS = ['Hall', 'Room', 'Lounge', 'Club', 'Theatre', 'Tavern', 'Garden', 'Ballroom', 'Cellar', 'Stage']
+ARTIST_WORDS = ['Echoes', 'Riot', 'Velvet', 'Static', 'Harbor', 'Comet', 'Lantern', 'Wolves', 'Satellite', 'Honey']
+STREETS = ['Main Street', 'Market Street', 'Broadway', 'Elm Street', 'Folsom Street', 'Church Street', 'Water Street']
+
+# shows mostly start in the evening and cluster on Friday and Saturday , weights are indexed by weekday and hour
+WEEKDAY_WEIGHTS = [0.6, 0.6, 0.8, 1.0, 1.7, 1.8, 0.9]
+START_HOURS = [17, 18, 19, 20, 21, 22, 23]
+START_HOUR_WEIGHTS = [0.3, 0.8, 1.5, 2.0, 1.6, 0.8, 0.3]
+
+
+def zipf_cum_weights(count, exponent):
+    """Cumulative weights of ranks 1 to ``count`` under a Zipf law , rank ``k`` is picked with weight ``1 / k ** exponent``."""
+    return list(accumulate(1 / rank ** exponent for rank in range(1, count + 1)))
+
+
+class SyntheticData:
+    """Generates venue , artist , genre link and show rows from a fixed seed.
+
+    Popularity follows a Zipf law , ``exponent`` skews how many more shows the popular venues and artists get , and a
+    few cities and genres hold most venues and artists. Shows fall in the ``past_days`` before and the ``future_days`` after ``anchor`` , weighted
+    towards weekend evenings. The same arguments always produce the same rows , so ``anchor`` has to be pinned to
+    reproduce a dataset on another day.
+    """
+
+    def __init__(self, venue_ids, artist_ids, genre_ids, seed=1, exponent=0.7, past_days=365, future_days=180,
+                 anchor=None):
+        self.venue_ids = list(venue_ids)
+        self.artist_ids = list(artist_ids)
+        self.genre_ids = list(genre_ids)
+        self.seed = seed
+        self.exponent = exponent
+        self.past_days = past_days
+        self.future_days = future_days
+        self.anchor = anchor or datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+
+    def _random(self, stream):
+        # every kind of row has its own random stream , so changing one count does not reshuffle the other tables
+        return random.Random('{}:{}'.format(self.seed, stream))
+
+    def _by_popularity(self, ids, stream, exponent):
+        ranked = list(ids)
+        self._random(stream).shuffle(ranked)
+        return ranked, zipf_cum_weights(len(ranked), exponent)
+
+    def _places(self, rng, count):
+        cities = CITIES[:]
+        rng.shuffle(cities)
+        return rng.choices(cities, cum_weights=zipf_cum_weights(len(cities), 1), k=count)
+
+    def venues(self):
+        rng = self._random('venues')
+        places = self._places(rng, len(self.venue_ids))
+        for venue_id, (city, state) in zip(self.venue_ids, places):
+            seeking_talent = rng.random() < 0.3
+            yield {'id': venue_id, 'name': 'The {} {}'.format(rng.choice(ARTIST_WORDS), rng.choice(VENUE_WORDS)),
+                   'city': city, 'state': state,
+                   'address': '{} {}'.format(rng.randint(1, 9999), rng.choice(STREETS)),
+                   'phone': '{:03d}-{:03d}-{:04d}'.format(rng.randint(200, 999), rng.randint(200, 999), rng.randint(0, 9999)),
+                   'image_link': 'https://images.example.com/venues/{}.jpg'.format(venue_id),
+                   'facebook_link': 'https://www.facebook.com/venue{}'.format(venue_id),
+                   'website': 'https://venue{}.example.com'.format(venue_id),
+                   'seeking_talent': seeking_talent,
+                   'seeking_description': 'Looking for local acts' if seeking_talent else None}
+
+    def artists(self):
+        rng = self._random('artists')
+        places = self._places(rng, len(self.artist_ids))
+        for artist_id, (city, state) in zip(self.artist_ids, places):
+            seeking_venue = rng.random() < 0.3
+            yield {'id': artist_id, 'name': '{} {}'.format(rng.choice(ARTIST_WORDS), rng.choice(ARTIST_WORDS)),
+                   'city': city, 'state': state,
+                   'phone': '{:03d}-{:03d}-{:04d}'.format(rng.randint(200, 999), rng.randint(200, 999), rng.randint(0, 9999)),
+                   'image_link': 'https://images.example.com/artists/{}.jpg'.format(artist_id),
+                   'facebook_link': 'https://www.facebook.com/artist{}'.format(artist_id),
+                   'website': 'https://artist{}.example.com'.format(artist_id),
+                   'seeking_venue': seeking_venue,
+                   'seeking_description': 'Looking for shows' if seeking_venue else None}
+
+    def _genre_links(self, key, ids, stream):
+        rng = self._random(stream)
+        genres, cum_weights = self._by_popularity(self.genre_ids, 'genres', 1)
+        for entity_id in ids:
+            for genre_id in set(rng.choices(genres, cum_weights=cum_weights, k=rng.randint(1, 3))):
+                yield {key: entity_id, 'genre_id': genre_id}
+
+    def venue_genres(self):
+        return self._genre_links('venue_id', self.venue_ids, 'venue_genres')
+
+    def artist_genres(self):
+        return self._genre_links('artist_id', self.artist_ids, 'artist_genres')
+
+    def shows(self, show_ids, slot_minutes=120, chunk_size=10000):
+        """Yield one show per id , no venue or artist is booked twice within ``slot_minutes``.
+
+        Shows start on a grid of ``slot_minutes`` from 17:00 , a drawn venue , artist and slot that is already taken is
+        dropped and drawn again , so the most popular venues and artists fill up and the rest spill over to others.
+        """
+        rng = self._random('shows')
+        venues, venue_weights = self._by_popularity(self.venue_ids, 'venue_popularity', self.exponent)
+        artists, artist_weights = self._by_popularity(self.artist_ids, 'artist_popularity', self.exponent)
+        first_day = self.anchor - timedelta(days=self.past_days)
+        days = [first_day + timedelta(days=day) for day in range(self.past_days + self.future_days)]
+        day_weights = list(accumulate(WEEKDAY_WEIGHTS[day.weekday()] for day in days))
+        slots = [timedelta(minutes=minutes) for minutes in range(START_HOURS[0] * 60, 24 * 60, slot_minutes)]
+        slot_weights = list(accumulate(START_HOUR_WEIGHTS[slot.seconds // 3600 - START_HOURS[0]] for slot in slots))
+        slots_per_entity = len(days) * len(slots)
+        # one bit per venue or artist , day and slot
+        venue_positions = {venue_id: position for position, venue_id in enumerate(self.venue_ids)}
+        artist_positions = {artist_id: position for position, artist_id in enumerate(self.artist_ids)}
+        venue_booked = bytearray(len(venues) * slots_per_entity // 8 + 1)
+        artist_booked = bytearray(len(artists) * slots_per_entity // 8 + 1)
+        day_indexes = range(len(days))
+        slot_indexes = range(len(slots))
+
+        show_ids = iter(show_ids)
+        remaining = len(self.venue_ids) and len(self.artist_ids) and chunk_size
+        while remaining:
+            # values are drawn a chunk at a time , choices() with cumulative weights is far faster than one draw per row
+            chunk_venues = rng.choices(venues, cum_weights=venue_weights, k=chunk_size)
+            chunk_artists = rng.choices(artists, cum_weights=artist_weights, k=chunk_size)
+            chunk_days = rng.choices(day_indexes, cum_weights=day_weights, k=chunk_size)
+            chunk_slots = rng.choices(slot_indexes, cum_weights=slot_weights, k=chunk_size)
+            accepted = 0
+            for venue_id, artist_id, day, slot in zip(chunk_venues, chunk_artists, chunk_days, chunk_slots):
+                offset = day * len(slots) + slot
+                venue_bit = venue_positions[venue_id] * slots_per_entity + offset
+                artist_bit = artist_positions[artist_id] * slots_per_entity + offset
+                if venue_booked[venue_bit >> 3] & (1 << (venue_bit & 7)) or \
+                        artist_booked[artist_bit >> 3] & (1 << (artist_bit & 7)):
+                    continue
+                show_id = next(show_ids, None)
+                if show_id is None:
+                    return
+                venue_booked[venue_bit >> 3] |= 1 << (venue_bit & 7)
+                artist_booked[artist_bit >> 3] |= 1 << (artist_bit & 7)
+                accepted += 1
+                yield {'id': show_id, 'venue_id': venue_id, 'artist_id': artist_id, 'start_time': days[day] + slots[slot],
+                       'updated_at': self.anchor}
+            # every slot the popular venues and artists are drawn for is taken , stop short of the requested count
+            remaining = accepted
@@ -0,0 +1,206 @@
+import numpy as np
+
+from matchmaking import genre_bitsets, popcount
+
+# ----------------------------------------------------------------------------#
+# Similar venues and artists.
+# ----------------------------------------------------------------------------#
+
+# two venues (or two artists) are similar when they share genres and when they booked the same artists (or played the
+# same venues) , the score weighs the jaccard similarity of the genre sets and the cosine similarity of the bookings
+GENRE_WEIGHT = 0.5
+COBOOKING_WEIGHT = 0.5
+
+# scores are handed out rounded to 4 decimals
+SCORE_PRECISION = 0.0001
+
+
+def compressed_rows(rows):
+    """CSR layout of ``rows`` , a list of column index lists: row ``i`` holds ``indices[pointers[i]:pointers[i + 1]]``."""
+    pointers = np.zeros(len(rows) + 1, dtype=np.int64)
+    pointers[1:] = np.cumsum([len(row) for row in rows])
+    indices = np.fromiter((column for row in rows for column in row), dtype=np.int64, count=int(pointers[-1]))
+    return pointers, indices
+
+
+def flat_ranges(starts, counts):
+    """Every position of the ranges ``[starts[i], starts[i] + counts[i])`` , one range after the other."""
+    return np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+
+
+class SimilarityModel:
+    """Sparse genre and booking vectors of every venue or artist , scored against each other on demand.
+
+    ``genres`` maps every entity id to its genre ids and ``bookings`` lists the distinct ``(entity_id, counterpart_id)``
+    pairs of the Show table. Entities with the same genres share one genre set , which keeps its members in ascending
+    id , and an inverted index in CSR form lists the genre sets holding every genre , so genre scores are only ever
+    computed for the sets sharing a genre. Bookings are an entity x counterpart incidence matrix in CSR form together
+    with its transpose.
+    """
+
+    def __init__(self, genres, bookings):
+        self.ids = np.array(sorted(genres), dtype=np.int64)
+        positions = {entity_id: position for position, entity_id in enumerate(self.ids.tolist())}
+
+        genre_sets = {}
+        self.set_codes = np.array([genre_sets.setdefault(tuple(sorted(set(genres[entity_id]))), len(genre_sets))
+                                   for entity_id in self.ids.tolist()], dtype=np.int32)
+        self.genre_sets = list(genre_sets)
+        highest = max((genre_id for genre_set in self.genre_sets for genre_id in genre_set), default=0)
+        self.bitsets = genre_bitsets(self.genre_sets, highest // 64 + 1)
+        self.set_sizes = np.array([len(genre_set) for genre_set in self.genre_sets], dtype=np.int32)
+        holding = [[] for _ in range(highest + 1)]
+        for code, genre_set in enumerate(self.genre_sets):
+            for genre_id in genre_set:
+                holding[genre_id].append(code)
+        self.holding_pointers, self.holding = compressed_rows(holding)
+        members = [[] for _ in self.genre_sets]
+        for position, code in enumerate(self.set_codes.tolist()):
+            members[code].append(position)
+        self.member_pointers, self.members = compressed_rows(members)
+        self.member_counts = np.diff(self.member_pointers)
+        self.first_members = self.members[self.member_pointers[:-1]] if len(self.members) else self.members
+        # ranked prefixes of _nearest_sets , per genre set
+        self.nearest = {}
+
+        counterparts = {}
+        booked = [[] for _ in self.ids]
+        for entity_id, counterpart_id in bookings:
+            position = positions.get(entity_id)
+            if position is not None:
+                booked[position].append(counterparts.setdefault(counterpart_id, len(counterparts)))
+        self.booking_pointers, self.bookings = compressed_rows(booked)
+        self.booking_counts = np.diff(self.booking_pointers)
+        booked_by = [[] for _ in counterparts]
+        for position, row in enumerate(booked):
+            for counterpart in row:
+                booked_by[counterpart].append(position)
+        self.booked_by_pointers, self.booked_by = compressed_rows(booked_by)
+        self.positions = positions
+
+    def _genre_scores(self, code, codes):
+        # jaccard similarity of genre set ``code`` with every set of ``codes`` , zero without a shared genre
+        if not len(codes):
+            return np.empty(0, dtype=np.float32)
+        shared = popcount(self.bitsets[codes] & self.bitsets[code])
+        union = self.set_sizes[code] + self.set_sizes[codes] - shared
+        return np.where(shared > 0, shared / np.maximum(union, 1), 0).astype(np.float32)
+
+    def _sharing_sets(self, code):
+        # the genre sets sharing a genre with set ``code`` and their genre scores , counted from the postings
+        genre_ids = self.genre_sets[code]
+        if not genre_ids:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        sets, shared = np.unique(np.concatenate([self.holding[self.holding_pointers[genre_id]:
+                                                              self.holding_pointers[genre_id + 1]]
+                                                 for genre_id in genre_ids]), return_counts=True)
+        union = self.set_sizes[code] + self.set_sizes[sets] - shared
+        return sets, (shared / union).astype(np.float32)
+
+    def _nearest_sets(self, code, count):
+        # the genre sets sharing a genre with set ``code`` by descending score and lowest member first , with their
+        # weighted genre scores and running member totals , cut once they hold ``count`` members and the last score is
+        # complete. Prefixes are kept per set and only recomputed when a longer one is asked for
+        sets, scores, totals, covered = self.nearest.get(code, (None, None, None, 0))
+        if sets is None or covered < count:
+            sets, scores = self._sharing_sets(code)
+            complete = len(sets) <= 2 * count
+            if not complete:
+                # the first ``2 * count`` sets hold ``2 * count`` members , only they and their ties are ranked
+                kept = scores >= np.partition(scores, len(scores) - 2 * count)[len(scores) - 2 * count]
+                sets, scores = sets[kept], scores[kept]
+            order = np.lexsort((self.first_members[sets], -scores))
+            sets, scores = sets[order], GENRE_WEIGHT * scores[order]
+            totals = np.cumsum(self.member_counts[sets])
+            cut = np.searchsorted(totals, 2 * count)
+            if cut < len(sets):
+                # every set of the last score has a lower first member than the ones after it , so only the first
+                # ``2 * count`` sets of that score can hold the lowest ``2 * count`` members
+                tied = np.searchsorted(-scores, -scores[cut], side='left')
+                cut = min(np.searchsorted(-scores, -scores[cut], side='right'), max(cut + 1, tied + 2 * count))
+            covered = np.inf if complete and cut == len(sets) else 2 * count
+            sets, scores, totals = sets[:cut].copy(), scores[:cut].copy(), totals[:cut].copy()
+            self.nearest[code] = sets, scores, totals, covered
+        return sets, scores, totals
+
+    def _cobooked(self, position):
+        # entities sharing a counterpart with ``position`` and how many they share , one sparse row of A x A^T
+        counterparts = self.bookings[self.booking_pointers[position]:self.booking_pointers[position + 1]]
+        if not len(counterparts):
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        others = np.concatenate([self.booked_by[self.booked_by_pointers[counterpart]:self.booked_by_pointers[counterpart + 1]]
+                                 for counterpart in counterparts.tolist()])
+        others, shared = np.unique(others, return_counts=True)
+        cosine = shared / np.sqrt(float(len(counterparts)) * self.booking_counts[others])
+        return others, cosine.astype(np.float32)
+
+    def neighbours(self, entity_id, limit):
+        """The ``limit`` most similar entities as ``(id, score)`` , highest score first and lowest id among equals.
+
+        Only co-booked entities get a booking score , so the rest is ranked by genres alone: the lowest members of the
+        nearest genre sets are the only other candidates that can make the top ``limit`` , and only while their genre
+        score reaches the last of the best co-booked entities.
+        """
+        position = self.positions.get(entity_id)
+        if position is None:
+            return []
+        code = self.set_codes[position]
+        cobooked, cosine = self._cobooked(position)
+        wanted = limit + len(cobooked) + 1
+        others = cobooked[cobooked != position]
+        booked_scores = GENRE_WEIGHT * self._genre_scores(code, self.set_codes[others]) + \
+            COBOOKING_WEIGHT * cosine[cobooked != position]
+        best = np.lexsort((self.ids[others], -booked_scores))[:limit]
+        floor = booked_scores[best[-1]] if len(best) == limit else 0
+        sets, set_scores, totals = self._nearest_sets(code, wanted)
+        # the sets until ``wanted`` members are found , all sets of the last score as their lowest members interleave ,
+        # and only while they reach ``floor``
+        cut = np.searchsorted(totals, wanted)
+        if cut < len(sets):
+            cut = np.searchsorted(-set_scores, -set_scores[cut], side='right')
+        cut = min(cut, np.searchsorted(-set_scores, -floor, side='right'))
+        counts = np.minimum(self.member_counts[sets[:cut]], wanted)
+        genre_candidates = self.members[flat_ranges(self.member_pointers[sets[:cut]], counts)]
+        genre_scores = np.repeat(set_scores[:cut], counts)
+        # the co-booked ones among them are scored already , ``cobooked`` is sorted
+        listed = np.searchsorted(cobooked, genre_candidates)
+        scored = listed < len(cobooked)
+        scored[scored] = cobooked[listed[scored]] == genre_candidates[scored]
+        kept = (genre_candidates != position) & ~scored
+        candidates = np.concatenate([others[best], genre_candidates[kept]])
+        scores = np.concatenate([booked_scores[best], genre_scores[kept]])
+        order = np.lexsort((self.ids[candidates], -scores))[:limit]
+        return [(int(self.ids[candidates[index]]), round(float(scores[index]), 4)) for index in order if scores[index] > 0]
+
+    def listers(self, entity_ids, last_scores):
+        """Entities that may list one of ``entity_ids`` among their neighbours now , the ones scoring it at least as
+        high as the last neighbour they list.
+
+        ``last_scores`` maps an entity listing ``limit`` neighbours to the score of its last one , any other entity
+        has room left and lists whoever scores above zero with it. Only the genre sets sharing a genre and the
+        co-booked entities of every id are looked at , the members of every set are ordered by that score once.
+        """
+        thresholds = np.array([last_scores.get(entity_id, 0) - SCORE_PRECISION for entity_id in self.ids.tolist()],
+                              dtype=np.float32)
+        # members by set , and by threshold within their set , the keys stay ordered as ``code * 2 + threshold``
+        by_threshold = np.lexsort((thresholds, self.set_codes))
+        keys = self.set_codes[by_threshold] * 2.0 + thresholds[by_threshold]
+        found = np.zeros(len(self.ids), dtype=bool)
+        for entity_id in entity_ids:
+            position = self.positions.get(entity_id)
+            if position is None:
+                continue
+            code = self.set_codes[position]
+            sets, scores = self._sharing_sets(code)
+            # a member of a sharing set scores at least the genre score of its set
+            starts = self.member_pointers[sets]
+            ends = np.searchsorted(keys, sets * 2.0 + GENRE_WEIGHT * scores, side='right')
+            listing = by_threshold[flat_ranges(starts, ends - starts)]
+            cobooked, cosine = self._cobooked(position)
+            scores = GENRE_WEIGHT * self._genre_scores(code, self.set_codes[cobooked]) + COBOOKING_WEIGHT * cosine
+            cobooked = cobooked[(scores > 0) & (scores >= thresholds[cobooked])]
+            listed = found[position]
+            found[listing] = found[cobooked] = True
+            # no id lists itself , though another of ``entity_ids`` may list it
+            found[position] = listed
+        return self.ids[found].tolist()
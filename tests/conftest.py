@@ -0,0 +1,26 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+os.environ.setdefault('FYYUR_DB_STARTUP_CHECK', '0')
+
+import app as fyyur  # noqa: E402
+
+
+@pytest.fixture
+def flask_app(tmp_path):
+    flask_app = fyyur.create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + str(tmp_path / 'fyyur.db'),
+                                  'TESTING': True, 'WTF_CSRF_ENABLED': False})
+    with flask_app.app_context():
+        fyyur.db.create_all()
+        yield flask_app
+        fyyur.db.session.remove()
+
+
+@pytest.fixture
+def client(flask_app):
+    return flask_app.test_client()
+
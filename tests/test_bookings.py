@@ -0,0 +1,70 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import app as fyyur
+
+START = datetime(2030, 6, 1, 20)
+
+
+@pytest.fixture
+def booked(flask_app):
+    venue = fyyur.Venue(name='Hop', city='SF', state='CA', address='1 Folsom')
+    artist = fyyur.Artist(name='Petals', city='SF', state='CA')
+    other_artist = fyyur.Artist(name='Quevedo', city='NY', state='NY')
+    fyyur.db.session.add_all([venue, artist, other_artist])
+    fyyur.db.session.flush()
+    fyyur.db.session.add(fyyur.Show(venue_id=venue.id, artist_id=artist.id, start_time=START))
+    fyyur.db.session.commit()
+    return venue.id, artist.id, other_artist.id
+
+
+def create_show(client, venue_id, artist_id, start_time):
+    return client.post('/shows/create', data={'venue_id': venue_id, 'artist_id': artist_id,
+                                              'start_time': start_time.isoformat(sep=' ')})
+
+
+def test_slot_taken(flask_app):
+    starts = [START, START + timedelta(hours=5)]
+    assert fyyur.slot_taken(starts, START + timedelta(minutes=119))
+    assert fyyur.slot_taken(starts, START - timedelta(minutes=119))
+    assert fyyur.slot_taken(starts, START + timedelta(hours=4))
+    assert not fyyur.slot_taken(starts, START + timedelta(hours=2))
+    assert not fyyur.slot_taken(starts, START - timedelta(hours=2))
+    assert not fyyur.slot_taken([], START)
+
+
+def test_overlapping_shows_are_refused(flask_app, client, booked):
+    venue_id, artist_id, other_artist_id = booked
+    assert fyyur.booking_conflict(venue_id, other_artist_id, START + timedelta(hours=1)) == 'venue'
+
+    create_show(client, venue_id, other_artist_id, START + timedelta(hours=1))
+    assert fyyur.Show.query.count() == 1
+    create_show(client, venue_id, other_artist_id, START + timedelta(hours=2))
+    assert fyyur.Show.query.count() == 2
+    assert fyyur.booking_conflict(venue_id, artist_id, START - timedelta(hours=1)) == 'venue'
+    assert fyyur.booking_conflict(venue_id + 1, artist_id, START - timedelta(hours=1)) == 'artist'
+
+
+def test_venue_availability(flask_app, client, booked):
+    venue_id, artist_id, _ = booked
+    response = client.get('/venues/{}/availability?from=2030-06-01T18:00:00&to=2030-06-02T00:00:00'.format(venue_id))
+    data = response.get_json()
+    assert response.status_code == 200
+    assert data['show_duration_minutes'] == 120 and not data['available']
+    assert data['booked'] == [{'show_id': 1, 'artist_id': artist_id, 'start_time': '2030-06-01T20:00:00',
+                               'end_time': '2030-06-01T22:00:00'}]
+    assert data['free'] == [{'from': '2030-06-01T18:00:00', 'to': '2030-06-01T20:00:00'},
+                            {'from': '2030-06-01T22:00:00', 'to': '2030-06-02T00:00:00'}]
+
+    assert client.get('/venues/{}/availability?from=2030-06-02T00:00:00&to=2030-06-01T00:00:00'.format(
+        venue_id)).status_code == 400
+    assert client.get('/venues/999/availability').status_code == 404
+
+
+def test_availability_reports_durations_of_a_day_or_more(flask_app, client, booked):
+    flask_app.config['SHOW_DURATION_MINUTES'] = 36 * 60
+    data = client.get('/venues/{}/availability?from=2030-06-01T00:00:00&to=2030-06-04T00:00:00'.format(
+        booked[0])).get_json()
+    assert data['show_duration_minutes'] == 36 * 60
+    assert data['booked'][0]['end_time'] == '2030-06-03T08:00:00'
@@ -0,0 +1,90 @@
+import logging
+
+import app as fyyur
+import cache as cache_module
+from cache import LRUCache, ReadThroughCache
+
+
+def test_cache_stats_are_logged_at_debug_level(flask_app, client, caplog):
+    fyyur.db.session.add(fyyur.Venue(name='Hop', city='SF', state='CA', address='1 Folsom'))
+    fyyur.db.session.commit()
+    flask_app.logger.setLevel(logging.DEBUG)
+    try:
+        with caplog.at_level(logging.DEBUG):
+            client.get('/venues/1')
+            client.get('/venues/1')
+    finally:
+        flask_app.logger.setLevel(logging.NOTSET)
+    stats = [record.getMessage() for record in caplog.records if record.getMessage().startswith('cache stats')]
+    assert '"detail_pages":{"size":1,"max_size":1024,"hits":1,"misses":1,"evictions":0}' in stats[-1]
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = LRUCache(max_size=2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.get('a') == 1
+    # b was used last before a , so it goes first
+    cache.set('c', 3)
+    assert cache.get('b') is None and cache.get('a') == 1 and cache.get('c') == 3
+    cache.set('a', 4)
+    cache.set('d', 5)
+    assert cache.get('c') is None and cache.get('a') == 4
+    assert cache.stats() == {'size': 2, 'max_size': 2, 'hits': 4, 'misses': 2, 'evictions': 2}
+
+
+def test_entries_expire_after_the_ttl_or_their_own_deadline(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache_module.time, 'time', lambda: now[0])
+    cache = LRUCache(ttl=60)
+    cache.set('page', 'html')
+    cache.set('feed', 'ics', expires_at=1010.0)
+    cache.set('late', 'ics', expires_at=2000.0)
+    now[0] = 1011.0
+    assert cache.get('feed') is None and cache.get('page') == 'html'
+    now[0] = 1060.0
+    # the ttl bounds a later deadline too
+    assert cache.get('page') is None and cache.get('late') is None
+    assert cache.stats()['size'] == 0
+
+
+def test_deleted_and_cleared_entries_miss():
+    cache = LRUCache()
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.delete('a')
+    cache.delete('missing')
+    assert cache.get('a') is None and cache.get('b') == 2
+    cache.clear()
+    assert cache.get('b') is None
+
+
+def test_read_through_cache_loads_only_missing_keys():
+    loads = []
+
+    def load_many(keys):
+        loads.append(keys)
+        return {key: key.upper() for key in keys if key != 'gone'}
+
+    records = ReadThroughCache(load_many)
+    assert records.get_many(['a', 'b', 'a', 'gone']) == {'a': 'A', 'b': 'B'}
+    assert records.get_many(['b', 'c', 'gone']) == {'b': 'B', 'c': 'C'}
+    # keys the loader did not find are not cached
+    assert loads == [['a', 'b', 'gone'], ['c', 'gone']]
+
+    records.put('a', 'edited')
+    records.invalidate('b')
+    assert records.get_many(['a', 'b']) == {'a': 'edited', 'b': 'B'}
+    assert loads[-1] == ['b']
+    assert records.get('a', fresh=True) == 'A' and records.get('a') == 'edited'
+
+
+def test_edits_invalidate_the_cached_detail_page(flask_app, client):
+    fyyur.db.session.add(fyyur.Artist(name='Petals', city='SF', state='CA'))
+    fyyur.db.session.commit()
+    assert b'Petals' in client.get('/artists/1').data
+    hits = fyyur.detail_page_cache.stats()['hits']
+    client.post('/artists/1/edit', data={'name': 'Guns N Petals', 'city': 'SF', 'state': 'CA', 'genres': ['Jazz']})
+    page = client.get('/artists/1').data
+    assert b'Guns N Petals' in page
+    assert fyyur.detail_page_cache.stats()['hits'] == hits
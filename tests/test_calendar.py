@@ -0,0 +1,55 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import app as fyyur
+
+
+@pytest.fixture
+def entities(flask_app):
+    venue = fyyur.Venue(name='Hop', city='SF', state='CA', address='1 Folsom')
+    artist = fyyur.Artist(name='Petals', city='SF', state='CA')
+    fyyur.db.session.add_all([venue, artist])
+    fyyur.db.session.commit()
+    return venue.id, artist.id
+
+
+def queries(response):
+    return response.headers['Server-Timing'].split('desc="')[1].split(' ')[0]
+
+
+def test_feed_carries_validators(client, entities):
+    response = client.get('/venues/1/calendar.ics')
+    assert response.status_code == 200 and response.mimetype == 'text/calendar'
+    assert response.headers['ETag'].startswith('"venue-') and response.last_modified is not None
+    assert response.headers['Cache-Control'] == 'no-cache'
+    assert 'X-WR-CALNAME:Hop' in response.get_data(as_text=True)
+    assert client.get('/venues/7/calendar.ics').status_code == 404
+
+
+def test_polling_with_a_validator_is_answered_not_modified(client, entities):
+    response = client.get('/artists/1/calendar.ics')
+    etag, last_modified = response.headers['ETag'], response.headers['Last-Modified']
+
+    not_modified = client.get('/artists/1/calendar.ics', headers={'If-None-Match': etag})
+    assert not_modified.status_code == 304 and not_modified.data == b''
+    assert not_modified.headers['ETag'] == etag
+    # answered from the cached validator
+    assert queries(not_modified) == '0'
+    assert client.get('/artists/1/calendar.ics', headers={'If-Modified-Since': last_modified}).status_code == 304
+    # a stale ETag wins over a current date
+    assert client.get('/artists/1/calendar.ics', headers={'If-None-Match': '"artist-00000000"',
+                                                          'If-Modified-Since': last_modified}).status_code == 200
+    assert client.get('/artists/1/calendar.ics', headers={'If-Modified-Since': 'Thu, 01 Jan 1970 00:00:00 GMT'}
+                      ).status_code == 200
+
+
+def test_writes_change_the_validator(client, entities):
+    venue_id, artist_id = entities
+    etag = client.get('/venues/1/calendar.ics').headers['ETag']
+    start_time = datetime.utcnow().replace(second=0, microsecond=0) + timedelta(days=2)
+    client.post('/shows/create', data={'venue_id': venue_id, 'artist_id': artist_id,
+                                       'start_time': start_time.strftime('%Y-%m-%d %H:%M')})
+    response = client.get('/venues/1/calendar.ics', headers={'If-None-Match': etag})
+    assert response.status_code == 200 and response.headers['ETag'] != etag
+    assert 'SUMMARY:Petals at Hop' in response.get_data(as_text=True)
@@ -0,0 +1,69 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import app as fyyur
+
+
+@pytest.fixture
+def entities(flask_app):
+    venue = fyyur.Venue(name='Hop', city='SF', state='CA', address='1 Folsom')
+    artist = fyyur.Artist(name='Petals', city='SF', state='CA')
+    fyyur.db.session.add_all([venue, artist])
+    fyyur.db.session.commit()
+    return venue.id, artist.id
+
+
+def counters(model, model_id):
+    fyyur.db.session.expire_all()
+    entity = model.query.get(model_id)
+    return entity.upcoming_shows_count, entity.past_shows_count, entity.next_show_at
+
+
+def create_show(client, venue_id, artist_id, start_time):
+    return client.post('/shows/create', data={'venue_id': venue_id, 'artist_id': artist_id,
+                                              'start_time': start_time.strftime('%Y-%m-%d %H:%M')})
+
+
+def test_new_shows_are_counted(flask_app, client, entities):
+    venue_id, artist_id = entities
+    updated_at = fyyur.Venue.query.get(venue_id).updated_at
+    soon = (datetime.utcnow() + timedelta(days=2)).replace(second=0, microsecond=0)
+    create_show(client, venue_id, artist_id, soon + timedelta(days=5))
+    create_show(client, venue_id, artist_id, soon)
+    create_show(client, venue_id, artist_id, soon - timedelta(days=30))
+
+    assert counters(fyyur.Venue, venue_id) == (2, 1, soon)
+    assert counters(fyyur.Artist, artist_id) == (2, 1, soon)
+    # the counters are derived data and leave the row unchanged to incremental exports
+    assert fyyur.Venue.query.get(venue_id).updated_at == updated_at
+
+
+def test_started_shows_roll_over(flask_app, client, entities):
+    venue_id, artist_id = entities
+    soon = (datetime.utcnow() + timedelta(days=2)).replace(second=0, microsecond=0)
+    create_show(client, venue_id, artist_id, soon)
+    create_show(client, venue_id, artist_id, soon + timedelta(days=5))
+    assert fyyur.roll_over_shows() == {'Venue': 0, 'Artist': 0}
+
+    # the first show started meanwhile
+    fyyur.Show.query.filter(fyyur.Show.start_time == soon).update(
+        {fyyur.Show.start_time: soon - timedelta(days=3)}, synchronize_session=False)
+    fyyur.Venue.query.update({fyyur.Venue.next_show_at: soon - timedelta(days=3)}, synchronize_session=False)
+    fyyur.db.session.commit()
+    assert fyyur.roll_over_shows() == {'Venue': 1, 'Artist': 0}
+    fyyur.db.session.commit()
+    assert counters(fyyur.Venue, venue_id) == (1, 1, soon + timedelta(days=5))
+
+
+def test_deletes_and_reconcile_recount(flask_app, client, entities):
+    venue_id, artist_id = entities
+    create_show(client, venue_id, artist_id, datetime.utcnow().replace(second=0, microsecond=0) + timedelta(days=2))
+    fyyur.Venue.query.update({fyyur.Venue.upcoming_shows_count: 7}, synchronize_session=False)
+    fyyur.db.session.commit()
+    result = flask_app.test_cli_runner().invoke(args=['reconcile-show-counts'])
+    assert result.exit_code == 0
+    assert counters(fyyur.Venue, venue_id)[:2] == (1, 0)
+
+    client.post('/artists/{}/delete'.format(artist_id))
+    assert counters(fyyur.Venue, venue_id) == (0, 0, None)
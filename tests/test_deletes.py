@@ -0,0 +1,26 @@
+import app as fyyur
+
+
+def test_deleting_a_venue_another_process_deleted_is_not_found(flask_app, client):
+    venue = fyyur.Venue(name='Hop', city='SF', state='CA', address='1 Folsom')
+    fyyur.db.session.add(venue)
+    fyyur.db.session.commit()
+    venue_id = venue.id
+    # cached by this process , then deleted by another one
+    assert fyyur.venue_records.get(venue_id).name == 'Hop'
+    fyyur.db.engine.execute(fyyur.Venue.__table__.delete())
+
+    response = client.post('/venues/{}/delete'.format(venue_id))
+    assert response.status_code == 404
+    assert b'Venue Hop was not found' in response.data
+    assert fyyur.venue_records.get(venue_id) is None
+
+
+def test_deleting_an_artist_redirects_home(flask_app, client):
+    artist = fyyur.Artist(name='Petals', city='SF', state='CA')
+    fyyur.db.session.add(artist)
+    fyyur.db.session.commit()
+
+    response = client.post('/artists/{}/delete'.format(artist.id))
+    assert response.status_code == 302
+    assert fyyur.Artist.query.count() == 0
@@ -0,0 +1,55 @@
+import gzip
+import json
+from datetime import datetime
+
+import pytest
+
+import app as fyyur
+
+AUTHORIZATION = {'Authorization': 'Bearer s3cret'}
+
+
+@pytest.fixture
+def venues(flask_app):
+    flask_app.config['EXPORT_TOKEN'] = 's3cret'
+    jazz = fyyur.Genre(name='Jazz')
+    fyyur.db.session.add_all([
+        fyyur.Venue(name='Hop', city='SF', state='CA', address='1 Folsom', updated_at=datetime(2021, 1, 1)),
+        fyyur.Venue(name='Square', city='NY', state='NY', address='34 Whiskey', updated_at=datetime(2021, 6, 1),
+                    genres=[jazz])])
+    fyyur.db.session.commit()
+
+
+def ndjson(response):
+    return [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+
+def test_export_needs_the_bearer_token(flask_app, client, venues):
+    assert client.get('/export/venues.csv').status_code == 401
+    assert client.get('/export/venues.csv', headers={'Authorization': 'Bearer wrong'}).status_code == 401
+    assert client.get('/export/venues.csv', headers={'Authorization': 's3cret'}).status_code == 401
+    # unset , the endpoint is disabled whatever is sent
+    flask_app.config['EXPORT_TOKEN'] = None
+    assert client.get('/export/venues.csv', headers={'Authorization': 'Bearer '}).status_code == 401
+
+
+def test_only_the_exported_tables_and_formats_are_served(client, venues):
+    assert client.get('/export/Genre.csv', headers=AUTHORIZATION).status_code == 404
+    assert client.get('/export/alembic_version.csv', headers=AUTHORIZATION).status_code == 404
+    assert client.get('/export/venues.xml', headers=AUTHORIZATION).status_code == 404
+    response = client.get('/export/venues.csv', headers=AUTHORIZATION)
+    assert response.status_code == 200 and response.mimetype == 'text/csv'
+    assert response.headers['Content-Disposition'] == 'attachment; filename=venues.csv'
+    lines = response.get_data(as_text=True).splitlines()
+    assert lines[0].startswith('id,name,city,state') and len(lines) == 3
+
+
+def test_since_only_exports_rows_changed_from_then(client, venues):
+    response = client.get('/export/venues.ndjson?since=2021-03-01', headers=AUTHORIZATION)
+    assert [venue['name'] for venue in ndjson(response)] == ['Square']
+    # link tables follow the updated_at of their parent
+    response = client.get('/export/venue_genres.ndjson?since=2021-03-01T00:00:00', headers=AUTHORIZATION)
+    assert ndjson(response) == [{'venue_id': 2, 'genre_id': 1}]
+    response = client.get('/export/venues.ndjson?since=2022-01-01&gzip=1', headers=AUTHORIZATION)
+    assert response.mimetype == 'application/gzip' and gzip.decompress(response.data) == b''
+    assert client.get('/export/venues.ndjson?since=yesterday', headers=AUTHORIZATION).status_code == 400
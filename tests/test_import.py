@@ -0,0 +1,36 @@
+import json
+from datetime import datetime
+
+import app as fyyur
+
+
+def test_converted_rows_carry_every_column():
+    table = fyyur.Venue.__table__
+    sparse = fyyur.convert_record(table, {'name': 'Hop', 'city': 'SF', 'state': 'CA', 'address': '1 Folsom'})
+    full = fyyur.convert_record(table, {'name': 'Square', 'city': 'NY', 'state': 'NY', 'address': '34 Whiskey',
+                                        'seeking_talent': 'yes', 'updated_at': '2021-01-01T00:00:00'})
+    assert set(sparse) == set(full) == {column.name for column in table.columns if not column.primary_key}
+    assert sparse['seeking_talent'] is False and full['seeking_talent'] is True
+    assert isinstance(sparse['updated_at'], datetime)
+    assert full['updated_at'] == datetime(2021, 1, 1)
+
+
+def test_import_rejects_invalid_records(flask_app, tmp_path):
+    records = [{'name': 'Hop', 'city': 'SF', 'state': 'CA', 'address': '1 Folsom', 'genres': ['Jazz']},
+               {'name': 'Square', 'city': 'NY', 'state': 'NY', 'address': '34 Whiskey', 'seeking_talent': True,
+                'updated_at': '2021-01-01T00:00:00', 'genres': 'Blues;Jazz'},
+               {'name': 'No City', 'state': 'NY', 'address': 'x'},
+               {'name': 'Odd Genre', 'city': 'NY', 'state': 'NY', 'address': 'x', 'genres': ['Polka']}]
+    path = tmp_path / 'venues.ndjson'
+    path.write_text('\n'.join(json.dumps(record) for record in records) + '\nnot json\n')
+    rejects = tmp_path / 'rejects.ndjson'
+
+    result = flask_app.test_cli_runner().invoke(args=['import', 'venues', str(path), '--rejects', str(rejects)])
+
+    assert result.exit_code == 0, result.output
+    venues = fyyur.Venue.query.order_by(fyyur.Venue.id).all()
+    assert [venue.name for venue in venues] == ['Hop', 'Square']
+    assert [genre.name for genre in venues[1].genres] == ['Blues', 'Jazz']
+    reasons = [json.loads(line) for line in rejects.read_text().splitlines()]
+    assert [(reject['line'], reject['reason']) for reject in reasons] == [
+        (3, 'city is required'), (4, 'unknown genre Polka'), (5, 'not a record')]
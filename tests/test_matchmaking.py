@@ -0,0 +1,79 @@
+import pytest
+
+from matchmaking import MatchIndex
+
+# (id, city, state, genre ids) of the seeking artists , ids 3 , 5 and 8 share profiles with others
+ARTISTS = [(8, 'Austin', 'TX', [1, 2]),
+           (2, 'Austin', 'TX', [1, 2]),
+           (5, 'Dallas', 'TX', [1]),
+           (3, 'Boston', 'MA', [1, 2]),
+           (9, 'Boston', 'MA', [1, 2]),
+           (4, 'Austin', 'TX', [3]),
+           (7, 'Boston', 'MA', [1])]
+VENUES = [(1, 'Austin', 'TX', [1, 2]),
+          (6, 'Boston', 'MA', [2, 4])]
+
+
+@pytest.fixture
+def reloads():
+    return []
+
+
+@pytest.fixture
+def index(reloads):
+    # background reloads run when the test says so
+    return MatchIndex(lambda: ARTISTS, lambda: VENUES, spawn=reloads.append)
+
+
+def test_matches_rank_by_score_then_locality(index):
+    matches = index.matches('artist', 'austin', 'tx', [1, 2])
+    assert [(artist_id, score) for artist_id, score, _ in matches] == [
+        (2, 1.5), (8, 1.5), (3, 1.0), (9, 1.0), (5, 0.75), (7, 0.5)]
+    assert matches[0][2] == [1, 2] and matches[-1][2] == [1]
+
+
+def test_equal_scores_rank_the_lowest_id_first_across_groups(index):
+    # 3 and 9 in Boston score like 2 and 8 in Austin when looking from elsewhere , so the ids interleave
+    matches = index.matches('artist', 'Denver', 'CO', [1, 2], limit=3)
+    assert [(artist_id, score) for artist_id, score, _ in matches] == [(2, 1.0), (3, 1.0), (8, 1.0)]
+
+
+def test_limit_and_unmatched_profiles(index):
+    assert [artist_id for artist_id, _, _ in index.matches('artist', 'Austin', 'TX', [1, 2], limit=1)] == [2]
+    assert index.matches('artist', 'Austin', 'TX', [5]) == []
+    assert index.matches('artist', 'Austin', 'TX', []) == []
+
+
+def test_batch_matches_every_seeking_entity(index):
+    results = dict(index.batch('artist', limit=3))
+    assert results == {1: [(2, 1.5), (8, 1.5), (3, 1.0)],
+                       6: [(3, 0.8333), (9, 0.8333), (2, 0.3333)]}
+    assert results[1] == [(artist_id, score) for artist_id, score, _ in index.matches('artist', 'Austin', 'TX', [1, 2], 3)]
+
+
+def test_reload_after_invalidate_serves_the_previous_load(index, reloads):
+    assert index.matches('venue', 'Austin', 'TX', [5]) == []
+    VENUES.append((10, 'Austin', 'TX', [5]))
+    try:
+        assert index.matches('venue', 'Austin', 'TX', [5]) == []
+        index.invalidate()
+        assert index.matches('venue', 'Austin', 'TX', [5]) == []
+        assert len(reloads) == 1
+        # one reload at a time
+        index.matches('venue', 'Austin', 'TX', [5])
+        assert len(reloads) == 1
+        reloads.pop()()
+        assert index.matches('venue', 'Austin', 'TX', [5]) == [(10, 1.5, [5])]
+    finally:
+        VENUES.pop()
+
+
+def test_clear_loads_again_before_answering(index, reloads):
+    index.matches('venue', 'Austin', 'TX', [5])
+    VENUES.append((10, 'Austin', 'TX', [5]))
+    try:
+        index.clear()
+        assert index.matches('venue', 'Austin', 'TX', [5]) == [(10, 1.5, [5])]
+        assert reloads == []
+    finally:
+        VENUES.pop()
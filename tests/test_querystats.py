@@ -0,0 +1,21 @@
+import logging
+
+import app as fyyur
+
+
+def test_plain_responses_carry_their_query_count(flask_app, client):
+    fyyur.db.session.add(fyyur.Venue(name='Hop', city='SF', state='CA', address='1 Folsom'))
+    fyyur.db.session.commit()
+    assert 'queries' in client.get('/api/venues/1').headers['Server-Timing']
+
+
+def test_streamed_responses_are_logged_once_sent(flask_app, client, caplog):
+    fyyur.db.session.add(fyyur.Venue(name='Hop', city='SF', state='CA', address='1 Folsom'))
+    fyyur.db.session.commit()
+    flask_app.config['SLOW_REQUEST_MS'] = 0
+    response = client.get('/api/venues?format=ndjson', buffered=False)
+    assert 'Server-Timing' not in response.headers
+    with caplog.at_level(logging.WARNING):
+        assert b'"Hop"' in response.get_data()
+        response.close()
+    assert '"endpoint":"main.api_venues"' in caplog.text and '"queries":1' in caplog.text
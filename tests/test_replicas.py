@@ -0,0 +1,87 @@
+import time
+
+import pytest
+from flask import g
+
+import app as fyyur
+
+
+@pytest.fixture
+def replica_app(tmp_path):
+    flask_app = fyyur.create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + str(tmp_path / 'primary.db'),
+                                  'SQLALCHEMY_REPLICA_URIS': ['sqlite:///' + str(tmp_path / 'replica.db')],
+                                  'TESTING': True, 'WTF_CSRF_ENABLED': False})
+    with flask_app.app_context():
+        fyyur.db.create_all()
+        replica = fyyur.db.get_engine(flask_app, bind='replica_0')
+        fyyur.db.Model.metadata.create_all(replica)
+        # the replica still holds the venue as it was before it was renamed on the primary
+        for engine, name in ((fyyur.db.engine, 'Primary Hall'), (replica, 'Lagging Hall')):
+            engine.execute(fyyur.Venue.__table__.insert(), {'id': 1, 'name': name, 'city': 'SF', 'state': 'CA',
+                                                            'address': '1 Folsom'})
+        yield flask_app
+        fyyur.db.session.remove()
+
+
+def pin(client):
+    with client.session_transaction() as session:
+        session['_primary_until'] = time.time() + 60
+
+
+def test_reads_go_to_a_replica_until_the_client_writes(replica_app):
+    with replica_app.test_request_context('/venues/1'):
+        fyyur.route_reads()
+        assert g.replica_bind == 'replica_0' and not fyyur.shared_caches_bypassed()
+
+    client = replica_app.test_client()
+    client.post('/venues/1/edit', data={'name': 'Renamed Hall', 'city': 'SF', 'state': 'CA', 'address': '1 Folsom',
+                                        'genres': ['1']})
+    with client.session_transaction() as session:
+        assert session['_primary_until'] > time.time()
+    with client:
+        client.get('/venues/1')
+        assert g.replica_bind is None and fyyur.shared_caches_bypassed()
+
+
+def test_detail_pages_are_cached_from_the_primary(replica_app):
+    client = replica_app.test_client()
+    assert b'Primary Hall' in client.get('/venues/1').data
+    assert b'Primary Hall' in fyyur.detail_page_cache.get(('venue', 1)).encode()
+
+
+def test_pinned_client_skips_the_detail_page_cache(replica_app):
+    fyyur.detail_page_cache.set(('venue', 1), 'cached before the write')
+    client = replica_app.test_client()
+    assert client.get('/venues/1').data == b'cached before the write'
+
+    pin(client)
+    assert b'Primary Hall' in client.get('/venues/1').data
+    assert fyyur.detail_page_cache.get(('venue', 1)) == 'cached before the write'
+
+
+def test_home_feed_is_built_from_the_primary(replica_app):
+    client = replica_app.test_client()
+    assert b'Primary Hall' in client.get('/').data
+    assert [venue.name for venue in fyyur.home_feed.snapshot['venues']] == ['Primary Hall']
+
+    with replica_app.app_context():
+        fyyur.db.engine.execute(fyyur.Venue.__table__.update().values(name='Renamed Hall'))
+    pin(client)
+    assert b'Renamed Hall' in client.get('/').data
+    assert [venue.name for venue in fyyur.home_feed.snapshot['venues']] == ['Primary Hall']
+
+
+def test_search_posts_do_not_pin_the_client(replica_app):
+    client = replica_app.test_client()
+    client.post('/venues/search', data={'search_term': 'hall'})
+    with client.session_transaction() as session:
+        assert '_primary_until' not in session
+
+
+def test_genre_catalog_is_read_from_the_primary(replica_app):
+    fyyur.db.engine.execute(fyyur.Genre.__table__.insert(), {'id': 1, 'name': 'Primary Only'})
+    fyyur.genre_catalog.invalidate()
+    with replica_app.test_request_context('/venues/create'):
+        fyyur.route_reads()
+        assert g.replica_bind == 'replica_0'
+        assert fyyur.genre_catalog.get_choices() == [(1, 'Primary Only')]
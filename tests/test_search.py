@@ -0,0 +1,108 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import search
+from search import SearchIndex
+
+# (id, name, fields) of the indexed documents
+DOCUMENTS = [(1, 'Jazz Club', ['New York', 'NY', 'Jazz']),
+             (2, 'The Jazz Hall', ['Boston', 'MA', 'Jazz']),
+             (3, 'Blue Note', ['New York', 'NY', 'Jazz']),
+             (4, 'Club Rock', ['Austin', 'TX', 'Rock n Roll']),
+             (5, 'Jazzy Bar', ['Austin', 'TX', 'Blues'])]
+
+
+@pytest.fixture
+def jobs():
+    return []
+
+
+@pytest.fixture
+def index(jobs):
+    # background loads run when the test says so
+    index = SearchIndex(lambda: list(DOCUMENTS), spawn=jobs.append)
+    assert index.search('jazz') is None
+    jobs.pop()()
+    return index
+
+
+def ids(found):
+    return [document['id'] for document in found[1]]
+
+
+def test_names_starting_with_the_term_rank_first_then_names_then_fields(index):
+    # 1 and 5 start with it , 2 contains it , 3 only plays jazz
+    assert index.search('jazz') == (4, [{'id': 1, 'name': 'Jazz Club'}, {'id': 5, 'name': 'Jazzy Bar'},
+                                        {'id': 2, 'name': 'The Jazz Hall'}, {'id': 3, 'name': 'Blue Note'}])
+    assert ids(index.search('club')) == [4, 1]
+    assert ids(index.search('  NEW   york ')) == [3, 1]
+
+
+def test_totals_count_every_match_past_the_limit(index):
+    assert index.search('jazz', limit=2) == (4, [{'id': 1, 'name': 'Jazz Club'}, {'id': 5, 'name': 'Jazzy Bar'}])
+    assert index.search('', limit=1)[0] == 5
+    assert index.search('qzx') == (0, [])
+
+
+def test_totals_are_extrapolated_past_max_candidates(jobs):
+    rows = [(doc_id, 'band {:04d}'.format(doc_id), []) for doc_id in range(1000)]
+    index = SearchIndex(lambda: rows, max_candidates=100, spawn=jobs.append)
+    index.search('x')
+    jobs.pop()()
+    # every name contains "nd 0" , only 100 of the candidates are verified
+    total, found = index.search('nd 0', limit=3)
+    assert total == 1000 and [document['name'] for document in found] == ['band 0000', 'band 0001', 'band 0002']
+
+
+def test_searches_use_the_previous_load_while_a_reload_runs(index, jobs):
+    index.invalidate()
+    assert ids(index.search('blue')) == [3, 5]
+    reload = jobs.pop()
+    # written by this process while the reload reads the table , the reload misses them
+    index.add(6, 'Blues Alley', ['Blues'])
+    index.remove(3)
+    assert ids(index.search('blue')) == [6, 5]
+    reload()
+    assert ids(index.search('blue')) == [6, 5]
+    assert index.changes is None and jobs == []
+
+
+def test_a_sync_applies_the_rows_changed_since_the_last_one(jobs):
+    rows = {doc_id: (name, fields) for doc_id, name, fields in DOCUMENTS}
+    asked = []
+
+    def load_changes(since):
+        asked.append(since)
+        return [(3, 'Blue Jazz Note', ['NY'])], [doc_id for doc_id in rows if doc_id != 4]
+
+    index = SearchIndex(lambda: [(doc_id, name, fields) for doc_id, (name, fields) in rows.items()], load_changes,
+                        spawn=jobs.append)
+    index.search('x')
+    loaded_at = datetime.utcnow()
+    jobs.pop()()
+    index.invalidate()
+    index.search('x')
+    jobs.pop()()
+    assert asked[0] <= loaded_at - search.SYNC_OVERLAP + timedelta(seconds=1)
+    # 3 was renamed and 4 deleted by another process
+    assert ids(index.search('jazz')) == [1, 5, 3, 2]
+    assert ids(index.search('rock')) == []
+
+
+def test_clear_drops_a_reload_started_before_it(index, jobs):
+    index.invalidate()
+    index.search('x')
+    stale = jobs.pop()
+    index.clear()
+    assert index.search('jazz') is None
+    fresh = jobs.pop()
+    DOCUMENTS.append((6, 'Jazz Loft', []))
+    try:
+        fresh()
+    finally:
+        DOCUMENTS.pop()
+    assert ids(index.search('loft')) == [6]
+    # the reload started before the clear belongs to an older generation , it must not replace the new load
+    stale()
+    assert ids(index.search('loft')) == [6]
@@ -0,0 +1,87 @@
+from datetime import datetime
+
+import app as fyyur
+
+
+def genres(*names):
+    return fyyur.genre_catalog.resolve([genre_id for genre_id, name in fyyur.genre_catalog.get_choices() if name in names])
+
+
+def add_venue(name, genre_names):
+    venue = fyyur.Venue(name=name, city='SF', state='CA', address='1 Folsom', genres=genres(*genre_names))
+    fyyur.db.session.add(venue)
+    fyyur.db.session.commit()
+    return venue.id
+
+
+def stored_lists():
+    lists = {}
+    for venue_id, similar_id, score in fyyur.db.session.query(
+            fyyur.similar_venues.c.venue_id, fyyur.similar_venues.c.similar_id, fyyur.similar_venues.c.score
+    ).order_by(fyyur.similar_venues.c.venue_id, fyyur.similar_venues.c.rank):
+        lists.setdefault(venue_id, []).append((similar_id, score))
+    return lists
+
+
+def computed_lists(flask_app):
+    model = fyyur.similarity_model('venue')
+    lists = {venue_id: model.neighbours(venue_id, flask_app.config['SIMILAR_LIMIT']) for venue_id in model.ids.tolist()}
+    return {venue_id: neighbours for venue_id, neighbours in lists.items() if neighbours}
+
+
+def refresh():
+    count = fyyur.refresh_similar('venue')
+    fyyur.db.session.commit()
+    return count
+
+
+def test_incremental_refresh_matches_a_full_one(flask_app):
+    flask_app.config['SIMILAR_LIMIT'] = 2
+    rock = add_venue('Rock', ['Rock n Roll'])
+    add_venue('Rock Blues', ['Rock n Roll', 'Blues'])
+    add_venue('Blues', ['Blues'])
+    add_venue('Rock Folk', ['Rock n Roll', 'Folk', 'Punk'])
+    add_venue('Jazz', ['Jazz'])
+    assert refresh() == 5
+    assert stored_lists() == computed_lists(flask_app)
+    assert refresh() == 0
+
+    # a new venue outranks the last neighbour of the others , and an edited one moves to other lists
+    add_venue('Rock Again', ['Rock n Roll'])
+    assert refresh() > 1
+    assert stored_lists() == computed_lists(flask_app)
+    jazz = fyyur.Venue.query.filter_by(name='Jazz').one()
+    # genre links do not touch the venue row , the edit form stamps it like this
+    jazz.genres = genres('Blues')
+    jazz.updated_at = datetime.utcnow()
+    fyyur.db.session.commit()
+    refresh()
+    assert stored_lists() == computed_lists(flask_app)
+
+    # the lists a deleted venue was removed from are refilled
+    fyyur.model_delete(model='Venue', model_ids=[rock])
+    fyyur.db.session.commit()
+    refresh()
+    assert stored_lists() == computed_lists(flask_app)
+
+
+def test_deletes_mark_the_lists_they_change(flask_app):
+    flask_app.config['SIMILAR_LIMIT'] = 2
+    venue_ids = [add_venue('Venue {}'.format(number), []) for number in range(4)]
+    artists = [fyyur.Artist(name='Artist {}'.format(number), city='SF', state='CA') for number in range(2)]
+    fyyur.db.session.add_all(artists)
+    fyyur.db.session.flush()
+    for hour, (venue_id, artist) in enumerate([(0, 0), (1, 0), (1, 1), (2, 1)]):
+        fyyur.db.session.add(fyyur.Show(venue_id=venue_ids[venue_id], artist_id=artists[artist].id,
+                                        start_time=datetime(2030, 6, 1, hour * 3)))
+    fyyur.db.session.commit()
+    refresh()
+    assert stored_lists()[venue_ids[1]] == [(venue_ids[0], 0.3536), (venue_ids[2], 0.3536)]
+
+    # the shows of the deleted artist went with it , the venues that booked it and the one listing them are recomputed
+    fyyur.model_delete(model='Artist', model_ids=[artists[1].id])
+    assert refresh() == 3
+    assert stored_lists() == computed_lists(flask_app) == {venue_ids[0]: [(venue_ids[1], 0.5)],
+                                                     venue_ids[1]: [(venue_ids[0], 0.5)]}
+    # lists that cannot fill up are left alone
+    assert refresh() == 0